@@ -0,0 +1,199 @@
+"""
+asyncio websocket server for the s6 / s7 nodes, for serving many clients at once.
+
+websocket_server runs one thread per client and calls the message handler on that
+thread, so a handler that streams (s7's `start`) holds up that client, and every
+send to a slow client blocks the sender. Here all clients share one event loop:
+
+    - every client gets a ClientChannel, a bounded send queue drained by its own
+      sender task, so one slow client never holds up the others
+    - `droppable` messages (frames) evict the oldest waiting droppable message
+      when the queue is full; other messages (text, control) are always queued
+    - the sender awaits the socket's drain, so TCP backpressure from a slow client
+      ends up as drops in that client's queue instead of memory growth
+
+The callback API mirrors websocket_server (set_fn_new_client, set_fn_client_left,
+set_fn_message_received, plus set_fn_binary_received like
+input_protocol.BinaryWebsocketServer) so the node classes can use either server.
+Callbacks run on the event loop and must not block; `send_message` and `send` can
+be called from any thread.
+
+Needs the websockets package, `pip install websockets`.
+"""
+
+import asyncio
+import threading
+from collections import deque
+
+try:
+    from websockets.asyncio.server import serve
+    from websockets.exceptions import ConnectionClosed
+except ImportError:
+    serve = None
+
+
+class ClientChannel:
+    """Bounded per-client send queue, see the module docstring for the drop rules."""
+
+    def __init__(self, max_queue=8):
+        self.max_queue = max_queue
+        self._queue = deque()
+        self._ready = asyncio.Event()
+        self.sent = 0
+        self.sent_bytes = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def put(self, message, droppable=False):
+        """Queue a message, returns False if a droppable message had to be dropped."""
+        kept = True
+        if len(self._queue) >= self.max_queue:
+            for i, (_, waiting_droppable) in enumerate(self._queue):
+                if waiting_droppable:
+                    del self._queue[i]
+                    self.dropped += 1
+                    kept = False
+                    break
+            else:
+                if droppable:
+                    self.dropped += 1
+                    return False
+        self._queue.append((message, droppable))
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._ready.set()
+        return kept
+
+    def discard_droppable(self):
+        """Drop every waiting droppable message."""
+        kept = [item for item in self._queue if not item[1]]
+        self.dropped += len(self._queue) - len(kept)
+        self._queue = deque(kept)
+
+    async def get(self):
+        while not self._queue:
+            self._ready.clear()
+            await self._ready.wait()
+        message, _ = self._queue.popleft()
+        return message
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "sent_mb": self.sent_bytes / 1024 / 1024,
+            "dropped": self.dropped,
+            "queued": self.depth,
+            "max_queued": self.max_depth,
+        }
+
+
+class AsyncWebsocketServer:
+    def __init__(self, host="0.0.0.0", port=8765, max_queue=8, max_size=2**24):
+        if serve is None:
+            raise ImportError(
+                "The async server needs websockets, run `pip install websockets`"
+            )
+        self.host = host
+        self.port = port
+        self.max_queue = max_queue
+        self.max_size = max_size
+        self.clients = []
+        self.loop = None
+        self._id_counter = 0
+        self._stop = None
+        self.new_client = lambda client, server: None
+        self.client_left = lambda client, server: None
+        self.message_received = lambda client, server, message: None
+        self.binary_received = lambda client, server, data: None
+
+    def set_fn_new_client(self, fn):
+        self.new_client = fn
+
+    def set_fn_client_left(self, fn):
+        self.client_left = fn
+
+    def set_fn_message_received(self, fn):
+        self.message_received = fn
+
+    def set_fn_binary_received(self, fn):
+        self.binary_received = fn
+
+    def send(self, client, message, droppable=False):
+        """Queue a text (str) or binary (bytes) message for one client."""
+        if self._in_loop():
+            return client["channel"].put(message, droppable)
+        self.loop.call_soon_threadsafe(client["channel"].put, message, droppable)
+        return True
+
+    def send_message(self, client, message):
+        self.send(client, message)
+
+    def broadcast(self, message, clients=None, droppable=False):
+        """Queue the same message object for every client, it is encoded only once."""
+        for client in list(self.clients if clients is None else clients):
+            self.send(client, message, droppable)
+
+    def _in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    async def _sender(self, client):
+        channel = client["channel"]
+        websocket = client["websocket"]
+        while True:
+            message = await channel.get()
+            try:
+                # Returns once the socket's write buffer has drained below its limit
+                await websocket.send(message)
+            except ConnectionClosed:
+                return
+            channel.sent += 1
+            channel.sent_bytes += len(message)
+
+    async def _handler(self, websocket):
+        self._id_counter += 1
+        client = {
+            "id": self._id_counter,
+            "address": websocket.remote_address,
+            "websocket": websocket,
+            "channel": ClientChannel(self.max_queue),
+        }
+        self.clients.append(client)
+        sender = asyncio.create_task(self._sender(client))
+        try:
+            self.new_client(client, self)
+            async for message in websocket:
+                if isinstance(message, bytes):
+                    self.binary_received(client, self, message)
+                else:
+                    self.message_received(client, self, message)
+        except ConnectionClosed:
+            pass
+        finally:
+            sender.cancel()
+            self.clients.remove(client)
+            self.client_left(client, self)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        async with serve(self._handler, self.host, self.port, max_size=self.max_size):
+            await self._stop.wait()
+
+    def run_forever(self, threaded=False):
+        if threaded:
+            thread = threading.Thread(
+                target=asyncio.run, args=(self.serve(),), daemon=True
+            )
+            thread.start()
+            return thread
+        asyncio.run(self.serve())
+
+    def shutdown(self):
+        if self.loop and self._stop:
+            self.loop.call_soon_threadsafe(self._stop.set)
@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from bench_decoders import synthetic_corpus
+from compressed_log import (
+    CompressedEventLogWriter,
+    available_codecs,
+    read_compressed_log,
+)
+from event_decoders import make_decoder
+from event_log import COLUMNS, RECORD_SIZE, read_event_log, read_events, write_events
+
+
+def synthetic_events(n_events: int) -> pd.DataFrame:
+    decoder = make_decoder("json")
+    records = [decoder.decode(message) for message in synthetic_corpus(n_events)]
+    return pd.DataFrame(records, columns=COLUMNS)
+
+
+def bench_codec(df, reference, path, codec, delta, repeat):
+    """Best of `repeat` encodes and decodes, returns (bytes, encode s, decode s)."""
+    encode = decode = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        writer = CompressedEventLogWriter(path, codec=codec, delta=delta)
+        writer.write_frame(df)
+        writer.close()
+        encode = min(encode, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        records, _, _ = read_compressed_log(path)
+        decode = min(decode, time.perf_counter() - start)
+    if not np.array_equal(records, reference):
+        raise AssertionError(f"{codec} did not round trip the records")
+    return os.path.getsize(path), encode, decode
+
+
+def bench_writer(messages, path, repeat):
+    """Events per second through write() as OBS records them, standard library path."""
+    decoder = make_decoder("json")
+    best = float("inf")
+    for _ in range(repeat):
+        writer = CompressedEventLogWriter(path, auto_flush=False, decoder=decoder)
+        start = time.perf_counter()
+        for message in messages:
+            writer.write(message)
+        writer.close()
+        best = min(best, time.perf_counter() - start)
+    return len(messages) / best
+
+
+def main():
+    """
+    Compare event log compression codecs on a recording:
+        python bench_compression.py --corpus <recorded_actions.csv>
+
+    Prints each codec's size relative to the csv and to the plain event log, and
+    encode / decode speed in MB/s of event log records (RECORD_SIZE bytes per event).
+    """
+    parser = argparse.ArgumentParser(
+        description="Compression ratio and speed of the compressed event log"
+    )
+    parser.add_argument(
+        "--corpus",
+        help="Recording (csv / .evlog / .evlogz). Defaults to a synthetic corpus",
+    )
+    parser.add_argument(
+        "--events",
+        type=int,
+        default=200_000,
+        help="Size of the synthetic corpus (default: 200000)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Passes per codec (default: 3)"
+    )
+    args = parser.parse_args()
+
+    if args.corpus:
+        print(f"Loading corpus: {args.corpus}")
+        df = read_events(args.corpus)
+    else:
+        df = synthetic_events(args.events)
+    if len(df) == 0:
+        print("Corpus is empty")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "events.csv")
+        log_path = os.path.join(tmp, "events.evlog")
+        df.to_csv(csv_path, index=False)
+        write_events(df, log_path)
+        csv_size = os.path.getsize(csv_path)
+        log_size = os.path.getsize(log_path)
+        reference = np.array(read_event_log(log_path)[0])
+        raw_mb = len(df) * RECORD_SIZE / 1e6
+        print(
+            f"{len(df)} events, csv {csv_size / 1e6:.1f} MB, "
+            f"event log {log_size / 1e6:.1f} MB"
+        )
+
+        path = os.path.join(tmp, "events.evlogz")
+        for codec in available_codecs():
+            for delta in (False, True):
+                size, encode, decode = bench_codec(
+                    df, reference, path, codec, delta, args.repeat
+                )
+                name = f"{codec}{'+delta' if delta else ''}"
+                print(
+                    f"{name:>11}: {size / 1e6:6.2f} MB, "
+                    f"{csv_size / size:5.1f}x csv, {log_size / size:5.1f}x evlog, "
+                    f"encode {raw_mb / encode:7.1f} MB/s, "
+                    f"decode {raw_mb / decode:7.1f} MB/s"
+                )
+
+        messages = df.head(50_000)
+        messages = [
+            messages.iloc[i : i + 1].to_json(orient="records")[1:-1]
+            for i in range(len(messages))
+        ]
+        rate = bench_writer(messages, path, args.repeat)
+        print(f"Recording path (json decode, zlib+delta): {rate / 1e3:.0f} k events/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import sys
+import json
+import time
+import random
+import argparse
+
+from event_log import COLUMNS, read_events
+from event_decoders import available_decoders, make_decoder
+
+
+def synthetic_corpus(n_events: int, seed: int = 0):
+    """Messages shaped like the input-overlay stream, mostly mouse moves."""
+    rng = random.Random(seed)
+    messages = []
+    t = 0
+    for _ in range(n_events):
+        t += rng.randint(0, 3)
+        r = rng.random()
+        if r < 0.8:
+            event = {
+                "event_source": "local",
+                "event_type": "mouse_moved",
+                "time": t,
+                "x": rng.randint(0, 2559),
+                "y": rng.randint(0, 1439),
+                "button": 0,
+                "clicks": 0,
+                "mask": 0,
+            }
+        elif r < 0.95:
+            event = {
+                "event_source": "local",
+                "event_type": rng.choice(["key_pressed", "key_released"]),
+                "time": t,
+                "keycode": rng.randint(1, 100),
+                "rawcode": rng.randint(1, 100),
+                "char": rng.choice("abcdefgh,\"\\"),
+                "mask": 0,
+            }
+        else:
+            event = {
+                "event_source": "local",
+                "event_type": "mouse_wheel",
+                "time": t,
+                "x": rng.randint(0, 2559),
+                "y": rng.randint(0, 1439),
+                "wheel_amount": 3,
+                "wheel_direction": 3,
+                "wheel_rotation": rng.choice([-1, 1]),
+                "mask": 0,
+            }
+        messages.append(json.dumps(event))
+    return messages
+
+
+def load_corpus(path: str):
+    """
+    Load messages from a file with one raw json message per line, or rebuild them
+    from a recording (csv or event log).
+    """
+    if path.endswith(".jsonl") or path.endswith(".txt"):
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip()]
+
+    df = read_events(path)
+    messages = []
+    for row in df[COLUMNS].itertuples(index=False):
+        event = {}
+        for column, value in zip(COLUMNS, row):
+            if value != value or value is None:  # NaN
+                continue
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            event[column] = value
+        messages.append(json.dumps(event))
+    return messages
+
+
+def bench(decoder, messages, repeat: int):
+    """Best of `repeat` passes, in events per second of CPU time on one core."""
+    decode = decoder.decode
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        for message in messages:
+            decode(message)
+        best = min(best, time.process_time() - start)
+    return len(messages) / best if best > 0 else float("inf")
+
+
+def check_agreement(decoders, messages):
+    """Make sure every decoder extracts the same records as the json decoder."""
+    reference = make_decoder("json")
+    for message in messages:
+        expected = reference.decode(message)
+        for decoder in decoders:
+            if list(decoder.decode(message)) != expected:
+                raise AssertionError(
+                    f"{decoder.name} disagrees with json on message: {message}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare websocket message decoders in events per second per core"
+    )
+    parser.add_argument(
+        "--corpus",
+        help="Raw messages (.jsonl, one per line) or a recording (csv / .evlog). "
+        "Defaults to a synthetic corpus",
+    )
+    parser.add_argument(
+        "--events",
+        type=int,
+        default=200_000,
+        help="Size of the synthetic corpus (default: 200000)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Passes per decoder (default: 5)"
+    )
+    args = parser.parse_args()
+
+    if args.corpus:
+        print(f"Loading corpus: {args.corpus}")
+        messages = load_corpus(args.corpus)
+    else:
+        messages = synthetic_corpus(args.events)
+    if not messages:
+        print("Corpus is empty")
+        sys.exit(1)
+    print(f"{len(messages)} messages, {sum(map(len, messages)) / len(messages):.1f} bytes avg")
+
+    decoders = [make_decoder(name) for name in available_decoders()]
+    check_agreement(decoders, messages[:10_000])
+
+    baseline = None
+    for decoder in decoders:
+        rate = bench(decoder, messages, args.repeat)
+        baseline = baseline or rate
+        print(
+            f"{decoder.name:>8}: {rate / 1e6:6.2f} M events/s/core "
+            f"({rate / baseline:.2f}x json)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Compressed event log, the event log (see event_log.py) stored in compressed blocks.
+
+Same header as the event log (with magic COMPRESSED_MAGIC), so event_type and
+event_source are still dictionary encoded into the header tables. The records
+follow as blocks of up to `block_rows` events:
+
+    block header, BLOCK_HEADER
+        magic        4s   b"EVBK"
+        rows         I
+        codec        B    CODECS
+        flags        B    FLAG_TIME_DELTA, FLAG_XY_DELTA
+        reserved     2x
+        size         I    compressed payload bytes
+        crc32        I    of the compressed payload
+    payload, `rows` * RECORD_SIZE bytes once decompressed
+
+The payload is column by column in RECORD_FIELDS order, so similar values sit
+together. With FLAG_TIME_DELTA `time` is stored as int64 differences from the
+previous event (the plugin's times are whole milliseconds), with FLAG_XY_DELTA
+`x` and `y` as int32 differences. Mouse moves mostly change by a few pixels a few
+ms apart, so the deltas are small repeating values the compressor squeezes well.
+
+A block is written when it is full or on flush(). A crash loses at most the
+block being filled; readers stop at the first truncated or corrupt block.
+
+Codecs: zlib (default, standard library), lz4 and zstd when installed
+(`pip install lz4` / `pip install zstandard`), none. The writer only needs the
+standard library so it can run inside OBS' python; the reader decodes blocks with
+numpy. event_log.read_events / iter_event_chunks read these files like any other
+recording, see bench_compression.py for ratios and speeds.
+"""
+
+import struct
+import sys
+import zlib
+from array import array
+
+from event_log import (
+    COMPRESSED_MAGIC,
+    HEADER_SIZE,
+    RECORD_FIELDS,
+    RECORD_SIZE,
+    EventLogWriter,
+    frame_to_records,
+    read_header,
+)
+
+try:
+    import numpy as np
+except ImportError:  # Recording inside OBS only needs the writer
+    np = None
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+BLOCK_MAGIC = b"EVBK"
+BLOCK_HEADER = struct.Struct("<4sIBB2xII")
+BLOCK_ROWS = 4096
+
+CODECS = {"none": 0, "zlib": 1, "lz4": 2, "zstd": 3}
+CODEC_NAMES = {v: k for k, v in CODECS.items()}
+DEFAULT_LEVELS = {"zlib": 1, "zstd": 3}
+
+FLAG_TIME_DELTA = 1
+FLAG_XY_DELTA = 2
+
+_SIZES = {"d": 8, "q": 8, "H": 2, "B": 1, "h": 2, "i": 4, "I": 4}
+_TIME_DELTA_LIMIT = 2**53
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def available_codecs():
+    return [
+        name
+        for name, ok in (
+            ("none", True),
+            ("zlib", True),
+            ("lz4", lz4_block is not None),
+            ("zstd", zstandard is not None),
+        )
+        if ok
+    ]
+
+
+def make_compressor(name: str, level=None):
+    """Returns a function compressing one block's payload."""
+    level = DEFAULT_LEVELS.get(name) if level is None else level
+    if name == "none":
+        return bytes
+    if name == "zlib":
+        return lambda data: zlib.compress(data, level)
+    if name == "lz4":
+        if lz4_block is None:
+            raise ImportError("lz4 is not installed, run `pip install lz4`")
+        return lambda data: lz4_block.compress(data, store_size=False)
+    if name == "zstd":
+        if zstandard is None:
+            raise ImportError(
+                "zstandard is not installed, run `pip install zstandard`"
+            )
+        return zstandard.ZstdCompressor(level=level).compress
+    raise ValueError(f"Unknown codec '{name}', use one of {list(CODECS)}")
+
+
+def decompress(codec: int, data: bytes, raw_size: int) -> bytes:
+    if codec == CODECS["none"]:
+        return data
+    if codec == CODECS["zlib"]:
+        return zlib.decompress(data)
+    if codec == CODECS["lz4"]:
+        if lz4_block is None:
+            raise ImportError("lz4 is not installed, run `pip install lz4`")
+        return lz4_block.decompress(data, uncompressed_size=raw_size)
+    if codec == CODECS["zstd"]:
+        if zstandard is None:
+            raise ImportError(
+                "zstandard is not installed, run `pip install zstandard`"
+            )
+        return zstandard.ZstdDecompressor().decompress(
+            data, max_output_size=raw_size
+        )
+    raise ValueError(f"Unknown codec id {codec}")
+
+
+def _column_bytes(code, values):
+    column = array(code, values)
+    if not _LITTLE_ENDIAN:
+        column.byteswap()
+    return column.tobytes()
+
+
+def _wrap32(value):
+    return ((value + 2**31) & 0xFFFFFFFF) - 2**31
+
+
+def encode_rows(rows, delta=True):
+    """Payload of a block from record value tuples (standard library only)."""
+    columns = list(zip(*rows))
+    flags = 0
+    parts = []
+    for (name, code), values in zip(RECORD_FIELDS, columns):
+        if name == "time" and delta and all(
+            v.is_integer() and abs(v) < _TIME_DELTA_LIMIT for v in values
+        ):
+            ints = [int(v) for v in values]
+            values = [b - a for a, b in zip([0] + ints, ints)]
+            code = "q"
+            flags |= FLAG_TIME_DELTA
+        elif name in ("x", "y") and delta:
+            values = [_wrap32(b - a) for a, b in zip((0,) + values, values)]
+            flags |= FLAG_XY_DELTA
+        parts.append(_column_bytes(code, values))
+    return b"".join(parts), flags
+
+
+def encode_records(records, delta=True):
+    """Payload of a block from RECORD_DTYPE records (numpy)."""
+    flags = 0
+    parts = []
+    for name, _ in RECORD_FIELDS:
+        column = records[name]
+        if name == "time" and delta:
+            whole = np.all(column == np.floor(column)) and np.all(
+                np.abs(column) < _TIME_DELTA_LIMIT
+            )
+            if whole:
+                column = np.diff(column.astype("<i8"), prepend=np.int64(0))
+                flags |= FLAG_TIME_DELTA
+        elif name in ("x", "y") and delta:
+            # int32 arithmetic wraps, the reader's cumsum wraps back
+            column = np.diff(column.astype("<i4"), prepend=np.int32(0))
+            flags |= FLAG_XY_DELTA
+        parts.append(np.ascontiguousarray(column).tobytes())
+    return b"".join(parts), flags
+
+
+def decode_block(payload: bytes, rows: int, flags: int):
+    """RECORD_DTYPE records of a decompressed block payload."""
+    from event_log import RECORD_DTYPE
+
+    records = np.empty(rows, dtype=RECORD_DTYPE)
+    offset = 0
+    for name, code in RECORD_FIELDS:
+        if name == "time" and flags & FLAG_TIME_DELTA:
+            deltas = np.frombuffer(payload, "<i8", rows, offset)
+            records[name] = np.cumsum(deltas)
+        elif name in ("x", "y") and flags & FLAG_XY_DELTA:
+            deltas = np.frombuffer(payload, "<i4", rows, offset)
+            records[name] = np.cumsum(deltas, dtype=np.int32)
+        else:
+            records[name] = np.frombuffer(payload, RECORD_DTYPE[name], rows, offset)
+        offset += rows * _SIZES[code]
+    return records
+
+
+class CompressedEventLogWriter(EventLogWriter):
+    """
+    Drop-in replacement for EventLogWriter writing a compressed event log.
+
+    Events are buffered and written a block at a time; auto_flush flushes the file
+    after every block. flush() writes the events buffered so far as a (shorter)
+    block, flush_file() leaves them buffered. QueuedEventWriter and
+    SegmentedEventWriter use flush_file() between their periodic full flushes.
+    """
+
+    magic = COMPRESSED_MAGIC
+
+    def __init__(
+        self,
+        path: str,
+        codec: str = "zlib",
+        level=None,
+        block_rows: int = BLOCK_ROWS,
+        delta: bool = True,
+        auto_flush: bool = True,
+        decoder=None,
+    ):
+        self.codec = CODECS[codec]
+        self.compress = make_compressor(codec, level)
+        self.block_rows = block_rows
+        self.delta = delta
+        self._rows = []
+        self.blocks = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        super().__init__(path, auto_flush=auto_flush, decoder=decoder)
+
+    def write_record(self, record):
+        self._rows.append(self.record_values(record))
+        if len(self._rows) >= self.block_rows:
+            self._write_rows()
+
+    def write_frame(self, df):
+        self._write_rows()
+        records = frame_to_records(df, self._intern)
+        for start in range(0, len(records), self.block_rows):
+            block = records[start : start + self.block_rows]
+            self._write_block(*encode_records(block, self.delta), len(block))
+
+    def _write_rows(self):
+        if self._rows:
+            self._write_block(*encode_rows(self._rows, self.delta), len(self._rows))
+            self._rows = []
+
+    def _write_block(self, payload, flags, rows):
+        data = self.compress(payload)
+        self._file.write(
+            BLOCK_HEADER.pack(
+                BLOCK_MAGIC, rows, self.codec, flags, len(data), zlib.crc32(data)
+            )
+        )
+        self._file.write(data)
+        if self.auto_flush:
+            self._file.flush()
+        self.blocks += 1
+        self.raw_bytes += len(payload)
+        self.compressed_bytes += BLOCK_HEADER.size + len(data)
+
+    def flush(self):
+        if self._file:
+            self._write_rows()
+            self._file.flush()
+
+    def flush_file(self):
+        """Flush the blocks written so far, without cutting the one being filled."""
+        if self._file:
+            self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._write_rows()
+        super().close()
+
+
+def iter_raw_blocks(f):
+    """
+    Yield (offset, rows, codec, flags, compressed payload) for every intact block
+    of an open compressed log, stopping at the first truncated or corrupt one.
+    """
+    offset = HEADER_SIZE
+    f.seek(offset)
+    while True:
+        header = f.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size:
+            return
+        magic, rows, codec, flags, size, crc = BLOCK_HEADER.unpack(header)
+        if magic != BLOCK_MAGIC:
+            return
+        data = f.read(size)
+        if len(data) < size or zlib.crc32(data) != crc:
+            return
+        yield offset, rows, codec, flags, data
+        offset += BLOCK_HEADER.size + size
+
+
+def iter_compressed_blocks(path: str):
+    """Yield the RECORD_DTYPE records of every block of a compressed log."""
+    with open(path, "rb") as f:
+        for _, rows, codec, flags, data in iter_raw_blocks(f):
+            payload = decompress(codec, data, rows * RECORD_SIZE)
+            yield decode_block(payload, rows, flags)
+
+
+def read_compressed_log(path: str):
+    """Returns (records, event_types, event_sources), like event_log.read_event_log."""
+    from event_log import RECORD_DTYPE
+
+    with open(path, "rb") as f:
+        event_types, event_sources = read_header(f, COMPRESSED_MAGIC)
+    blocks = list(iter_compressed_blocks(path))
+    if not blocks:
+        return np.empty(0, dtype=RECORD_DTYPE), event_types, event_sources
+    return np.concatenate(blocks), event_types, event_sources
+
+
+def scan_compressed_log(path: str):
+    """
+    (valid bytes, rows, first time, last time) of a compressed log, standard
+    library only. Used to recover a segment after a crash.
+    """
+    valid = HEADER_SIZE
+    total = 0
+    first = last = None
+    with open(path, "rb") as f:
+        for offset, rows, codec, flags, data in iter_raw_blocks(f):
+            valid = offset + BLOCK_HEADER.size + len(data)
+            total += rows
+            payload = decompress(codec, data, rows * RECORD_SIZE)
+            times = _block_times(payload, rows, flags)
+            if first is None:
+                first = times[0]
+            last = times[-1]
+    return valid, total, first, last
+
+
+def _block_times(payload, rows, flags):
+    # time is the first column of the payload
+    code = "q" if flags & FLAG_TIME_DELTA else "d"
+    column = array(code)
+    column.frombytes(payload[: rows * 8])
+    if not _LITTLE_ENDIAN:
+        column.byteswap()
+    if code == "d":
+        return column
+    times, t = [], 0
+    for delta in column:
+        t += delta
+        times.append(float(t))
+    return times
@@ -0,0 +1,88 @@
+"""
+Decoders for the input-overlay websocket messages.
+
+Every decoder turns one json message into a record: a list of values in
+`event_log.COLUMNS` order, with None for fields the event did not have.
+
+    json     the standard library json module
+    orjson   orjson, if it is installed
+    schema   the standard library's C scanner called directly on the one json
+             object a message holds, then only the COLUMNS fields are picked out
+
+`make_decoder("auto")` picks orjson when it is available and falls back to schema.
+See bench_decoders.py to compare them on a recording.
+"""
+
+import json
+
+from event_log import COLUMNS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonDecoder:
+    name = "json"
+
+    def __init__(self):
+        self._loads = json.loads
+
+    def decode(self, message):
+        event = self._loads(message)
+        return [event.get(column) for column in COLUMNS]
+
+
+class OrjsonDecoder(JsonDecoder):
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson is not installed, run `pip install orjson`")
+        self._loads = orjson.loads
+
+
+class SchemaDecoder:
+    """
+    Every message is a single flat json object. json.loads spends a good part of
+    its time checking for anything else (bytes, surrounding whitespace, trailing
+    data) in python; this calls the C scanner on the object straight away and only
+    hands messages it cannot take whole to json.loads, which parses or rejects them
+    exactly as the json decoder would.
+    """
+
+    name = "schema"
+
+    def __init__(self):
+        self._scan = json.JSONDecoder().scan_once
+
+    def decode(self, message):
+        try:
+            event, end = self._scan(message, 0)
+        except (StopIteration, TypeError):
+            event, end = None, -1
+        if end != len(message):
+            event = json.loads(message)
+        if not isinstance(event, dict):
+            raise ValueError("Expected a json object")
+        return list(map(event.get, COLUMNS))
+
+
+DECODERS = {
+    "json": JsonDecoder,
+    "orjson": OrjsonDecoder,
+    "schema": SchemaDecoder,
+}
+
+
+def available_decoders():
+    return [name for name in DECODERS if name != "orjson" or orjson is not None]
+
+
+def make_decoder(name: str = "auto"):
+    if name == "auto":
+        name = "orjson" if orjson is not None else "schema"
+    if name not in DECODERS:
+        raise ValueError(f"Unknown decoder '{name}', choose from {list(DECODERS)}")
+    return DECODERS[name]()
@@ -0,0 +1,624 @@
+"""
+Compact binary event log, a typed alternative to the recorded action csv.
+
+Layout (little endian):
+
+    header, HEADER_SIZE bytes
+        magic            8s   b"OBSEVLOG"
+        version          H
+        record_size      H
+        reserved         12x
+        event_type table     TABLE_SLOTS x SLOT_SIZE bytes, null padded utf-8
+        event_source table   TABLE_SLOTS x SLOT_SIZE bytes, null padded utf-8
+    records, RECORD_SIZE bytes each, one per event
+
+Every record has the same fixed-width numeric fields. `event_type` and `event_source`
+are stored as indices into the header tables; new strings are interned as they show up
+and the table slot is rewritten in place, so the file stays append-only otherwise.
+The `present` bitmask records which optional fields the event actually had, readers
+turn the others into NaN just like an empty csv cell.
+
+The writer only needs the standard library so it can run inside OBS' python. The
+readers memory-map the records straight into a numpy structured array.
+"""
+
+import os
+import queue
+import struct
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # Recording inside OBS only needs the writer
+    np = None
+
+
+MAGIC = b"OBSEVLOG"
+VERSION = 1
+EVENT_LOG_EXTENSION = ".evlog"
+# Compressed event log, see compressed_log.py
+COMPRESSED_MAGIC = b"OBSEVLGZ"
+COMPRESSED_LOG_EXTENSION = ".evlogz"
+
+TABLE_SLOTS = 32
+SLOT_SIZE = 24
+_PREAMBLE = struct.Struct("<8sHH12x")
+HEADER_SIZE = _PREAMBLE.size + 2 * TABLE_SLOTS * SLOT_SIZE
+
+# Same columns and order as the recorded csv
+COLUMNS = [
+    "time",
+    "event_source",
+    "event_type",
+    "x",
+    "y",
+    "button",
+    "clicks",
+    "keycode",
+    "rawcode",
+    "char",
+    "mask",
+    "wheel_amount",
+    "wheel_direction",
+    "wheel_rotation",
+]
+
+_COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+# Optional numeric fields, bit i of `present` is set when OPTIONAL_FIELDS[i] was given
+OPTIONAL_FIELDS = [
+    "time",
+    "x",
+    "y",
+    "button",
+    "clicks",
+    "keycode",
+    "rawcode",
+    "char",
+    "mask",
+    "wheel_amount",
+    "wheel_direction",
+    "wheel_rotation",
+]
+
+# Field name, struct code
+RECORD_FIELDS = [
+    ("time", "d"),
+    ("present", "H"),
+    ("event_type", "B"),
+    ("event_source", "B"),
+    ("x", "i"),
+    ("y", "i"),
+    ("button", "h"),
+    ("clicks", "h"),
+    ("keycode", "i"),
+    ("rawcode", "i"),
+    ("char", "I"),
+    ("mask", "i"),
+    ("wheel_amount", "h"),
+    ("wheel_direction", "h"),
+    ("wheel_rotation", "i"),
+]
+_RECORD = struct.Struct("<" + "".join(code for _, code in RECORD_FIELDS))
+RECORD_SIZE = _RECORD.size
+
+# Event types emitted by the input-overlay plugin, interned up front.
+# Slot 0 is always the empty string.
+KNOWN_EVENT_TYPES = [
+    "",
+    "key_pressed",
+    "key_released",
+    "key_typed",
+    "mouse_moved",
+    "mouse_dragged",
+    "mouse_pressed",
+    "mouse_released",
+    "mouse_clicked",
+    "mouse_wheel",
+]
+
+# Csv columns that are empty for some event types. Reading them as float keeps their
+# formatting identical from chunk to chunk.
+SPARSE_COLUMNS = [
+    "x",
+    "y",
+    "button",
+    "clicks",
+    "keycode",
+    "rawcode",
+    "wheel_amount",
+    "wheel_direction",
+    "wheel_rotation",
+]
+
+if np is not None:
+    _NUMPY_CODES = {"d": "<f8", "H": "<u2", "B": "u1", "h": "<i2", "i": "<i4", "I": "<u4"}
+    RECORD_DTYPE = np.dtype(
+        [(name, _NUMPY_CODES[code]) for name, code in RECORD_FIELDS]
+    )
+    assert RECORD_DTYPE.itemsize == RECORD_SIZE
+
+
+def is_event_log(path: str, magic: bytes = MAGIC) -> bool:
+    """True if `path` starts with the event log magic."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(magic)) == magic
+    except OSError:
+        return False
+
+
+def is_compressed_log(path: str) -> bool:
+    return is_event_log(path, COMPRESSED_MAGIC)
+
+
+def _pack_table(values):
+    out = bytearray(TABLE_SLOTS * SLOT_SIZE)
+    for i, value in enumerate(values):
+        out[i * SLOT_SIZE : (i + 1) * SLOT_SIZE] = _pack_slot(value)
+    return bytes(out)
+
+
+def _pack_slot(value: str) -> bytes:
+    raw = value.encode("utf-8")
+    if len(raw) > SLOT_SIZE:
+        raise ValueError(f"'{value}' is longer than {SLOT_SIZE} bytes")
+    return raw.ljust(SLOT_SIZE, b"\0")
+
+
+def _unpack_table(raw: bytes):
+    values = []
+    for i in range(TABLE_SLOTS):
+        value = raw[i * SLOT_SIZE : (i + 1) * SLOT_SIZE].rstrip(b"\0").decode("utf-8")
+        if i > 0 and not value:
+            break
+        values.append(value)
+    return values
+
+
+def read_header(f, expected_magic: bytes = MAGIC):
+    """Read the header from an open binary file, returns (event_types, event_sources)."""
+    f.seek(0)
+    raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError("Truncated event log header")
+    magic, version, record_size = _PREAMBLE.unpack_from(raw)
+    if magic != expected_magic:
+        raise ValueError("Not an event log")
+    if version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError(
+            f"Unsupported event log version {version} (record size {record_size})"
+        )
+    table_start = _PREAMBLE.size
+    table_size = TABLE_SLOTS * SLOT_SIZE
+    event_types = _unpack_table(raw[table_start : table_start + table_size])
+    event_sources = _unpack_table(raw[table_start + table_size : HEADER_SIZE])
+    return event_types, event_sources
+
+
+def frame_to_records(df, intern):
+    """
+    Pack a DataFrame with the csv columns into RECORD_DTYPE records.
+
+    `intern(table, value)` returns the table index of an event_type / event_source
+    string, e.g. EventLogWriter._intern.
+    """
+    import pandas as pd
+
+    records = np.zeros(len(df), dtype=RECORD_DTYPE)
+    present = np.zeros(len(df), dtype=np.uint16)
+    for bit, name in enumerate(OPTIONAL_FIELDS):
+        if name not in df.columns:
+            continue
+        column = df[name]
+        if name == "char":
+            has = column.notna().to_numpy() & (column.astype(str) != "").to_numpy()
+            values = [ord(str(c)[0]) if h else 0 for c, h in zip(column, has)]
+        else:
+            numeric = column.astype("float64").to_numpy()
+            has = ~np.isnan(numeric)
+            values = np.where(has, numeric, 0)
+        records[name] = values
+        present |= has.astype(np.uint16) << bit
+    records["present"] = present
+
+    for table in ("event_type", "event_source"):
+        if table not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[table])
+        # Missing values get code -1, which picks the trailing empty slot
+        lookup = np.array([intern(table, u) for u in uniques] + [0])
+        records[table] = lookup[codes]
+    return records
+
+
+class EventLogWriter:
+    """
+    Appends events to a binary event log.
+
+    Drop-in replacement for EventWriter: `write` takes the raw json message from the
+    websocket and decodes it with `decoder` (see event_decoders.py). `write_record`
+    takes an already decoded record and `write_event` an event dict.
+    """
+
+    magic = MAGIC
+
+    def __init__(
+        self, path: str, append: bool = False, auto_flush: bool = True, decoder=None
+    ):
+        if decoder is None:
+            from event_decoders import make_decoder
+
+            decoder = make_decoder()
+        self.decoder = decoder
+        self.auto_flush = auto_flush
+        if append and os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE:
+            self._file = open(path, "r+b")
+            event_types, event_sources = read_header(self._file, self.magic)
+            # Drop a partially written trailing record
+            n_records = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+            self._file.truncate(HEADER_SIZE + n_records * RECORD_SIZE)
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file = open(path, "wb")
+            event_types, event_sources = list(KNOWN_EVENT_TYPES), [""]
+            self._file.write(_PREAMBLE.pack(self.magic, VERSION, RECORD_SIZE))
+            self._file.write(_pack_table(event_types))
+            self._file.write(_pack_table(event_sources))
+            self._file.flush()
+
+        self._tables = {
+            "event_type": {v: i for i, v in enumerate(event_types)},
+            "event_source": {v: i for i, v in enumerate(event_sources)},
+        }
+        self._table_offsets = {
+            "event_type": _PREAMBLE.size,
+            "event_source": _PREAMBLE.size + TABLE_SLOTS * SLOT_SIZE,
+        }
+
+    def _intern(self, table: str, value) -> int:
+        if value is None or value == "":
+            return 0
+        value = str(value)
+        ids = self._tables[table]
+        index = ids.get(value)
+        if index is not None:
+            return index
+        if len(ids) >= TABLE_SLOTS:
+            print(f"Event log {table} table is full, storing '{value}' as empty")
+            return 0
+
+        index = len(ids)
+        position = self._file.tell()
+        self._file.seek(self._table_offsets[table] + index * SLOT_SIZE)
+        self._file.write(_pack_slot(value))
+        self._file.seek(position)
+        ids[value] = index
+        return index
+
+    def pack_record(self, record) -> bytes:
+        """Pack a decoded record (values in COLUMNS order, None if absent)."""
+        return _RECORD.pack(*self.record_values(record))
+
+    def record_values(self, record) -> tuple:
+        """A decoded record's RECORD_FIELDS values."""
+        present = 0
+        values = {}
+        for bit, name in enumerate(OPTIONAL_FIELDS):
+            value = record[_COLUMN_INDEX[name]]
+            if value is None or value == "":
+                values[name] = 0
+                continue
+            if name == "char":
+                value = ord(value[0]) if isinstance(value, str) else int(value)
+            elif name != "time":
+                value = int(value)
+            values[name] = value
+            present |= 1 << bit
+
+        return (
+            float(values["time"]),
+            present,
+            self._intern("event_type", record[_COLUMN_INDEX["event_type"]]),
+            self._intern("event_source", record[_COLUMN_INDEX["event_source"]]),
+            values["x"],
+            values["y"],
+            values["button"],
+            values["clicks"],
+            values["keycode"],
+            values["rawcode"],
+            values["char"],
+            values["mask"],
+            values["wheel_amount"],
+            values["wheel_direction"],
+            values["wheel_rotation"],
+        )
+
+    def write_record(self, record):
+        self._file.write(self.pack_record(record))
+        if self.auto_flush:
+            self._file.flush()
+
+    def write_event(self, event: dict):
+        self.write_record([event.get(column) for column in COLUMNS])
+
+    def write(self, event_json: str):
+        try:
+            self.write_record(self.decoder.decode(event_json))
+        except ValueError as e:
+            print(f"Error parsing JSON: {e}")
+        except Exception as e:
+            print(f"Error writing event: {e}")
+
+    def write_frame(self, df):
+        """Append every row of a DataFrame with the csv columns."""
+        self._file.write(frame_to_records(df, self._intern).tobytes())
+        if self.auto_flush:
+            self._file.flush()
+
+    def flush(self):
+        if self._file:
+            self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class QueuedEventWriter:
+    """
+    Moves event writes off the caller's thread.
+
+    `write` only puts the message on a bounded queue, so the websocket thread never
+    waits on disk I/O. A dedicated thread drains the queue into `writer` (EventWriter
+    or EventLogWriter) and flushes once per batch, when `batch_size` messages were
+    written or `flush_interval` seconds passed. A writer with `flush_file` (the
+    compressed log) only gets a full flush, which cuts its partial block, every
+    `block_interval` seconds, so blocks are not cut at every batch. When the queue is full new messages are
+    dropped and counted. A failing write or flush is printed and counted in `errors`,
+    the thread keeps going. `close` writes and flushes everything still queued.
+    """
+
+    def __init__(
+        self,
+        writer,
+        max_queue: int = 100_000,
+        batch_size: int = 1000,
+        flush_interval: float = 0.5,
+        block_interval: float = 5.0,
+    ):
+        self.writer = writer
+        self.writer.auto_flush = False
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_interval = block_interval
+        self._flush_file = getattr(writer, "flush_file", None)
+        self._last_full_flush = time.monotonic()
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+        }
+
+    def write(self, event_json: str):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(event_json)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        stop = False
+        while not stop:
+            pending = 0
+            deadline = time.monotonic() + self.flush_interval
+            while pending < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    message = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if message is None:
+                    stop = True
+                    break
+                self._write(message)
+                pending += 1
+            if pending:
+                try:
+                    self._flush()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error flushing events: {e}")
+                self.written += pending
+                self.batches += 1
+
+    def _flush(self):
+        now = time.monotonic()
+        if self._flush_file and now - self._last_full_flush < self.block_interval:
+            self._flush_file()
+        else:
+            self.writer.flush()
+            self._last_full_flush = now
+
+    def _write(self, message):
+        try:
+            self.writer.write(message)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error writing event: {e}")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            # Blocks if the queue is full, the sentinel must not be dropped
+            self._queue.put(None)
+            self._thread.join()
+        # Anything that was queued after the sentinel
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is not None:
+                self._write(message)
+                self.written += 1
+        self.writer.close()
+
+
+def read_event_log(path: str):
+    """
+    Memory-map the records of an event log.
+
+    Returns (records, event_types, event_sources); `records` is a read only numpy
+    structured array with RECORD_DTYPE, columns are zero-copy views like
+    `records["x"]`. A partially written trailing record is ignored.
+    """
+    with open(path, "rb") as f:
+        event_types, event_sources = read_header(f)
+    n_records = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+    if n_records == 0:
+        return np.empty(0, dtype=RECORD_DTYPE), event_types, event_sources
+    records = np.memmap(
+        path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(n_records,)
+    )
+    return records, event_types, event_sources
+
+
+def records_to_dataframe(records, event_types, event_sources):
+    """Build a DataFrame with the csv columns, absent fields become NaN."""
+    import pandas as pd
+
+    present = records["present"]
+    data = {}
+    for bit, name in enumerate(OPTIONAL_FIELDS):
+        has = (present & (1 << bit)) != 0
+        if name == "char":
+            data[name] = [chr(c) if h else np.nan for c, h in zip(records[name], has)]
+        else:
+            data[name] = np.where(has, records[name].astype("float64"), np.nan)
+    data["event_type"] = np.array(event_types, dtype=object)[records["event_type"]]
+    data["event_source"] = np.array(event_sources, dtype=object)[
+        records["event_source"]
+    ]
+    for table in ("event_type", "event_source"):
+        data[table][records[table] == 0] = np.nan
+    return pd.DataFrame({name: data[name] for name in COLUMNS})
+
+
+def iter_event_chunks(path: str, chunk_size: int):
+    """Yield DataFrames of at most `chunk_size` events from a csv or event log."""
+    import pandas as pd
+
+    if os.path.isdir(path):
+        from segmented_log import SegmentedRecording
+
+        # Segments are read whole, a chunk never spans two of them
+        for _, df in SegmentedRecording(path).iter_segments():
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start : start + chunk_size]
+    elif is_compressed_log(path):
+        from compressed_log import iter_compressed_blocks
+
+        with open(path, "rb") as f:
+            event_types, event_sources = read_header(f, COMPRESSED_MAGIC)
+        pending = []
+        rows = 0
+        for block in iter_compressed_blocks(path):
+            pending.append(block)
+            rows += len(block)
+            if rows >= chunk_size:
+                records = np.concatenate(pending)
+                for start in range(0, rows - rows % chunk_size, chunk_size):
+                    yield records_to_dataframe(
+                        records[start : start + chunk_size], event_types, event_sources
+                    )
+                pending = [records[rows - rows % chunk_size :]]
+                rows = len(pending[0])
+        if rows:
+            yield records_to_dataframe(
+                np.concatenate(pending), event_types, event_sources
+            )
+    elif is_event_log(path):
+        records, event_types, event_sources = read_event_log(path)
+        for start in range(0, len(records), chunk_size):
+            yield records_to_dataframe(
+                records[start : start + chunk_size], event_types, event_sources
+            )
+    else:
+        yield from pd.read_csv(
+            path,
+            chunksize=chunk_size,
+            dtype={name: "float64" for name in SPARSE_COLUMNS},
+        )
+
+
+def read_events(path: str):
+    """
+    Read a whole recording, csv, event log or segment directory (see
+    segmented_log.py), into a DataFrame.
+    """
+    import pandas as pd
+
+    if os.path.isdir(path):
+        from segmented_log import SegmentedRecording
+
+        return SegmentedRecording(path).read_all()
+    if is_compressed_log(path):
+        from compressed_log import read_compressed_log
+
+        return records_to_dataframe(*read_compressed_log(path))
+    if is_event_log(path):
+        return records_to_dataframe(*read_event_log(path))
+    return pd.read_csv(path)
+
+
+def is_log_path(path: str) -> bool:
+    """True if a recording written to `path` is an event log, compressed or not."""
+    return path.endswith((EVENT_LOG_EXTENSION, COMPRESSED_LOG_EXTENSION))
+
+
+def make_log_writer(path: str, **kwargs):
+    """EventLogWriter, or CompressedEventLogWriter if `path` ends in .evlogz."""
+    if path.endswith(COMPRESSED_LOG_EXTENSION):
+        from compressed_log import CompressedEventLogWriter
+
+        return CompressedEventLogWriter(path, **kwargs)
+    return EventLogWriter(path, **kwargs)
+
+
+def write_events(df, path: str):
+    """
+    Write a DataFrame as an event log if `path` ends in EVENT_LOG_EXTENSION (or a
+    compressed one for COMPRESSED_LOG_EXTENSION), else csv.
+    """
+    if is_log_path(path):
+        writer = make_log_writer(path)
+        try:
+            writer.write_frame(df)
+        finally:
+            writer.close()
+    else:
+        df.to_csv(path, index=False)
@@ -0,0 +1,383 @@
+"""
+Time-indexed event store, sorted and block compressed event columns per session.
+
+A store is a directory with one sub directory per session:
+
+    meta.json     source, row count, time range, block size, event_type and
+                  event_source tables (as in event_log.py)
+    blocks.idx    one BLOCK_DTYPE record per block, in time order
+    columns.bin   the blocks; every block stores each RECORD_DTYPE column on its
+                  own, zlib compressed
+
+Events are sorted by time before they are cut into blocks of `block_rows`, so the
+blocks' time ranges do not overlap. Each block's index record holds its min / max
+time and the number of events of every event type. A query finds the blocks that
+overlap its time window with a binary search, skips blocks that have none of the
+requested event types, and only decompresses the columns it asks for:
+
+    store = EventStore("store")
+    session = store.session("recording_20250101_120000")
+    keys = session.query(t0, t1, event_types=["key_pressed"])
+    t, x, y = session.mouse_path(t0, t1)
+    session.count(t0, t1, ["mouse_wheel"])  # whole blocks from the summaries
+
+Times are the recording's `time` column (ms).
+"""
+
+import json
+import os
+import shutil
+import zlib
+
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+
+from event_log import (
+    COLUMNS,
+    KNOWN_EVENT_TYPES,
+    RECORD_DTYPE,
+    TABLE_SLOTS,
+    frame_to_records,
+    read_events,
+    records_to_dataframe,
+)
+
+STORE_VERSION = 1
+META_FILE = "meta.json"
+BLOCK_INDEX_FILE = "blocks.idx"
+COLUMNS_FILE = "columns.bin"
+
+BLOCK_ROWS = 4096
+STORE_COLUMNS = list(RECORD_DTYPE.names)
+
+BLOCK_DTYPE = np.dtype(
+    [
+        ("t_min", "<f8"),
+        ("t_max", "<f8"),
+        ("rows", "<u4"),
+        ("reserved", "<u4"),
+        # Events per event_type table slot
+        ("type_counts", "<u4", (TABLE_SLOTS,)),
+        ("offsets", "<u8", (len(STORE_COLUMNS),)),
+        ("sizes", "<u4", (len(STORE_COLUMNS),)),
+    ]
+)
+
+_COLUMN_SLOT = {name: i for i, name in enumerate(STORE_COLUMNS)}
+MOUSE_PATH_TYPES = ("mouse_moved", "mouse_dragged")
+
+
+class SessionStoreWriter:
+    """
+    Writes one session of a store. `append` takes DataFrames with the csv columns
+    in time order (each one is sorted, but they must not overlap), full blocks are
+    compressed and written as they fill up.
+    """
+
+    def __init__(self, path, source=None, block_rows=BLOCK_ROWS, level=1):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.block_rows = block_rows
+        self.level = level
+        self.meta = {
+            "version": STORE_VERSION,
+            "source": source,
+            "block_rows": block_rows,
+            "compression": "zlib",
+        }
+        self._tables = {
+            "event_type": {v: i for i, v in enumerate(KNOWN_EVENT_TYPES)},
+            "event_source": {"": 0},
+        }
+        self._columns = open(os.path.join(path, COLUMNS_FILE), "wb")
+        self._index = open(os.path.join(path, BLOCK_INDEX_FILE), "wb")
+        self._pending = np.zeros(0, dtype=RECORD_DTYPE)
+        self._offset = 0
+        self.rows = 0
+        self.blocks = 0
+        self.t_min = None
+        self.t_max = None
+        self._last_time = None
+
+    def _intern(self, table, value):
+        if value is None or value == "":
+            return 0
+        ids = self._tables[table]
+        value = str(value)
+        if value not in ids:
+            if len(ids) >= TABLE_SLOTS:
+                print(f"Event store {table} table is full, storing '{value}' as empty")
+                return 0
+            ids[value] = len(ids)
+        return ids[value]
+
+    def append(self, df):
+        if len(df) == 0:
+            return
+        df = df.sort_values(by="time", kind="stable")
+        records = frame_to_records(df, self._intern)
+        if self._last_time is not None and records["time"][0] < self._last_time:
+            raise ValueError(
+                f"Events at {records['time'][0]} are older than ones already "
+                f"appended ({self._last_time}), append them in time order"
+            )
+        self._last_time = records["time"][-1]
+        self._pending = np.concatenate([self._pending, records])
+        while len(self._pending) >= self.block_rows:
+            self._write_block(self._pending[: self.block_rows])
+            self._pending = self._pending[self.block_rows :]
+
+    def _write_block(self, records):
+        block = np.zeros(1, dtype=BLOCK_DTYPE)
+        block["t_min"] = records["time"][0]
+        block["t_max"] = records["time"][-1]
+        block["rows"] = len(records)
+        block["type_counts"] = np.bincount(
+            records["event_type"], minlength=TABLE_SLOTS
+        )[:TABLE_SLOTS]
+        for i, name in enumerate(STORE_COLUMNS):
+            data = zlib.compress(
+                np.ascontiguousarray(records[name]).tobytes(), self.level
+            )
+            self._columns.write(data)
+            block["offsets"][0, i] = self._offset
+            block["sizes"][0, i] = len(data)
+            self._offset += len(data)
+        self._index.write(block.tobytes())
+
+        if self.t_min is None:
+            self.t_min = float(records["time"][0])
+        self.t_max = float(records["time"][-1])
+        self.rows += len(records)
+        self.blocks += 1
+
+    def close(self):
+        if len(self._pending):
+            self._write_block(self._pending)
+            self._pending = self._pending[:0]
+        self._columns.close()
+        self._index.close()
+        self.meta.update(
+            {
+                "rows": self.rows,
+                "blocks": self.blocks,
+                "t_min": self.t_min,
+                "t_max": self.t_max,
+                "event_types": _table_list(self._tables["event_type"]),
+                "event_sources": _table_list(self._tables["event_source"]),
+            }
+        )
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+
+def _table_list(ids):
+    values = [""] * len(ids)
+    for value, i in ids.items():
+        values[i] = value
+    return values
+
+
+class StoreSession:
+    """Read side of one session, see the module docstring."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(
+                f"Unsupported event store version {self.meta.get('version')}"
+            )
+        self.event_types = self.meta["event_types"]
+        self.event_sources = self.meta["event_sources"]
+        index_path = os.path.join(path, BLOCK_INDEX_FILE)
+        if os.path.getsize(index_path):
+            self.blocks = np.fromfile(index_path, dtype=BLOCK_DTYPE)
+        else:
+            self.blocks = np.zeros(0, dtype=BLOCK_DTYPE)
+        self._file = None
+        self.blocks_read = 0
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def t_min(self):
+        return self.meta["t_min"]
+
+    @property
+    def t_max(self):
+        return self.meta["t_max"]
+
+    def _type_ids(self, event_types):
+        return [self.event_types.index(t) for t in event_types if t in self.event_types]
+
+    def find_blocks(self, t0=None, t1=None, event_types=None):
+        """Indices of the blocks with events in t0 <= time < t1 of `event_types`."""
+        lo, hi = 0, len(self.blocks)
+        if t0 is not None:
+            lo = int(np.searchsorted(self.blocks["t_max"], t0, side="left"))
+        if t1 is not None:
+            hi = int(np.searchsorted(self.blocks["t_min"], t1, side="left"))
+        found = np.arange(lo, max(lo, hi))
+        if event_types is not None:
+            ids = self._type_ids(event_types)
+            counts = self.blocks["type_counts"][found][:, ids].sum(axis=1)
+            found = found[counts > 0]
+        return found
+
+    def read_block(self, i, columns=None):
+        """Decompress block `i`, just `columns` of it if given."""
+        if self._file is None:
+            self._file = open(os.path.join(self.path, COLUMNS_FILE), "rb")
+        block = self.blocks[i]
+        columns = STORE_COLUMNS if columns is None else columns
+        records = np.zeros(int(block["rows"]), dtype=RECORD_DTYPE[columns])
+        for name in columns:
+            slot = _COLUMN_SLOT[name]
+            self._file.seek(int(block["offsets"][slot]))
+            data = self._file.read(int(block["sizes"][slot]))
+            records[name] = np.frombuffer(
+                zlib.decompress(data), dtype=RECORD_DTYPE[name]
+            )
+        self.blocks_read += 1
+        return records
+
+    def query(self, t0=None, t1=None, event_types=None, columns=None):
+        """
+        Records (RECORD_DTYPE, or just `columns`) with t0 <= time < t1, of
+        `event_types` if given, in time order.
+        """
+        if columns is not None:
+            # Needed to filter, dropped again below
+            wanted = list(columns)
+            columns = list(dict.fromkeys(wanted + ["time", "event_type"]))
+        parts = [
+            self._read_window(i, t0, t1, event_types, columns)
+            for i in self.find_blocks(t0, t1, event_types)
+        ]
+        dtype = RECORD_DTYPE if columns is None else RECORD_DTYPE[columns]
+        result = np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+        if columns is not None:
+            result = repack_fields(result[wanted])
+        return result
+
+    def query_dataframe(self, t0=None, t1=None, event_types=None):
+        """Like `query`, as a DataFrame with the csv columns."""
+        return records_to_dataframe(
+            self.query(t0, t1, event_types), self.event_types, self.event_sources
+        )
+
+    def mouse_path(self, t0=None, t1=None):
+        """(time, x, y) of the mouse moves in the window."""
+        records = self.query(t0, t1, MOUSE_PATH_TYPES, columns=["time", "x", "y"])
+        return records["time"], records["x"], records["y"]
+
+    def count(self, t0=None, t1=None, event_types=None):
+        """
+        Number of events in the window. Blocks entirely inside it are counted from
+        their summaries, only the blocks on its edges are read.
+        """
+        found = self.find_blocks(t0, t1, event_types)
+        blocks = self.blocks[found]
+        inside = np.ones(len(found), dtype=bool)
+        if t0 is not None:
+            inside &= blocks["t_min"] >= t0
+        if t1 is not None:
+            inside &= blocks["t_max"] < t1
+        counts = blocks["type_counts"][inside]
+        if event_types is not None:
+            counts = counts[:, self._type_ids(event_types)]
+        total = int(counts.sum())
+        for i in found[~inside]:
+            total += len(
+                self._read_window(i, t0, t1, event_types, ["time", "event_type"])
+            )
+        return total
+
+    def _read_window(self, i, t0, t1, event_types, columns):
+        """The records of block `i` in the window."""
+        records = self.read_block(i, columns)
+        keep = np.ones(len(records), dtype=bool)
+        if t0 is not None:
+            keep &= records["time"] >= t0
+        if t1 is not None:
+            keep &= records["time"] < t1
+        if event_types is not None:
+            keep &= np.isin(records["event_type"], self._type_ids(event_types))
+        return records[keep]
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class EventStore:
+    """A directory of sessions, queried one by one or across all of them."""
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._sessions = {}
+
+    @property
+    def names(self):
+        return sorted(
+            name
+            for name in os.listdir(self.path)
+            if os.path.exists(os.path.join(self.path, name, META_FILE))
+        )
+
+    def session(self, name):
+        if name not in self._sessions:
+            self._sessions[name] = StoreSession(os.path.join(self.path, name))
+        return self._sessions[name]
+
+    def add_session(self, name, df, source=None, block_rows=BLOCK_ROWS):
+        """Store a DataFrame with the csv columns as session `name`, replacing it."""
+        path = os.path.join(self.path, name)
+        self._sessions.pop(name, None)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        writer = SessionStoreWriter(path, source=source, block_rows=block_rows)
+        try:
+            writer.append(df)
+        finally:
+            writer.close()
+        return self.session(name)
+
+    def add_recording(self, path, name=None, block_rows=BLOCK_ROWS):
+        """Store a recorded csv / event log, named after the file by default."""
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        return self.add_session(name, read_events(path), path, block_rows)
+
+    def sessions_between(self, t0=None, t1=None):
+        """Sessions whose time range overlaps t0 <= time < t1."""
+        found = []
+        for name in self.names:
+            session = self.session(name)
+            if session.t_min is None:
+                continue
+            if t0 is not None and session.t_max < t0:
+                continue
+            if t1 is not None and session.t_min >= t1:
+                continue
+            found.append(session)
+        return found
+
+    def query_dataframe(self, t0=None, t1=None, event_types=None):
+        """Events of every session in the window, with a `session` column."""
+        import pandas as pd
+
+        frames = []
+        for session in self.sessions_between(t0, t1):
+            df = session.query_dataframe(t0, t1, event_types)
+            if len(df):
+                df.insert(0, "session", session.name)
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["session"] + COLUMNS)
+        return pd.concat(frames, ignore_index=True)
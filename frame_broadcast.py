@@ -0,0 +1,146 @@
+"""
+Shared frame fan-out for the async s7 server.
+
+One capture + encode loop feeds every subscribed client: each frame is grabbed and
+encoded once, packed into one binary frame message, and that same bytes object is
+queued on every subscriber's ClientChannel (see async_server.py). Capture and
+encode run on a worker thread so the event loop keeps serving clients.
+
+Frames are droppable, a slow subscriber loses frames from its own queue without
+slowing the loop or the other subscribers. With the tiles codec a lost frame
+breaks the chain of changed tiles, so that subscriber's waiting frames are
+discarded and it gets nothing until the next keyframe, which is requested right
+away. New subscribers also start from a keyframe.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from frame_codecs import make_encoder
+from frame_pipeline import StageTimer
+from frame_protocol import CODEC_JPEG, pack_frame_header
+
+
+class FrameBroadcaster:
+    def __init__(
+        self, server, source, width=1280, height=720, fps=30, codec="jpeg", quality=50
+    ):
+        self.server = server
+        self.source = source
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.codec = codec
+        self.encoder = make_encoder(codec, quality)
+        self.subscribers = {}
+        self._waiting_keyframe = set()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None
+        self.frames = 0
+        self.late = 0
+        self.timer = StageTimer("capture_encode")
+        self._start = None
+
+    def subscribe(self, client):
+        """Call on the event loop."""
+        self.subscribers[client["id"]] = client
+        self._waiting_keyframe.add(client["id"])
+        self._request_keyframe()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def unsubscribe(self, client):
+        self.subscribers.pop(client["id"], None)
+        self._waiting_keyframe.discard(client["id"])
+
+    def _request_keyframe(self):
+        request = getattr(self.encoder, "request_keyframe", None)
+        if request:
+            request()
+
+    def _capture_encode(self):
+        start = time.perf_counter()
+        img = self.source.grab(self.width, self.height)
+        codec, data = self.encoder.encode(img)
+        self.timer.add((time.perf_counter() - start) * 1000)
+        return codec, bytes(data)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._executor, self.source.prepare, self.width, self.height
+        )
+        interval = 1 / self.fps
+        next_frame = loop.time()
+        frame_id = 0
+        self._start = time.perf_counter()
+        while self.subscribers:
+            capture_ns = time.time_ns()
+            codec, data = await loop.run_in_executor(
+                self._executor, self._capture_encode
+            )
+            message = (
+                pack_frame_header(frame_id, capture_ns, self.width, self.height, codec)
+                + data
+            )
+            self._fan_out(codec, message)
+            frame_id += 1
+            self.frames += 1
+            if len(self.timer.times_ms) >= 10_000:
+                # Timings of recent frames are enough, keep memory bounded
+                self.timer = StageTimer("capture_encode")
+
+            next_frame += interval
+            delay = next_frame - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # Running behind, carry on from now rather than bursting to catch up
+                self.late += 1
+                next_frame = loop.time()
+
+    def _fan_out(self, codec, message):
+        for client_id, client in list(self.subscribers.items()):
+            if client_id in self._waiting_keyframe:
+                if codec != CODEC_JPEG:
+                    continue
+                self._waiting_keyframe.discard(client_id)
+            kept = self.server.send(client, message, droppable=True)
+            if not kept and self.codec == "tiles":
+                client["channel"].discard_droppable()
+                self._waiting_keyframe.add(client_id)
+                self._request_keyframe()
+
+    def stats(self) -> dict:
+        duration = time.perf_counter() - self._start if self._start else 0.0
+        return {
+            "frames": self.frames,
+            "fps": self.frames / duration if duration > 0 else 0.0,
+            "late": self.late,
+            "subscribers": len(self.subscribers),
+            "capture_encode": self.timer.summary(),
+            "clients": {
+                client_id: client["channel"].stats()
+                for client_id, client in self.subscribers.items()
+            },
+        }
+
+
+def format_broadcast_stats(stats: dict) -> str:
+    lines = [
+        f"Broadcast: {stats['frames']} frames ({stats['fps']:.1f} fps), "
+        f"{stats['late']} late, {stats['subscribers']} subscribers"
+    ]
+    s = stats["capture_encode"]
+    if s["frames"]:
+        lines.append(
+            f"  capture+encode (ms): mean={s['mean_ms']:.1f}, p50={s['p50_ms']:.1f}, "
+            f"p95={s['p95_ms']:.1f}, max={s['max_ms']:.1f}"
+        )
+    for client_id, c in stats["clients"].items():
+        lines.append(
+            f"  client {client_id}: {c['sent']} sent ({c['sent_mb']:.1f} MB), "
+            f"{c['dropped']} dropped, {c['queued']} queued (max {c['max_queued']})"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,208 @@
+"""
+Frame encoders and decoders for the s7 streamer.
+
+    jpeg    every frame is a full JPEG (CODEC_JPEG)
+    tiles   the frame is split into square tiles and compared with the previous
+            frame; only changed tiles are sent (CODEC_TILES), packed into a single
+            JPEG mosaic. A full JPEG keyframe is sent every `keyframe_interval`
+            frames and whenever the resolution changes.
+
+CODEC_TILES payload (little endian):
+
+    tile_size   H
+    n_tiles     H
+    mosaic_cols H
+    n_tiles x (tile_x H, tile_y H)   tile coordinates, in tiles
+    mosaic JPEG                      tiles in row-major order, omitted if n_tiles is 0
+
+Tiles are diffed against the previous source frame, not the decoded one, so JPEG
+loss never accumulates: an unchanged tile keeps whatever the client last decoded
+for that same content.
+"""
+
+import io
+import math
+import struct
+
+import numpy as np
+from PIL import Image
+
+from frame_protocol import CODEC_JPEG, CODEC_TILES
+
+_TILES_HEADER = struct.Struct("<HHH")
+_TILE_COORD = struct.Struct("<HH")
+
+
+def _tiles_view(frame, tile):
+    """(rows, cols, tile, tile, 3) view of a frame whose sides are multiples of tile."""
+    h, w, c = frame.shape
+    return frame.reshape(h // tile, tile, w // tile, tile, c).swapaxes(1, 2)
+
+
+def _padded_shape(width, height, tile):
+    return (math.ceil(height / tile) * tile, math.ceil(width / tile) * tile, 3)
+
+
+class JpegEncoder:
+    name = "jpeg"
+
+    def __init__(self, quality=50):
+        self.quality = quality
+
+    def encode(self, img):
+        """Returns (codec, encoded buffer)."""
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=self.quality)
+        return CODEC_JPEG, buf.getbuffer()
+
+
+class TileEncoder:
+    name = "tiles"
+
+    def __init__(self, quality=50, tile=64, keyframe_interval=60):
+        self.quality = quality
+        self.tile = tile
+        self.keyframe_interval = keyframe_interval
+        self._previous = None
+        self._since_keyframe = 0
+        self.keyframes = 0
+        self.tiles_sent = 0
+        self.tiles_total = 0
+
+    def request_keyframe(self):
+        """Make the next frame a full JPEG keyframe."""
+        self._since_keyframe = self.keyframe_interval
+
+    def _pad(self, frame):
+        h, w, _ = frame.shape
+        padded = np.empty(_padded_shape(w, h, self.tile), dtype=np.uint8)
+        padded[:h, :w] = frame
+        # Repeat the edge so padding never shows up as a change
+        padded[h:, :w] = frame[-1:, :]
+        padded[:, w:] = padded[:, w - 1 : w]
+        return padded
+
+    def encode(self, img):
+        frame = self._pad(np.asarray(img.convert("RGB")))
+        previous, self._previous = self._previous, frame
+        rows, cols = frame.shape[0] // self.tile, frame.shape[1] // self.tile
+        self.tiles_total += rows * cols
+
+        if (
+            previous is None
+            or previous.shape != frame.shape
+            or self._since_keyframe >= self.keyframe_interval
+        ):
+            self._since_keyframe = 0
+            self.keyframes += 1
+            self.tiles_sent += rows * cols
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=self.quality)
+            return CODEC_JPEG, buf.getbuffer()
+        self._since_keyframe += 1
+
+        # A tile changed if any of its bytes did. Reducing the tile rows first keeps
+        # both reductions over contiguous memory, far faster than any(axis=(1, 3)).
+        changed = (frame != previous).reshape(rows, self.tile, -1).any(axis=1)
+        changed = changed.reshape(rows, cols, -1).any(axis=2)
+        ty, tx = np.nonzero(changed)
+        n_tiles = len(ty)
+        self.tiles_sent += n_tiles
+
+        header = _TILES_HEADER.pack(self.tile, n_tiles, 0)
+        if n_tiles == 0:
+            return CODEC_TILES, header
+
+        mosaic_cols = math.ceil(math.sqrt(n_tiles))
+        mosaic_rows = math.ceil(n_tiles / mosaic_cols)
+        tiles = np.zeros(
+            (mosaic_rows * mosaic_cols, self.tile, self.tile, 3), dtype=np.uint8
+        )
+        tiles[:n_tiles] = _tiles_view(frame, self.tile)[ty, tx]
+        mosaic = (
+            tiles.reshape(mosaic_rows, mosaic_cols, self.tile, self.tile, 3)
+            .swapaxes(1, 2)
+            .reshape(mosaic_rows * self.tile, mosaic_cols * self.tile, 3)
+        )
+        coords = np.empty((n_tiles, 2), dtype="<u2")
+        coords[:, 0] = tx
+        coords[:, 1] = ty
+
+        buf = io.BytesIO()
+        buf.write(_TILES_HEADER.pack(self.tile, n_tiles, mosaic_cols))
+        buf.write(coords.tobytes())
+        Image.fromarray(mosaic).save(buf, format="JPEG", quality=self.quality)
+        return CODEC_TILES, buf.getbuffer()
+
+
+ENCODERS = {"jpeg": JpegEncoder, "tiles": TileEncoder}
+
+
+def make_encoder(name="jpeg", quality=50):
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown codec '{name}', choose from {list(ENCODERS)}")
+    return ENCODERS[name](quality=quality)
+
+
+class FrameDecoder:
+    """
+    Rebuilds frames from CODEC_JPEG and CODEC_TILES payloads into one reusable
+    buffer. `decode` returns a (height, width, 3) view of that buffer, which is
+    overwritten by the next frame.
+    """
+
+    def __init__(self):
+        self._buffer = None
+        self._size = None
+        self._tile = None
+
+    def _ensure_buffer(self, width, height, tile):
+        shape = _padded_shape(width, height, tile)
+        if self._buffer is None or self._buffer.shape != shape:
+            self._buffer = np.zeros(shape, dtype=np.uint8)
+        self._size = (width, height)
+        self._tile = tile
+
+    @property
+    def frame(self):
+        if self._buffer is None:
+            return None
+        width, height = self._size
+        return self._buffer[:height, :width]
+
+    def decode(self, codec, width, height, payload):
+        if codec == CODEC_JPEG:
+            img = Image.open(io.BytesIO(payload))
+            # Keep the tile size of the stream, a keyframe resets the whole buffer
+            self._ensure_buffer(width, height, self._tile or 1)
+            self.frame[...] = np.asarray(img.convert("RGB"))
+            return self.frame
+
+        if codec != CODEC_TILES:
+            raise ValueError(f"Unknown codec {codec}")
+        if self._buffer is None:
+            raise ValueError("Tile frame received before a keyframe")
+
+        tile, n_tiles, mosaic_cols = _TILES_HEADER.unpack_from(payload)
+        if tile != self._tile:
+            # First tile frame after a keyframe, re-layout the buffer for this tile size
+            frame = self.frame.copy()
+            self._ensure_buffer(width, height, tile)
+            self.frame[...] = frame
+        if n_tiles == 0:
+            return self.frame
+
+        offset = _TILES_HEADER.size
+        coords = np.frombuffer(payload, dtype="<u2", count=n_tiles * 2, offset=offset)
+        coords = coords.reshape(n_tiles, 2)
+        offset += n_tiles * _TILE_COORD.size
+
+        mosaic = np.asarray(
+            Image.open(io.BytesIO(payload[offset:])).convert("RGB")
+        )
+        mosaic_rows = mosaic.shape[0] // tile
+        tiles = (
+            _tiles_view(mosaic, tile).reshape(mosaic_rows * mosaic_cols, tile, tile, 3)
+        )
+        _tiles_view(self._buffer, tile)[coords[:, 1], coords[:, 0]] = tiles[:n_tiles]
+        return self.frame
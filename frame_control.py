@@ -0,0 +1,168 @@
+"""
+Adaptive quality / resolution / frame rate control for the s7 streamer.
+
+The client acknowledges every frame ("ack <frame_id> <receive time ns>"). Round
+trip latency is measured on the server clock, from sending a frame to getting its
+ack, so the two machines' clocks never have to agree. Throughput is the number of
+acknowledged bytes per second.
+
+Every `interval` seconds the controller compares the smoothed latency with the
+latency budget:
+
+    over budget           step down: JPEG quality, then the downscale factor,
+                          then the target fps
+    under `headroom` x    step back up in reverse order: fps, scale, quality
+    budget
+
+Each decision is recorded in `history` so it can be plotted while tuning.
+"""
+
+import csv
+import time
+import threading
+
+QUALITIES = [20, 30, 40, 50, 60, 70, 80]
+SCALES = [0.25, 0.5, 0.75, 1.0]
+FRAME_RATES = [5, 10, 15, 20, 30, 45, 60]
+
+
+class AdaptiveController:
+    def __init__(
+        self,
+        latency_budget_ms=100.0,
+        interval=0.5,
+        headroom=0.6,
+        smoothing=0.2,
+        max_in_flight=8,
+        quality=50,
+        scale=1.0,
+        fps=30,
+    ):
+        self.latency_budget_ms = latency_budget_ms
+        self.interval = interval
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.max_in_flight = max_in_flight
+        self._quality = QUALITIES.index(quality)
+        self._scale = SCALES.index(scale)
+        self._fps = FRAME_RATES.index(fps)
+
+        self._lock = threading.Lock()
+        self._sent = {}  # frame_id -> (send time ns, bytes)
+        self._acked_bytes = 0
+        self._latency_ms = None
+        self._window_start = time.perf_counter()
+        self._start = self._window_start
+        self.history = []
+
+    @property
+    def quality(self):
+        return QUALITIES[self._quality]
+
+    @property
+    def scale(self):
+        return SCALES[self._scale]
+
+    @property
+    def fps(self):
+        return FRAME_RATES[self._fps]
+
+    @property
+    def in_flight(self):
+        return len(self._sent)
+
+    def can_send(self):
+        """False while too many frames are unacknowledged, the link is backed up."""
+        return self.in_flight < self.max_in_flight
+
+    def on_sent(self, frame_id, n_bytes):
+        with self._lock:
+            self._sent[frame_id] = (time.perf_counter_ns(), n_bytes)
+
+    def on_ack(self, frame_id, receive_ns=None):
+        now = time.perf_counter_ns()
+        with self._lock:
+            sent = self._sent.pop(frame_id, None)
+            if sent is None:
+                return
+            # Anything older than an acknowledged frame will not be acked anymore
+            for stale in [f for f in self._sent if f < frame_id]:
+                del self._sent[stale]
+            send_ns, n_bytes = sent
+            rtt_ms = (now - send_ns) / 1e6
+            if self._latency_ms is None:
+                self._latency_ms = rtt_ms
+            else:
+                self._latency_ms += self.smoothing * (rtt_ms - self._latency_ms)
+            self._acked_bytes += n_bytes
+
+    def update(self):
+        """Adjust the settings if `interval` has passed, returns True if it did."""
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return False
+
+        with self._lock:
+            latency = self._latency_ms
+            throughput = self._acked_bytes / elapsed
+            self._acked_bytes = 0
+            in_flight = len(self._sent)
+            # Frames that were never acked count as late as they are old
+            if self._sent:
+                oldest_ns = min(send_ns for send_ns, _ in self._sent.values())
+                pending_ms = (time.perf_counter_ns() - oldest_ns) / 1e6
+                latency = max(latency or 0.0, pending_ms)
+        self._window_start = now
+
+        decision = "hold"
+        if latency is not None and latency > self.latency_budget_ms:
+            decision = self._step_down()
+        elif latency is not None and latency < self.latency_budget_ms * self.headroom:
+            decision = self._step_up()
+
+        self.history.append(
+            {
+                "t_s": now - self._start,
+                "latency_ms": latency,
+                "throughput_mb_s": throughput / 1024 / 1024,
+                "in_flight": in_flight,
+                "quality": self.quality,
+                "scale": self.scale,
+                "fps": self.fps,
+                "decision": decision,
+            }
+        )
+        return True
+
+    def _step_down(self):
+        if self._quality > 0:
+            self._quality -= 1
+            return "quality-"
+        if self._scale > 0:
+            self._scale -= 1
+            return "scale-"
+        if self._fps > 0:
+            self._fps -= 1
+            return "fps-"
+        return "floor"
+
+    def _step_up(self):
+        if self._fps < len(FRAME_RATES) - 1:
+            self._fps += 1
+            return "fps+"
+        if self._scale < len(SCALES) - 1:
+            self._scale += 1
+            return "scale+"
+        if self._quality < len(QUALITIES) - 1:
+            self._quality += 1
+            return "quality+"
+        return "ceiling"
+
+    def write_history(self, path):
+        if not self.history:
+            return
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.history[0]))
+            writer.writeheader()
+            writer.writerows(self.history)
@@ -0,0 +1,217 @@
+"""
+Pipelined capture -> encode -> send for the s7 frame streamer.
+
+The sequential loop in s7 runs all three stages back to back, so its frame rate is
+bounded by the sum of their latencies. Here each stage runs on its own:
+
+    capture thread --capture queue--> encoder pool --send queue--> sender
+
+The queues are bounded. When encoding or sending falls behind, the capture queue
+drops its oldest frame so the stream stays current instead of building latency.
+Frames leave the encoder pool in capture order.
+
+Per-stage timings show which stage limits the frame rate.
+"""
+
+import io
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+
+def encode_jpeg(img, quality=50):
+    """Encode a PIL image, returns (jpeg bytes, encode time in ms). Picklable."""
+    start = time.perf_counter()
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue(), (time.perf_counter() - start) * 1000
+
+
+class StageTimer:
+    """Collects per-frame timings of one stage in milliseconds."""
+
+    def __init__(self, name):
+        self.name = name
+        self.times_ms = []
+
+    def add(self, ms):
+        self.times_ms.append(ms)
+
+    def summary(self) -> dict:
+        if not self.times_ms:
+            return {"frames": 0}
+        t = np.asarray(self.times_ms)
+        return {
+            "frames": len(t),
+            "mean_ms": float(t.mean()),
+            "p50_ms": float(np.percentile(t, 50)),
+            "p95_ms": float(np.percentile(t, 95)),
+            "max_ms": float(t.max()),
+        }
+
+
+class FramePipeline:
+    """
+    Streams `frame_count` frames through capture, encode and send stages.
+
+    `capture()` returns a PIL image, `send(frame_id, capture_ns, img_size, data)`
+    puts the encoded bytes on the wire and returns how many bytes it sent.
+    `capture_ns` is read from `clock()` right before capturing, time.time_ns by
+    default. With `fps` set, capture is paced to that rate instead of running
+    flat out.
+    `encoder_kind` is "thread" or "process"; Pillow releases the GIL while
+    encoding, so threads usually suffice and avoid pickling every frame.
+    """
+
+    def __init__(
+        self,
+        capture,
+        send,
+        encoders=4,
+        encoder_kind="thread",
+        quality=50,
+        capture_queue_size=4,
+        send_queue_size=None,
+        clock=time.time_ns,
+        fps=None,
+    ):
+        self.capture = capture
+        self.clock = clock
+        self.fps = fps
+        self.send = send
+        self.encoders = encoders
+        self.encoder_kind = encoder_kind
+        self.quality = quality
+        self.capture_queue_size = capture_queue_size
+        self.send_queue_size = send_queue_size or encoders * 2
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """Stop capturing, run() sends the frames already captured and returns."""
+        self._stopping.set()
+
+    def run(self, frame_count: int) -> dict:
+        capture_queue = queue.Queue(maxsize=self.capture_queue_size)
+        send_queue = queue.Queue(maxsize=self.send_queue_size)
+        timers = {
+            name: StageTimer(name)
+            for name in ("capture", "encode", "send", "capture_to_sent")
+        }
+        counters = {"captured": 0, "dropped": 0, "sent": 0, "bytes": 0}
+        stop = object()
+        errors = []
+        self._stopping.clear()
+
+        def capture_loop():
+            try:
+                first = time.perf_counter()
+                for frame_id in range(frame_count):
+                    if self.fps:
+                        delay = first + frame_id / self.fps - time.perf_counter()
+                        if delay > 0:
+                            self._stopping.wait(delay)
+                    if self._stopping.is_set():
+                        break
+                    start = time.perf_counter()
+                    capture_ns = self.clock()
+                    img = self.capture()
+                    timers["capture"].add((time.perf_counter() - start) * 1000)
+                    counters["captured"] += 1
+                    item = (frame_id, capture_ns, start, img)
+                    # Drop the oldest waiting frame rather than blocking capture
+                    while True:
+                        try:
+                            capture_queue.put_nowait(item)
+                            break
+                        except queue.Full:
+                            try:
+                                capture_queue.get_nowait()
+                                counters["dropped"] += 1
+                            except queue.Empty:
+                                pass
+            except Exception as e:
+                # Re-raised by run() once the other stages have wound down
+                errors.append(e)
+            finally:
+                capture_queue.put(stop)
+
+        def dispatch_loop(executor):
+            while True:
+                item = capture_queue.get()
+                if item is stop:
+                    send_queue.put(stop)
+                    return
+                frame_id, capture_ns, start, img = item
+                future = executor.submit(encode_jpeg, img, self.quality)
+                # Blocks when the encoders are saturated, which backs up capture
+                send_queue.put((frame_id, capture_ns, start, img.size, future))
+
+        executor_cls = (
+            ProcessPoolExecutor if self.encoder_kind == "process" else ThreadPoolExecutor
+        )
+        start_time = time.perf_counter()
+        with executor_cls(max_workers=self.encoders) as executor:
+            threads = [
+                threading.Thread(target=capture_loop, daemon=True),
+                threading.Thread(target=dispatch_loop, args=(executor,), daemon=True),
+            ]
+            for t in threads:
+                t.start()
+
+            # Send on the calling thread, in capture order
+            while True:
+                item = send_queue.get()
+                if item is stop:
+                    break
+                frame_id, capture_ns, start, size, future = item
+                data, encode_ms = future.result()
+                timers["encode"].add(encode_ms)
+                send_start = time.perf_counter()
+                sent = self.send(frame_id, capture_ns, size, data)
+                now = time.perf_counter()
+                timers["send"].add((now - send_start) * 1000)
+                timers["capture_to_sent"].add((now - start) * 1000)
+                counters["sent"] += 1
+                counters["bytes"] += sent
+
+            for t in threads:
+                t.join()
+
+        if errors:
+            raise errors[0]
+
+        duration = time.perf_counter() - start_time
+        stats = dict(counters)
+        stats["duration_s"] = duration
+        stats["fps"] = counters["sent"] / duration if duration > 0 else 0.0
+        stats["mb_per_s"] = counters["bytes"] / 1024 / 1024 / duration if duration > 0 else 0.0
+        stats["stages"] = {name: timer.summary() for name, timer in timers.items()}
+        stats["bottleneck"] = self._bottleneck(stats["stages"])
+        return stats
+
+    def _bottleneck(self, stages) -> str:
+        # Encoding is spread over the pool, the other stages are single threaded
+        capacity = {
+            "capture": stages["capture"].get("mean_ms", 0),
+            "encode": stages["encode"].get("mean_ms", 0) / self.encoders,
+            "send": stages["send"].get("mean_ms", 0),
+        }
+        return max(capacity, key=capacity.get)
+
+
+def format_stats(stats: dict) -> str:
+    lines = [
+        f"Performance: {stats['fps']:.1f} avg fps, {stats['mb_per_s']:.1f} avg MB/s, "
+        f"{stats['sent']} sent, {stats['dropped']} dropped",
+    ]
+    for name, s in stats["stages"].items():
+        if s["frames"]:
+            lines.append(
+                f"  {name:>15} (ms): mean={s['mean_ms']:.1f}, p50={s['p50_ms']:.1f}, "
+                f"p95={s['p95_ms']:.1f}, max={s['max_ms']:.1f}"
+            )
+    lines.append(f"  Bottleneck: {stats['bottleneck']}")
+    return "\n".join(lines)
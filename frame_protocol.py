@@ -0,0 +1,103 @@
+"""
+Binary frame messages for the s7 streaming nodes.
+
+Each frame is sent as one binary websocket message: a fixed FRAME_HEADER followed
+by the encoded image bytes.
+
+    magic       2s   b"OF"
+    version     B
+    codec       B    CODEC_* below
+    frame_id    I
+    capture_ns  q    time.time_ns() when the frame was captured
+    width       H
+    height      H
+
+Compared to base64 text messages this saves a third of the bandwidth, and both
+ends avoid copying the payload: the server hands the header and the encoded buffer
+to the socket with a single scatter/gather send, and the client reads the payload
+through a memoryview of the received message.
+"""
+
+import struct
+from collections import namedtuple
+
+FRAME_MAGIC = b"OF"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBBIqHH")
+
+CODEC_JPEG = 1
+CODEC_TILES = 2  # changed tiles only, see frame_codecs.py
+CODEC_NAMES = {CODEC_JPEG: "jpeg", CODEC_TILES: "tiles"}
+
+FrameHeader = namedtuple(
+    "FrameHeader", ["codec", "frame_id", "capture_ns", "width", "height"]
+)
+
+# websocket framing, see RFC 6455 section 5.2
+_FIN = 0x80
+_OPCODE_BINARY = 0x2
+
+
+def pack_frame_header(frame_id, capture_ns, width, height, codec=CODEC_JPEG) -> bytes:
+    return FRAME_HEADER.pack(
+        FRAME_MAGIC, FRAME_VERSION, codec, frame_id & 0xFFFFFFFF, capture_ns, width, height
+    )
+
+
+def is_frame_message(message) -> bool:
+    return (
+        isinstance(message, (bytes, bytearray, memoryview))
+        and len(message) >= FRAME_HEADER.size
+        and bytes(message[:2]) == FRAME_MAGIC
+    )
+
+
+def unpack_frame(message):
+    """Split a binary frame message into its FrameHeader and a zero-copy payload view."""
+    view = memoryview(message)
+    magic, version, codec, frame_id, capture_ns, width, height = FRAME_HEADER.unpack_from(
+        view
+    )
+    if magic != FRAME_MAGIC:
+        raise ValueError("Not a frame message")
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    header = FrameHeader(codec, frame_id, capture_ns, width, height)
+    return header, view[FRAME_HEADER.size :]
+
+
+def _websocket_header(payload_length: int) -> bytes:
+    if payload_length <= 125:
+        return bytes([_FIN | _OPCODE_BINARY, payload_length])
+    if payload_length <= 0xFFFF:
+        return bytes([_FIN | _OPCODE_BINARY, 126]) + struct.pack(">H", payload_length)
+    return bytes([_FIN | _OPCODE_BINARY, 127]) + struct.pack(">Q", payload_length)
+
+
+def send_binary(client, *buffers) -> int:
+    """
+    Send `buffers` as one binary message to a websocket_server client.
+
+    websocket_server only sends text messages, so the frame is written to the
+    client's socket directly, under the handler's send lock. Returns the number of
+    payload bytes sent.
+    """
+    handler = client["handler"]
+    sock = handler.request
+    payload_length = sum(len(buf) for buf in buffers)
+    buffers = (_websocket_header(payload_length),) + buffers
+
+    with handler._send_lock:
+        if hasattr(sock, "sendmsg"):
+            sent = sock.sendmsg(buffers)
+            # sendmsg may stop early on large frames, finish with sendall
+            for buf in buffers:
+                if sent >= len(buf):
+                    sent -= len(buf)
+                    continue
+                sock.sendall(memoryview(buf)[sent:])
+                sent = 0
+        else:
+            for buf in buffers:
+                sock.sendall(buf)
+    return payload_length
@@ -0,0 +1,281 @@
+"""
+Client side receive pipeline for the s7 streamer.
+
+The websocket thread only parses the frame header and queues the payload, so a slow
+decode never stalls the socket:
+
+    websocket thread --one queue per worker--> decode workers --> latest frame slot
+                                                              +-> history ring
+
+Full JPEG frames are spread round robin over the workers. Tile frames only patch
+the frame before them, so once a tile stream starts every frame goes to the first
+worker, in order. The queues are bounded and drop their oldest frame when a worker
+falls behind. Tile frames cannot be dropped one at a time, so once a tile stream
+starts the first worker's queue grows to `tile_queue_size`; if it still fills up,
+every frame until the next keyframe is dropped (counted in `dropped`, the number of
+times it happened in `resyncs`). A keyframe replaces everything still queued before
+it, so the tiles decoded after it always patch the frame they were made for.
+
+Each worker decodes into its own ring of preallocated arrays (with simplejpeg
+installed the JPEG is decoded straight into them, otherwise Pillow decodes and the
+result is copied in). A frame is published as `latest` only if it is newer than
+the current one. Readers never take a lock: `latest` is a single reference swap.
+Arrays are reused, a DecodedFrame stays valid for at least `history + 1` newer
+frames, copy the image to keep it longer.
+
+Latency is reported from the server's capture timestamp to the decoded array being
+ready (needs the two clocks in sync, e.g. both on NTP), and from the message
+arriving to ready, which only uses the client clock.
+"""
+
+import io
+import time
+import queue
+import threading
+from collections import deque, namedtuple
+
+import numpy as np
+from PIL import Image
+
+from frame_codecs import FrameDecoder
+from frame_pipeline import StageTimer
+from frame_protocol import CODEC_JPEG, CODEC_TILES
+
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+DecodedFrame = namedtuple(
+    "DecodedFrame", ["seq", "frame_id", "codec", "capture_ns", "ready_ns", "image"]
+)
+
+
+def decode_jpeg_into(payload, out):
+    """Decode a JPEG into the (height, width, 3) uint8 array `out`."""
+    if simplejpeg is not None:
+        try:
+            simplejpeg.decode_jpeg(payload, colorspace="RGB", buffer=out)
+            return out
+        except ValueError:
+            pass  # e.g. size mismatch, let Pillow report it
+    img = Image.open(io.BytesIO(payload))
+    out[...] = np.asarray(img.convert("RGB"))
+    return out
+
+
+class _Worker:
+    def __init__(self, ring_size, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.ring_size = ring_size
+        self.ring = []
+        self.next_slot = 0
+        self.tile_decoder = None
+
+    def buffer(self, width, height):
+        shape = (height, width, 3)
+        if not self.ring or self.ring[0].shape != shape:
+            self.ring = [np.empty(shape, dtype=np.uint8) for _ in range(self.ring_size)]
+            self.next_slot = 0
+        out = self.ring[self.next_slot]
+        self.next_slot = (self.next_slot + 1) % self.ring_size
+        return out
+
+
+class FrameReceiver:
+    def __init__(self, workers=2, history=0, queue_size=2, tile_queue_size=8):
+        self.history_size = history
+        self.tile_queue_size = max(queue_size, tile_queue_size)
+        self._workers = [_Worker(history + 2, queue_size) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._decode_loop, args=(w,), daemon=True)
+            for w in self._workers
+        ]
+        self._stop = object()
+
+        # Written by the websocket thread only
+        self._seq = 0
+        self._next_worker = 0
+        self._tile_stream = False
+        self._resync = False
+        self._last_keyframe = None
+
+        # Written by the workers under _publish_lock, read lock-free
+        self._publish_lock = threading.Lock()
+        self._latest = None
+        self._history = deque(maxlen=history) if history else None
+
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+        for t in self._threads:
+            t.start()
+
+    @property
+    def latest(self):
+        """Newest decoded frame, or None before the first one."""
+        return self._latest
+
+    @property
+    def history(self):
+        """Up to `history` frames published before `latest`, oldest first."""
+        return list(self._history) if self._history is not None else []
+
+    def _reset_stats(self):
+        self._counters = {
+            "received": 0,
+            "dropped": 0,
+            "resyncs": 0,
+            "decoded": 0,
+            "stale": 0,
+            "errors": 0,
+        }
+        self._timers = {
+            name: StageTimer(name)
+            for name in ("decode", "receive_to_ready", "capture_to_ready")
+        }
+        self._window_start = time.perf_counter()
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._counters[name] += n
+
+    def submit(self, header, payload):
+        """Queue a frame for decoding; `header, payload` as from unpack_frame."""
+        received = time.perf_counter_ns()
+        self._seq += 1
+        self._count("received")
+
+        item = (self._seq, header, payload, received)
+        if header.codec == CODEC_JPEG:
+            self._resync = False
+            self._last_keyframe = item
+        elif header.codec == CODEC_TILES and not self._tile_stream:
+            self._tile_stream = True
+            tile_queue = self._workers[0].queue
+            with tile_queue.mutex:
+                tile_queue.maxsize = self.tile_queue_size
+            # The keyframe these tiles patch may have gone to another worker
+            if self._last_keyframe is not None:
+                self._put(self._workers[0], self._last_keyframe)
+
+        if self._tile_stream:
+            if self._resync:
+                self._count("dropped")
+                return
+            self._put(self._workers[0], item)
+        else:
+            self._put(self._workers[self._next_worker], item)
+            self._next_worker = (self._next_worker + 1) % len(self._workers)
+
+    def _put(self, worker, item):
+        if self._tile_stream and item[1].codec == CODEC_TILES:
+            try:
+                worker.queue.put_nowait(item)
+            except queue.Full:
+                # Later tiles patch this frame, skip ahead to the next keyframe
+                self._resync = True
+                self._count("dropped")
+                self._count("resyncs")
+            return
+        if self._tile_stream:
+            # Queued tiles patch frames before this keyframe, dropping only some of
+            # them would corrupt the frames after it. Nothing queued is needed.
+            while True:
+                try:
+                    dropped = worker.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if dropped is not item:
+                    self._count("dropped")
+            worker.queue.put_nowait(item)
+            return
+        # Drop the oldest waiting frame rather than blocking the socket
+        while True:
+            try:
+                worker.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    worker.queue.get_nowait()
+                    self._count("dropped")
+                except queue.Empty:
+                    pass
+
+    def _decode_loop(self, worker):
+        while True:
+            item = worker.queue.get()
+            if item is self._stop:
+                return
+            seq, header, payload, received = item
+            start = time.perf_counter_ns()
+            try:
+                out = worker.buffer(header.width, header.height)
+                if self._tile_stream:
+                    if worker.tile_decoder is None:
+                        worker.tile_decoder = FrameDecoder()
+                    frame = worker.tile_decoder.decode(
+                        header.codec, header.width, header.height, payload
+                    )
+                    out[...] = frame
+                else:
+                    decode_jpeg_into(payload, out)
+            except Exception as e:
+                self._count("errors")
+                print("[RECEIVER] Failed to decode frame:", e)
+                continue
+
+            ready_ns = time.time_ns()
+            done = time.perf_counter_ns()
+            frame = DecodedFrame(
+                seq, header.frame_id, header.codec, header.capture_ns, ready_ns, out
+            )
+            with self._publish_lock:
+                latest = self._latest
+                published = latest is None or seq > latest.seq
+                if published:
+                    if self._history is not None and latest is not None:
+                        self._history.append(latest)
+                    self._latest = frame
+
+            with self._stats_lock:
+                self._counters["decoded"] += 1
+                if not published:
+                    self._counters["stale"] += 1
+                self._timers["decode"].add((done - start) / 1e6)
+                self._timers["receive_to_ready"].add((done - received) / 1e6)
+                self._timers["capture_to_ready"].add((ready_ns - header.capture_ns) / 1e6)
+
+    def stats(self, reset=False) -> dict:
+        with self._stats_lock:
+            duration = time.perf_counter() - self._window_start
+            stats = dict(self._counters)
+            stats["duration_s"] = duration
+            stats["fps"] = stats["decoded"] / duration if duration > 0 else 0.0
+            stats["queued"] = sum(w.queue.qsize() for w in self._workers)
+            stats["stages"] = {name: t.summary() for name, t in self._timers.items()}
+            if reset:
+                self._reset_stats()
+        return stats
+
+    def close(self):
+        for worker in self._workers:
+            worker.queue.put(self._stop)
+        for t in self._threads:
+            t.join(timeout=1)
+
+
+def format_receiver_stats(stats: dict) -> str:
+    lines = [
+        f"Received {stats['received']}, decoded {stats['decoded']} "
+        f"({stats['fps']:.1f} fps), dropped {stats['dropped']} "
+        f"({stats['resyncs']} tile resyncs), "
+        f"stale {stats['stale']}, errors {stats['errors']}, queued {stats['queued']}"
+    ]
+    for name, s in stats["stages"].items():
+        if s["frames"]:
+            lines.append(
+                f"  {name:>16} (ms): mean={s['mean_ms']:.1f}, p50={s['p50_ms']:.1f}, "
+                f"p95={s['p95_ms']:.1f}, max={s['max_ms']:.1f}"
+            )
+    return "\n".join(lines)
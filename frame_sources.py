@@ -0,0 +1,184 @@
+"""
+Frame sources for the s7 streamer.
+
+Every source has `grab(width, height)` returning a PIL RGB image of that size, and
+`prepare(width, height)` to do any one-off work (generating or decoding frames)
+before a timed run:
+
+    screen               PIL.ImageGrab of the top left region of the screen
+    synthetic:<pattern>  generated frames, `noise`, `gradient`, `text` (scrolling
+                         lines of text) or `desktop` (static text with a moving
+                         cursor), deterministic for a given seed
+    video:<path>         frames decoded from a recorded video (needs opencv-python),
+                         looped and resized to the requested resolution
+
+The synthetic and video sources need no display, so the streaming benchmark can
+run headless and give the same input on every run.
+"""
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+class ScreenSource:
+    name = "screen"
+
+    def __init__(self):
+        from PIL import ImageGrab
+
+        self._grab = ImageGrab.grab
+
+    def prepare(self, width, height):
+        pass
+
+    def grab(self, width, height):
+        return self._grab(bbox=(0, 0, width, height))
+
+
+class SyntheticSource:
+    """
+    Cycles through `cycle` generated frames per resolution. Frames are generated
+    once up front so grabbing costs about as little as a screen grab.
+    """
+
+    PATTERNS = ["noise", "gradient", "text", "desktop"]
+
+    def __init__(self, pattern="gradient", seed=0, cycle=30):
+        if pattern not in self.PATTERNS:
+            raise ValueError(f"Unknown pattern '{pattern}', choose from {self.PATTERNS}")
+        self.name = f"synthetic:{pattern}"
+        self.pattern = pattern
+        self.seed = seed
+        self.cycle = cycle
+        self._frames = {}
+        self._index = 0
+
+    def prepare(self, width, height):
+        if (width, height) not in self._frames:
+            self._frames[(width, height)] = self._generate(width, height)
+
+    def grab(self, width, height):
+        self.prepare(width, height)
+        frames = self._frames[(width, height)]
+        frame = frames[self._index % len(frames)]
+        self._index += 1
+        return Image.fromarray(frame)
+
+    def _generate(self, width, height):
+        rng = np.random.default_rng(self.seed)
+        if self.pattern == "noise":
+            return [
+                rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+                for _ in range(self.cycle)
+            ]
+
+        if self.pattern == "gradient":
+            x = np.arange(width, dtype=np.float32)[None, :]
+            y = np.arange(height, dtype=np.float32)[:, None]
+            frames = []
+            for i in range(self.cycle):
+                shift = i * width / self.cycle
+                frame = np.empty((height, width, 3), dtype=np.uint8)
+                frame[..., 0] = ((x + shift) * 255 / width) % 256
+                frame[..., 1] = (y * 255 / height) % 256
+                frame[..., 2] = ((x + y + 2 * shift) * 127 / (width + height)) % 256
+                frames.append(frame)
+            return frames
+
+        if self.pattern == "desktop":
+            # Mostly static content, only a cursor moves
+            background = self._text_frames(rng, width, height, 1)[0]
+            frames = []
+            for i in range(self.cycle):
+                frame = background.copy()
+                x = int((i + 0.5) * (width - 16) / self.cycle)
+                y = int(height / 2 + height / 4 * np.sin(2 * np.pi * i / self.cycle))
+                frame[y : y + 16, x : x + 12] = (0, 0, 0)
+                frames.append(frame)
+            return frames
+
+        return self._text_frames(rng, width, height, self.cycle)
+
+    def _text_frames(self, rng, width, height, count):
+        # Scrolling text on a light background, like a terminal or editor
+        line_height = 16
+        words = ["frame", "stream", "encode", "capture", "socket", "obs", "mouse", "key"]
+        lines = [
+            " ".join(rng.choice(words, size=max(1, width // 60)))
+            for _ in range(height // line_height + count + 1)
+        ]
+        frames = []
+        for i in range(count):
+            img = Image.new("RGB", (width, height), (250, 250, 245))
+            draw = ImageDraw.Draw(img)
+            for row in range(height // line_height + 1):
+                draw.text((8, row * line_height), lines[row + i], fill=(20, 20, 20))
+            frames.append(np.asarray(img))
+        return frames
+
+
+class VideoSource:
+    """Decodes frames from a video file once per resolution, then loops them."""
+
+    def __init__(self, path, max_frames=300):
+        try:
+            import cv2
+        except ImportError:
+            raise ImportError(
+                "Video frame source needs opencv, run `pip install opencv-python`"
+            )
+        self.name = f"video:{path}"
+        self._cv2 = cv2
+        self.path = path
+        self.max_frames = max_frames
+        self._raw = None
+        self._frames = {}
+        self._index = 0
+
+    def _read(self):
+        cv2 = self._cv2
+        capture = cv2.VideoCapture(self.path)
+        if not capture.isOpened():
+            raise OSError(f"Could not open video '{self.path}'")
+        frames = []
+        try:
+            while len(frames) < self.max_frames:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        finally:
+            capture.release()
+        if not frames:
+            raise OSError(f"No frames decoded from '{self.path}'")
+        return frames
+
+    def prepare(self, width, height):
+        if self._raw is None:
+            self._raw = self._read()
+        if (width, height) not in self._frames:
+            self._frames[(width, height)] = [
+                self._cv2.resize(f, (width, height), interpolation=self._cv2.INTER_AREA)
+                for f in self._raw
+            ]
+
+    def grab(self, width, height):
+        self.prepare(width, height)
+        frames = self._frames[(width, height)]
+        frame = frames[self._index % len(frames)]
+        self._index += 1
+        return Image.fromarray(frame)
+
+
+def make_frame_source(spec: str = "screen", seed: int = 0):
+    """Build a source from `screen`, `synthetic:<pattern>` or `video:<path>`."""
+    kind, _, arg = spec.partition(":")
+    if kind == "screen":
+        return ScreenSource()
+    if kind == "synthetic":
+        return SyntheticSource(arg or "gradient", seed=seed)
+    if kind == "video":
+        if not arg:
+            raise ValueError("video source needs a path, e.g. video:recording.mp4")
+        return VideoSource(arg)
+    raise ValueError(f"Unknown frame source '{spec}'")
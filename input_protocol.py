@@ -0,0 +1,413 @@
+"""
+Binary, batched input events for the s6 test nodes.
+
+Instead of one text message per pynput callback, the client packs every event
+into a fixed-width INPUT_RECORD and sends all events of a 1-4 ms window as one
+binary websocket message:
+
+    batch header     8 bytes
+        magic        2s   b"OI"
+        version      B
+        reserved     x
+        count        I    number of records that follow
+    count x INPUT_RECORD, 24 bytes each
+        time_ns      q    time.time_ns() when the callback fired
+        x, y         i i  pointer position
+        code         H    uiohook keycode (as in KEY_NAMES) or mouse button
+        dx, dy       h h  scroll amount
+        type         B    INPUT_* below
+        flags        B    FLAG_* below
+
+The server decodes a batch straight into a numpy structured array (INPUT_DTYPE).
+`events_to_dataframe` turns that into the recorded csv columns, so the stream can
+be written with event_log.write_events or down sampled by s4 like a recording.
+
+websocket_server drops binary messages from clients, BinaryWebsocketServer adds
+them.
+"""
+
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from websocket_server import WebsocketServer
+from websocket_server.websocket_server import (
+    MASKED,
+    OPCODE,
+    OPCODE_BINARY,
+    OPCODE_CLOSE_CONN,
+    OPCODE_CONTINUATION,
+    OPCODE_PING,
+    OPCODE_PONG,
+    OPCODE_TEXT,
+    PAYLOAD_LEN,
+    WebSocketHandler,
+    logger,
+)
+
+from uiohook_keys import BUTTON_NAMES, KEY_NAMES
+
+INPUT_MAGIC = b"OI"
+INPUT_VERSION = 1
+BATCH_HEADER = struct.Struct("<2sBxI")
+INPUT_RECORD = struct.Struct("<qiiHhhBB")
+
+INPUT_DTYPE = np.dtype(
+    [
+        ("time_ns", "<i8"),
+        ("x", "<i4"),
+        ("y", "<i4"),
+        ("code", "<u2"),
+        ("dx", "<i2"),
+        ("dy", "<i2"),
+        ("type", "u1"),
+        ("flags", "u1"),
+    ]
+)
+assert INPUT_DTYPE.itemsize == INPUT_RECORD.size
+
+INPUT_MOUSE_MOVE = 1
+INPUT_MOUSE_CLICK = 2
+INPUT_MOUSE_SCROLL = 3
+INPUT_KEY = 4
+INPUT_NAMES = {
+    INPUT_MOUSE_MOVE: "mouse_move",
+    INPUT_MOUSE_CLICK: "mouse_click",
+    INPUT_MOUSE_SCROLL: "mouse_scroll",
+    INPUT_KEY: "key",
+}
+
+FLAG_PRESSED = 0x1
+# The key is not in KEY_NAMES, `code` holds the pynput virtual key code instead
+FLAG_UNMAPPED = 0x2
+
+# Unmapped keys are recorded as this plus their virtual key code, past every 16 bit
+# uiohook keycode, so each still has a keycode of its own for s4's pressed state
+UNMAPPED_KEYCODE_OFFSET = 0x10000
+
+# uiohook reports vertical / horizontal wheel events with these directions
+WHEEL_VERTICAL = 3
+WHEEL_HORIZONTAL = 4
+
+# By character or pynput Key / Button name, so pynput is only needed by the client
+_KEY_CODES = {}
+for _code, _name in KEY_NAMES.items():
+    _KEY_CODES.setdefault(_name, _code)
+_BUTTON_CODES = {name: code for code, name in BUTTON_NAMES.items()}
+
+
+def key_code(key):
+    """Returns (code, flags) for a pynput key."""
+    char = getattr(key, "char", None)
+    code = _KEY_CODES.get(char.lower() if char else getattr(key, "name", None))
+    if code is not None:
+        return code, 0
+    vk = getattr(key, "vk", None) or getattr(getattr(key, "value", None), "vk", None)
+    return (vk or 0) & 0xFFFF, FLAG_UNMAPPED
+
+
+def button_code(button):
+    return _BUTTON_CODES.get(getattr(button, "name", None), 0)
+
+
+def pack_batch(records, count) -> bytes:
+    """`records` is the concatenation of `count` packed INPUT_RECORDs."""
+    return BATCH_HEADER.pack(INPUT_MAGIC, INPUT_VERSION, count) + records
+
+
+def decode_batch(message) -> np.ndarray:
+    """Decode a batch message into an INPUT_DTYPE array (a view of `message`)."""
+    magic, version, count = BATCH_HEADER.unpack_from(message)
+    if magic != INPUT_MAGIC:
+        raise ValueError("Not an input batch")
+    if version != INPUT_VERSION:
+        raise ValueError(f"Unsupported input batch version {version}")
+    return np.frombuffer(
+        message, dtype=INPUT_DTYPE, count=count, offset=BATCH_HEADER.size
+    )
+
+
+def events_to_dataframe(events: np.ndarray):
+    """Build a DataFrame with the recorded csv columns from INPUT_DTYPE events."""
+    import pandas as pd
+
+    from event_log import COLUMNS
+
+    n = len(events)
+    kind = events["type"]
+    pressed = (events["flags"] & FLAG_PRESSED) != 0
+    is_key = kind == INPUT_KEY
+    is_click = kind == INPUT_MOUSE_CLICK
+    is_scroll = kind == INPUT_MOUSE_SCROLL
+    is_mouse = ~is_key
+
+    event_type = np.full(n, np.nan, dtype=object)
+    event_type[kind == INPUT_MOUSE_MOVE] = "mouse_moved"
+    event_type[is_click & pressed] = "mouse_pressed"
+    event_type[is_click & ~pressed] = "mouse_released"
+    event_type[is_scroll] = "mouse_wheel"
+    event_type[is_key & pressed] = "key_pressed"
+    event_type[is_key & ~pressed] = "key_released"
+
+    def where(mask, values):
+        return np.where(mask, values.astype("float64"), np.nan)
+
+    code = events["code"]
+    unmapped = (events["flags"] & FLAG_UNMAPPED) != 0
+    keycode = np.where(unmapped, code.astype("i4") + UNMAPPED_KEYCODE_OFFSET, code)
+    vertical = events["dy"] != 0
+    data = {
+        "time": events["time_ns"] // 1_000_000,
+        "event_source": np.full(n, np.nan, dtype=object),
+        "event_type": event_type,
+        "x": where(is_mouse, events["x"]),
+        "y": where(is_mouse, events["y"]),
+        "button": where(is_click, code),
+        "clicks": np.full(n, np.nan),
+        # Keys outside KEY_NAMES are numbered after their vk, also kept as rawcode
+        "keycode": where(is_key, keycode),
+        "rawcode": where(is_key & unmapped, code),
+        "char": np.full(n, np.nan, dtype=object),
+        "mask": np.full(n, np.nan),
+        "wheel_amount": np.full(n, np.nan),
+        "wheel_direction": where(
+            is_scroll, np.where(vertical, WHEEL_VERTICAL, WHEEL_HORIZONTAL)
+        ),
+        # pynput scrolls up with a positive dy, uiohook with a negative rotation
+        "wheel_rotation": where(
+            is_scroll, np.where(vertical, -events["dy"], events["dx"])
+        ),
+    }
+    return pd.DataFrame({name: data[name] for name in COLUMNS})
+
+
+def _percentiles(values, scale=1) -> str:
+    if not values:
+        return "n/a"
+    v = np.asarray(values) / scale
+    return (
+        f"mean={v.mean():.1f}, p50={np.percentile(v, 50):.1f}, "
+        f"p99={np.percentile(v, 99):.1f}, max={v.max():.1f}"
+    )
+
+
+class InputSender:
+    """
+    Sends input events from a background thread so listener callbacks never block.
+
+    The pynput callbacks run on the OS input hook thread; if they waited on the
+    network the local mouse would lag. `add` only appends a tuple to a deque
+    (append and popleft are atomic, no lock is taken) and returns. The sender
+    thread drains the deque and, with `binary`, packs everything that arrived
+    within `window_ms` of the first event into one batch, at most `max_events`
+    per batch. Otherwise each event is sent as its `text` message.
+
+    When the sender falls behind (more than `coalesce_after` events waiting), runs
+    of consecutive mouse moves are collapsed into their last one. Beyond
+    `max_backlog` waiting events new mouse moves are dropped; presses and releases
+    are always kept, losing one would leave a key held.
+
+    `send(message)` must send one websocket message. Events are stamped with
+    `clock()`, time.time_ns by default.
+    """
+
+    def __init__(
+        self,
+        send,
+        binary=True,
+        window_ms=2.0,
+        max_events=256,
+        coalesce_after=64,
+        max_backlog=10_000,
+        clock=time.time_ns,
+    ):
+        self.send = send
+        self.clock = clock
+        self.binary = binary
+        self.window_s = window_ms / 1000 if binary else 0.0
+        self.max_events = max_events if binary else 1
+        self.coalesce_after = coalesce_after
+        self.max_backlog = max_backlog
+        self._queue = deque()
+        self._pending = threading.Event()
+        self._closed = False
+
+        # Metrics, latencies in microseconds
+        self.callback_us = deque(maxlen=10_000)
+        self.queued_us = deque(maxlen=10_000)
+        self.max_queue_depth = 0
+        self.batches = 0
+        self.events = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def add(self, event_type, x=0, y=0, code=0, dx=0, dy=0, flags=0, text=None):
+        start = time.perf_counter_ns()
+        if event_type == INPUT_MOUSE_MOVE and len(self._queue) >= self.max_backlog:
+            self.dropped += 1
+        else:
+            self._queue.append(
+                (self.clock(), start, x, y, code, dx, dy, event_type, flags, text)
+            )
+            self._pending.set()
+        self.callback_us.append((time.perf_counter_ns() - start) / 1000)
+
+    def _drain(self):
+        depth = len(self._queue)
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        items = []
+        for _ in range(min(depth, self.max_events)):
+            items.append(self._queue.popleft())
+        if not self._queue:
+            self._pending.clear()
+            # An add between the check and the clear must not be missed
+            if self._queue:
+                self._pending.set()
+        if depth > self.coalesce_after:
+            items = self._coalesce(items)
+        return items
+
+    def _coalesce(self, items):
+        kept = []
+        for item in items:
+            if (
+                item[7] == INPUT_MOUSE_MOVE
+                and kept
+                and kept[-1][7] == INPUT_MOUSE_MOVE
+            ):
+                kept[-1] = item
+                self.coalesced += 1
+            else:
+                kept.append(item)
+        return kept
+
+    def _run(self):
+        while not self._closed:
+            if not self._pending.wait(timeout=0.5):
+                continue
+            if self.window_s and self._queue:
+                # Wait out the batch window, counted from the oldest event
+                first = self._queue[0][1]
+                remaining = self.window_s - (time.perf_counter_ns() - first) / 1e9
+                if remaining > 0 and len(self._queue) < self.max_events:
+                    time.sleep(remaining)
+            self._send(self._drain())
+
+    def _send(self, items):
+        if not items:
+            return
+        try:
+            if self.binary:
+                records = b"".join(
+                    INPUT_RECORD.pack(item[0], *item[2:9]) for item in items
+                )
+                self.send(pack_batch(records, len(items)))
+            else:
+                for item in items:
+                    self.send(item[9])
+        except Exception as e:
+            print("Failed to send input events:", e)
+            return
+        now = time.perf_counter_ns()
+        self.queued_us.extend((now - item[1]) / 1000 for item in items)
+        self.batches += 1 if self.binary else len(items)
+        self.events += len(items)
+
+    def close(self, drain=True):
+        """
+        Stop the sender thread, then send whatever is still queued. With `drain`
+        off (the connection is already gone) it is counted as dropped instead.
+        """
+        self._closed = True
+        self._pending.set()
+        self._thread.join(timeout=1)
+        if not drain:
+            self.dropped += len(self._queue)
+            self._queue.clear()
+        while self._queue:
+            self._send(self._drain())
+
+    def summary(self) -> str:
+        per_batch = self.events / self.batches if self.batches else 0.0
+        return "\n".join(
+            [
+                f"Sent {self.events} events in {self.batches} messages "
+                f"({per_batch:.1f} per message), {self.coalesced} mouse moves "
+                f"coalesced, {self.dropped} dropped",
+                f"  callback (us): {_percentiles(self.callback_us)}",
+                f"  queued   (ms): {_percentiles(self.queued_us, 1000)}",
+                f"  backlog: {self.queue_depth} now, {self.max_queue_depth} max",
+            ]
+        )
+
+
+def _unmask(data: bytes, mask: bytes) -> bytes:
+    n = len(data)
+    key = int.from_bytes((mask * (n // 4 + 1))[:n], "little")
+    return (int.from_bytes(data, "little") ^ key).to_bytes(n, "little")
+
+
+class _BinaryWebSocketHandler(WebSocketHandler):
+    """WebSocketHandler that also passes binary messages on, instead of skipping them."""
+
+    def read_next_message(self):
+        try:
+            b1, b2 = self.read_bytes(2)
+        except (ConnectionResetError, ValueError):
+            self.keep_alive = 0
+            return
+
+        opcode = b1 & OPCODE
+        if opcode == OPCODE_CLOSE_CONN:
+            self.keep_alive = 0
+            return
+        if not b2 & MASKED:
+            logger.warning("Client must always be masked.")
+            self.keep_alive = 0
+            return
+
+        payload_length = b2 & PAYLOAD_LEN
+        if payload_length == 126:
+            payload_length = struct.unpack(">H", self.read_bytes(2))[0]
+        elif payload_length == 127:
+            payload_length = struct.unpack(">Q", self.read_bytes(8))[0]
+        masks = self.read_bytes(4)
+        payload = _unmask(self.read_bytes(payload_length), masks)
+
+        if opcode == OPCODE_BINARY:
+            self.server._binary_received_(self, payload)
+        elif opcode == OPCODE_TEXT:
+            self.server._message_received_(self, payload.decode("utf8"))
+        elif opcode == OPCODE_PING:
+            self.server._ping_received_(self, payload.decode("utf8"))
+        elif opcode == OPCODE_PONG:
+            self.server._pong_received_(self, payload.decode("utf8"))
+        elif opcode == OPCODE_CONTINUATION:
+            logger.warning("Continuation frames are not supported.")
+        else:
+            logger.warning("Unknown opcode %#x." % opcode)
+            self.keep_alive = 0
+
+
+class BinaryWebsocketServer(WebsocketServer):
+    """WebsocketServer that also receives binary messages, see set_fn_binary_received."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.RequestHandlerClass = _BinaryWebSocketHandler
+        self.binary_received = lambda client, server, data: None
+
+    def set_fn_binary_received(self, fn):
+        self.binary_received = fn
+
+    def _binary_received_(self, handler, data):
+        self.binary_received(self.handler_to_client(handler), self, data)
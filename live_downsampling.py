@@ -0,0 +1,149 @@
+"""
+Down sampling while recording, the same filter as s4 applied to events as they come.
+
+s4 (`bin_and_filter_events_vectorized` after `preprocess_events`) keeps, per
+`bin_size` ms bin, the last mouse move and every press / release that changes the
+pressed state of its key or button; mouse_dragged counts as mouse_moved and
+everything else is dropped. LiveDownsampler runs that as a state machine: the rows
+kept so far in the open bin, the slot of its last move, and the set of pressed
+keys. Each event is O(1): a move replaces the bin's move slot, a valid transition
+is appended, and the bin's rows are emitted when the first event of a later bin
+arrives. So the down sampled file is complete as soon as recording stops.
+
+Events are expected in time order, as the plugin sends them. An event older than
+the open bin is handled as part of it (s4 would have sorted it back) and counted
+as `late`.
+
+Records are lists in event_log.COLUMNS order, as made by event_decoders. Only the
+standard library is used, this runs inside OBS' python.
+"""
+
+from event_log import COLUMNS
+
+_TIME = COLUMNS.index("time")
+_EVENT_TYPE = COLUMNS.index("event_type")
+_KEYCODE = COLUMNS.index("keycode")
+_BUTTON = COLUMNS.index("button")
+
+
+def _missing(value):
+    # None from the decoders, NaN from a DataFrame
+    return value is None or value == "" or value != value
+
+
+class LiveDownsampler:
+    def __init__(self, emit, bin_size: int = 16):
+        self.emit = emit
+        self.bin_size = bin_size
+        self.pressed_keys = set()
+        self._bin = None
+        self._rows = []
+        self._move_slot = None
+        self.events = 0
+        self.emitted = 0
+        self.late = 0
+
+    def add(self, record):
+        event_type = record[_EVENT_TYPE]
+        if event_type == "mouse_clicked" or _missing(record[_TIME]):
+            return
+        self.events += 1
+        time_bin = record[_TIME] // self.bin_size
+        if self._bin is None:
+            self._bin = time_bin
+        elif time_bin > self._bin:
+            self._close_bin()
+            self._bin = time_bin
+        elif time_bin < self._bin:
+            self.late += 1
+
+        if event_type in ("mouse_moved", "mouse_dragged"):
+            # Rows are held until their bin closes, copy them in case the decoder
+            # reuses its record
+            record = list(record)
+            if event_type == "mouse_dragged":
+                record[_EVENT_TYPE] = "mouse_moved"
+            if self._move_slot is not None:
+                self._rows[self._move_slot] = None
+            self._move_slot = len(self._rows)
+            self._rows.append(record)
+            return
+
+        is_press = "pressed" in event_type
+        if not is_press and "released" not in event_type:
+            return
+        key = record[_KEYCODE]
+        if _missing(key):
+            key = record[_BUTTON]
+        if is_press:
+            # A press with no key or button ID always passes, as in s4
+            if key in self.pressed_keys:
+                return
+            if not _missing(key):
+                self.pressed_keys.add(key)
+        else:
+            if _missing(key) or key not in self.pressed_keys:
+                return
+            self.pressed_keys.remove(key)
+        self._rows.append(list(record))
+
+    def _close_bin(self):
+        for row in self._rows:
+            if row is not None:
+                self.emit(row)
+                self.emitted += 1
+        self._rows = []
+        self._move_slot = None
+
+    def close(self):
+        """Emit the last, still open bin."""
+        self._close_bin()
+
+    def stats(self) -> dict:
+        return {"events": self.events, "emitted": self.emitted, "late": self.late}
+
+
+class DownsamplingWriter:
+    """
+    Writes every event to `writer` and the down sampled stream to
+    `downsampled_writer` (EventWriter / EventLogWriter), decoding each message once.
+    Wrap it in a QueuedEventWriter to keep both off the websocket thread.
+    """
+
+    def __init__(self, writer, downsampled_writer, bin_size: int = 16, decoder=None):
+        if decoder is None:
+            from event_decoders import make_decoder
+
+            decoder = make_decoder()
+        self.decoder = decoder
+        self.writer = writer
+        self.downsampled_writer = downsampled_writer
+        self.downsampler = LiveDownsampler(downsampled_writer.write_record, bin_size)
+
+    @property
+    def auto_flush(self):
+        return self.writer.auto_flush
+
+    @auto_flush.setter
+    def auto_flush(self, value):
+        self.writer.auto_flush = value
+        self.downsampled_writer.auto_flush = value
+
+    def write(self, event_json: str):
+        try:
+            record = self.decoder.decode(event_json)
+            self.writer.write_record(record)
+            self.downsampler.add(record)
+        except ValueError as e:
+            print(f"Error parsing JSON: {e}")
+        except Exception as e:
+            print(f"Error writing event: {e}")
+
+    def flush(self):
+        self.writer.flush()
+        self.downsampled_writer.flush()
+
+    def close(self):
+        self.downsampler.close()
+        self.writer.close()
+        self.downsampled_writer.close()
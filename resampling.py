@@ -0,0 +1,164 @@
+"""
+Multi-rate resampling of recorded events into dense, fixed-rate rows.
+
+s4's `bin_and_filter_events` keeps the last mouse_moved of every bin at one bin
+size, and a bin without a move gets no position. `resample_events` instead makes
+one row per bin at each of several rates from one sorted pass over the events:
+
+    time            bin start (ms)
+    x, y            mouse position at the end of the bin
+    dx, dy          displacement over the bin
+    distance        length of the mouse path within the bin
+    vx, vy          dx, dy per second
+    moves           mouse_moved / mouse_dragged events in the bin
+    wheel_rotation  summed wheel_rotation of the bin's mouse_wheel events
+
+Positions come from the mouse moves by linear interpolation ("linear") or by
+holding the last reported position ("hold"). The pointer only reports positions
+while it moves, so with "linear" a gap longer than `max_gap` ms between two moves
+is treated as the mouse resting until the second one, not as a slow glide.
+
+    frames = resample_events(df, rates=[10, 30, 60, 120])
+    frames[60]  # DataFrame with a row every 1000 / 60 ms
+
+Everything is vectorized: positions at all bin edges of a rate are one np.interp
+call, per bin sums are np.bincount.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+RESAMPLE_COLUMNS = [
+    "time",
+    "x",
+    "y",
+    "dx",
+    "dy",
+    "distance",
+    "vx",
+    "vy",
+    "moves",
+    "wheel_rotation",
+]
+MOVE_TYPES = ("mouse_moved", "mouse_dragged")
+METHODS = ("linear", "hold")
+
+
+def _mouse_track(time, x, y, max_gap):
+    """
+    Interpolation points for "linear": every move, plus a copy of the previous
+    position just before moves that come more than `max_gap` ms after it.
+    """
+    if max_gap is None or len(time) < 2:
+        return time, x, y
+    gaps = np.flatnonzero(np.diff(time) > max_gap)
+    if len(gaps) == 0:
+        return time, x, y
+    # Ends the rest right before the next move, 1 us keeps the times increasing
+    hold_time = time[gaps + 1] - 1e-3
+    insert_at = gaps + 1
+    return (
+        np.insert(time, insert_at, hold_time),
+        np.insert(x, insert_at, x[gaps]),
+        np.insert(y, insert_at, y[gaps]),
+    )
+
+
+def _positions(edges, time, x, y, method, max_gap):
+    if method == "hold":
+        idx = np.searchsorted(time, edges, side="left") - 1
+        # Before the first move, use the first position
+        idx = np.clip(idx, 0, len(time) - 1)
+        return x[idx], y[idx]
+    t, tx, ty = _mouse_track(time, x, y, max_gap)
+    return np.interp(edges, t, tx), np.interp(edges, t, ty)
+
+
+def _path_length(edges, time, x, y, method, max_gap):
+    """Mouse path length travelled between consecutive bin edges."""
+    if method == "hold":
+        # Positions jump at each move, the path is the sum of the jumps
+        steps = np.hypot(np.diff(x), np.diff(y))
+        travelled = np.concatenate([[0.0], np.cumsum(steps)])
+        idx = np.clip(np.searchsorted(time, edges, side="left") - 1, 0, None)
+        return np.diff(travelled[idx])
+    t, tx, ty = _mouse_track(time, x, y, max_gap)
+    steps = np.hypot(np.diff(tx), np.diff(ty))
+    travelled = np.concatenate([[0.0], np.cumsum(steps)])
+    return np.diff(np.interp(edges, t, travelled))
+
+
+def resample_events(
+    df: pd.DataFrame,
+    rates=(10, 30, 60, 120),
+    method: str = "linear",
+    max_gap: float | None = 100.0,
+    start: float | None = None,
+    end: float | None = None,
+) -> dict:
+    """
+    Resample recorded events (the csv columns) at every rate in `rates` (Hz).
+
+    Bins start at `start` (default: the first event) and cover up to `end`
+    (default: the last event). Returns {rate: DataFrame with RESAMPLE_COLUMNS}.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}', use one of {METHODS}")
+
+    # One sort and one extraction shared by every rate
+    df = df.sort_values(by="time", kind="stable")
+    time = df["time"].to_numpy(dtype=np.float64)
+    event_type = df["event_type"].astype(str).to_numpy()
+    is_move = np.isin(event_type, MOVE_TYPES) & df["x"].notna().to_numpy()
+    move_time = time[is_move]
+    move_x = df["x"].to_numpy(dtype=np.float64)[is_move]
+    move_y = df["y"].to_numpy(dtype=np.float64)[is_move]
+    is_wheel = event_type == "mouse_wheel"
+    wheel_time = time[is_wheel]
+    wheel = np.nan_to_num(df["wheel_rotation"].to_numpy(dtype=np.float64)[is_wheel])
+
+    if start is None:
+        start = time[0] if len(time) else 0.0
+    if end is None:
+        end = time[-1] if len(time) else start
+
+    frames = {}
+    for rate in rates:
+        bin_ms = 1000.0 / rate
+        n_bins = int(np.floor((end - start) / bin_ms)) + 1
+        edges = start + np.arange(n_bins + 1) * bin_ms
+        out = {"time": edges[:-1]}
+
+        if len(move_time):
+            px, py = _positions(edges, move_time, move_x, move_y, method, max_gap)
+            out["x"], out["y"] = px[1:], py[1:]
+            out["dx"], out["dy"] = np.diff(px), np.diff(py)
+            out["distance"] = _path_length(
+                edges, move_time, move_x, move_y, method, max_gap
+            )
+        else:
+            for name in ("x", "y", "dx", "dy", "distance"):
+                out[name] = np.full(n_bins, np.nan)
+        out["vx"] = out["dx"] * rate
+        out["vy"] = out["dy"] * rate
+
+        # Bin of every event against the same edges as the positions, anything
+        # outside [start, end] is left out
+        move_bins = np.searchsorted(edges, move_time, side="right") - 1
+        inside = (move_bins >= 0) & (move_bins < n_bins)
+        out["moves"] = np.bincount(move_bins[inside], minlength=n_bins)
+        wheel_bins = np.searchsorted(edges, wheel_time, side="right") - 1
+        inside = (wheel_bins >= 0) & (wheel_bins < n_bins)
+        out["wheel_rotation"] = np.bincount(
+            wheel_bins[inside], weights=wheel[inside], minlength=n_bins
+        )
+        frames[rate] = pd.DataFrame(out, columns=RESAMPLE_COLUMNS)
+    return frames
+
+
+def rate_output_path(output_path: str, rate) -> str:
+    """recording.csv -> recording_60hz.csv, always csv since the columns differ."""
+    stem = os.path.splitext(output_path)[0]
+    return f"{stem}_{rate:g}hz.csv"
@@ -0,0 +1,355 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from event_log import (
+    COMPRESSED_LOG_EXTENSION,
+    EVENT_LOG_EXTENSION,
+    read_events,
+    write_events,
+)
+from s4_data_post_processing import (
+    bin_and_filter_events_vectorized,
+    preprocess_events,
+    stream_bin_and_filter_events,
+)
+
+RECORDING_EXTENSIONS = (".csv", EVENT_LOG_EXTENSION, COMPRESSED_LOG_EXTENSION)
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def collect_inputs(paths, pattern="recording_*", suffix="_downsampled"):
+    """
+    Expand directories (searched recursively for `pattern`), globs and plain files
+    into (input path, path relative to the output directory) pairs.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, "**", pattern), recursive=True)
+            root = path
+        else:
+            matches = glob.glob(path, recursive=True) or [path]
+            root = None
+        for match in sorted(matches):
+            name, ext = os.path.splitext(match)
+            if ext not in RECORDING_EXTENSIONS or name.endswith(suffix):
+                continue
+            relative = os.path.relpath(match, root) if root else os.path.basename(match)
+            found.append((match, relative))
+    return found
+
+
+def output_path_for(relative, output_dir, suffix="_downsampled", extension=None):
+    name, ext = os.path.splitext(relative)
+    return os.path.join(output_dir, f"{name}{suffix}{extension or ext}")
+
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest["files"]
+
+
+def save_manifest(output_dir, files):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    # Write then rename, an interrupted run never leaves a broken manifest
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def is_up_to_date(entry, input_path, output_path, settings, use_hash=False):
+    """
+    True if `entry`, the manifest entry of `output_path`, was made from this input
+    with these settings and the output is untouched. The input is compared by size
+    and mtime, or by content hash with `use_hash` when the mtime changed (e.g. after
+    a copy).
+    """
+    if not entry or entry["settings"] != settings:
+        return False
+    if entry["input"] != os.path.abspath(input_path):
+        return False
+    try:
+        out = os.stat(output_path)
+        src = os.stat(input_path)
+    except OSError:
+        return False
+    if (out.st_size, out.st_mtime_ns) != (
+        entry["output_size"],
+        entry["output_mtime_ns"],
+    ):
+        return False
+    if src.st_size != entry["size"]:
+        return False
+    if src.st_mtime_ns == entry["mtime_ns"]:
+        return True
+    return use_hash and file_hash(input_path) == entry.get("sha256")
+
+
+def process_file(input_path, output_path, bin_size=16, chunk_size=None):
+    """Down sample one recording, runs in a pool worker."""
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if chunk_size:
+            rows_in, rows_out = stream_bin_and_filter_events(
+                input_path, output_path, bin_size=bin_size, chunk_size=chunk_size
+            )
+        else:
+            df = preprocess_events(read_events(input_path))
+            filtered = bin_and_filter_events_vectorized(df, bin_size=bin_size)
+            write_events(filtered, output_path)
+            rows_in, rows_out = len(df), len(filtered)
+        # Recorded every run so a later --hash run can compare against it
+        sha256 = file_hash(input_path)
+        error = None
+    except Exception as e:
+        rows_in = rows_out = 0
+        sha256 = None
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "input": input_path,
+        "output": output_path,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "sha256": sha256,
+        "seconds": time.perf_counter() - start,
+        "worker": os.getpid(),
+        "error": error,
+    }
+
+
+def run_batch(
+    inputs,
+    output_dir,
+    bin_size=16,
+    workers=None,
+    chunk_size=None,
+    pattern="recording_*",
+    suffix="_downsampled",
+    extension=None,
+    use_hash=False,
+    force=False,
+):
+    """Down sample every recording in `inputs`, returns the report dict."""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    settings = {"bin_size": bin_size}
+
+    jobs = []
+    skipped = 0
+    outputs = {}
+    for input_path, relative in collect_inputs(inputs, pattern, suffix):
+        output_path = output_path_for(relative, output_dir, suffix, extension)
+        if output_path in outputs:
+            if not os.path.samefile(outputs[output_path], input_path):
+                print(
+                    f"Skipping {input_path}: {outputs[output_path]} "
+                    f"also writes {output_path}"
+                )
+            continue
+        outputs[output_path] = input_path
+        entry = manifest.get(os.path.relpath(output_path, output_dir))
+        if not force and is_up_to_date(
+            entry, input_path, output_path, settings, use_hash
+        ):
+            # Same content under a new mtime, remember it to skip the hash next time
+            entry["mtime_ns"] = os.stat(input_path).st_mtime_ns
+            skipped += 1
+            continue
+        jobs.append((input_path, output_path))
+
+    print(f"{len(jobs)} recordings to process, {skipped} up to date")
+    if skipped:
+        save_manifest(output_dir, manifest)
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(process_file, i, o, bin_size, chunk_size) for i, o in jobs
+        ]
+        for n, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            if result["error"]:
+                print(f"[{n}/{len(jobs)}] {result['input']}: {result['error']}")
+                continue
+            print(
+                f"[{n}/{len(jobs)}] {result['input']}: "
+                f"{result['rows_in']} -> {result['rows_out']} rows "
+                f"in {result['seconds']:.2f}s"
+            )
+            src = os.stat(result["input"])
+            out = os.stat(result["output"])
+            manifest[os.path.relpath(result["output"], output_dir)] = {
+                "input": os.path.abspath(result["input"]),
+                "size": src.st_size,
+                "mtime_ns": src.st_mtime_ns,
+                "sha256": result["sha256"],
+                "settings": settings,
+                "output_size": out.st_size,
+                "output_mtime_ns": out.st_mtime_ns,
+                "rows_in": result["rows_in"],
+                "rows_out": result["rows_out"],
+            }
+            # Save as we go so an interrupted batch resumes where it stopped
+            save_manifest(output_dir, manifest)
+    wall = time.perf_counter() - start
+    return batch_report(results, skipped, wall)
+
+
+def batch_report(results, skipped, wall_seconds):
+    done = [r for r in results if not r["error"]]
+    workers = {}
+    for r in done:
+        w = workers.setdefault(
+            r["worker"], {"files": 0, "rows_in": 0, "rows_out": 0, "seconds": 0.0}
+        )
+        w["files"] += 1
+        w["rows_in"] += r["rows_in"]
+        w["rows_out"] += r["rows_out"]
+        w["seconds"] += r["seconds"]
+    for w in workers.values():
+        w["rows_per_s"] = w["rows_in"] / w["seconds"] if w["seconds"] > 0 else 0.0
+    rows_in = sum(r["rows_in"] for r in done)
+    return {
+        "files": len(done),
+        "skipped": skipped,
+        "failed": [
+            {"input": r["input"], "error": r["error"]} for r in results if r["error"]
+        ],
+        "rows_in": rows_in,
+        "rows_out": sum(r["rows_out"] for r in done),
+        "wall_seconds": wall_seconds,
+        "rows_per_s": rows_in / wall_seconds if wall_seconds > 0 else 0.0,
+        "workers": {str(pid): w for pid, w in workers.items()},
+    }
+
+
+def format_report(report):
+    lines = [
+        f"Processed {report['files']} recordings, {report['skipped']} up to date, "
+        f"{len(report['failed'])} failed",
+        f"Rows: {report['rows_in']} in, {report['rows_out']} out "
+        f"in {report['wall_seconds']:.2f}s ({report['rows_per_s']:.0f} rows/s)",
+    ]
+    for pid, w in report["workers"].items():
+        lines.append(
+            f"  worker {pid}: {w['files']} files, "
+            f"{w['rows_in']} -> {w['rows_out']} rows, {w['seconds']:.2f}s busy"
+            f" ({w['rows_per_s']:.0f} rows/s)"
+        )
+    for f in report["failed"]:
+        lines.append(f"  failed {f['input']}: {f['error']}")
+    return "\n".join(lines)
+
+
+def main():
+    """
+    Down sample many recordings at once on a process pool:
+        python s11_batch_post_processing.py <output_dir> ~/Videos "old/**/*.csv"
+
+    Directories are searched recursively for recording_* csv / event log files,
+    other inputs are globs or files. Outputs already made from an unchanged input
+    with the same settings are skipped, see manifest.json in the output directory.
+    """
+    parser = argparse.ArgumentParser(
+        description="Down sample a batch of recordings in parallel"
+    )
+    parser.add_argument("output_dir", help="Directory for the down sampled files")
+    parser.add_argument(
+        "inputs", nargs="+", help="Recording directories, globs or files"
+    )
+    parser.add_argument(
+        "--bin-size",
+        type=int,
+        default=16,
+        help="Bin size in milliseconds (default: 16 for ~60 FPS)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Stream each input in chunks of this many rows, see s4",
+    )
+    parser.add_argument(
+        "--pattern",
+        default="recording_*",
+        help="File name pattern to search directories for (default: recording_*)",
+    )
+    parser.add_argument(
+        "--suffix",
+        default="_downsampled",
+        help="Added to output file names (default: _downsampled)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["same", "csv", "evlog", "evlogz"],
+        default="same",
+        help="Output format (default: same as the input)",
+    )
+    parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="Compare inputs by content hash when only their mtime changed",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Process everything, ignore the manifest"
+    )
+    parser.add_argument("--report", help="Also write the report as json to this path")
+    args = parser.parse_args()
+
+    extension = {
+        "same": None,
+        "csv": ".csv",
+        "evlog": EVENT_LOG_EXTENSION,
+        "evlogz": COMPRESSED_LOG_EXTENSION,
+    }[args.format]
+    report = run_batch(
+        args.inputs,
+        args.output_dir,
+        bin_size=args.bin_size,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        pattern=args.pattern,
+        suffix=args.suffix,
+        extension=extension,
+        use_hash=args.hash,
+        force=args.force,
+    )
+    print(format_report(report))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
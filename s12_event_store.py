@@ -0,0 +1,114 @@
+import os
+import sys
+import argparse
+
+from event_store import BLOCK_ROWS, EventStore
+
+
+def add(args):
+    store = EventStore(args.store)
+    for path in args.recordings:
+        if not os.path.exists(path):
+            print(f"Skipping {path}: not found")
+            continue
+        session = store.add_recording(path, block_rows=args.block_rows)
+        size = os.path.getsize(os.path.join(session.path, "columns.bin"))
+        print(
+            f"{session.name}: {len(session)} events in {len(session.blocks)} blocks, "
+            f"{size / 1e6:.1f} MB (from {os.path.getsize(path) / 1e6:.1f} MB)"
+        )
+
+
+def info(args):
+    store = EventStore(args.store)
+    for name in store.names:
+        session = store.session(name)
+        counts = session.blocks["type_counts"].sum(axis=0)
+        types = ", ".join(
+            f"{t}={c}" for t, c in zip(session.event_types, counts) if t and c
+        )
+        print(
+            f"{name}: {len(session)} events, {len(session.blocks)} blocks, "
+            f"time {session.t_min} .. {session.t_max}"
+        )
+        print(f"  {types}")
+
+
+def query(args):
+    store = EventStore(args.store)
+    if args.session:
+        sessions = [store.session(args.session)]
+    else:
+        sessions = store.sessions_between(args.start, args.end)
+    for session in sessions:
+        if args.count:
+            n = session.count(args.start, args.end, args.types)
+            print(f"{session.name}: {n} events ({session.blocks_read} blocks read)")
+            continue
+        df = session.query_dataframe(args.start, args.end, args.types)
+        print(
+            f"{session.name}: {len(df)} events "
+            f"({session.blocks_read}/{len(session.blocks)} blocks read)"
+        )
+        if args.output:
+            df.insert(0, "session", session.name)
+            df.to_csv(
+                args.output,
+                mode="a",
+                header=not os.path.exists(args.output),
+                index=False,
+            )
+        elif len(df):
+            print(df.head(args.head).to_string(index=False))
+
+
+def main():
+    """
+    Keep recordings in a time-indexed store and query time windows of them:
+        python s12_event_store.py add <store> recording_1.csv recording_2.evlog
+        python s12_event_store.py info <store>
+        python s12_event_store.py query <store> --start 5000 --end 15000 --types key_pressed
+
+    See event_store.py for the layout and the python API.
+    """
+    parser = argparse.ArgumentParser(description="Time-indexed event store")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = commands.add_parser("add", help="Add recordings as sessions")
+    add_parser.add_argument("store", help="Store directory")
+    add_parser.add_argument("recordings", nargs="+", help="Recorded csv / event logs")
+    add_parser.add_argument(
+        "--block-rows",
+        type=int,
+        default=BLOCK_ROWS,
+        help=f"Events per compressed block (default: {BLOCK_ROWS})",
+    )
+
+    info_parser = commands.add_parser("info", help="List the sessions")
+    info_parser.add_argument("store", help="Store directory")
+
+    query_parser = commands.add_parser("query", help="Events in a time window")
+    query_parser.add_argument("store", help="Store directory")
+    query_parser.add_argument("--session", help="Only this session (default: all)")
+    query_parser.add_argument("--start", type=float, help="Window start time (ms)")
+    query_parser.add_argument("--end", type=float, help="Window end time (ms)")
+    query_parser.add_argument(
+        "--types", nargs="+", help="Only these event types, e.g. key_pressed"
+    )
+    query_parser.add_argument(
+        "--count", action="store_true", help="Only count the events"
+    )
+    query_parser.add_argument("--output", help="Append the events to this csv")
+    query_parser.add_argument(
+        "--head", type=int, default=20, help="Events to print (default: 20)"
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.store) and args.command != "add":
+        print(f"Error: no event store at '{args.store}'")
+        sys.exit(1)
+    {"add": add, "info": info, "query": query}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
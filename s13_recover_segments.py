@@ -0,0 +1,50 @@
+import sys
+import argparse
+
+from segmented_log import SegmentedRecording, recover
+
+
+def main():
+    """
+    Check a segmented recording (see segmented_log.py) and repair it after a crash:
+        python s13_recover_segments.py recording_20250101_120000_segments
+
+    Unsealed segments are truncated to their last valid record and sealed. Pass
+    --verify-only to just report.
+    """
+    parser = argparse.ArgumentParser(
+        description="Verify and recover a segmented recording"
+    )
+    parser.add_argument("path", help="Segment directory")
+    parser.add_argument(
+        "--verify-only",
+        action="store_true",
+        help="Only check the segments, change nothing",
+    )
+    args = parser.parse_args()
+
+    try:
+        recording = SegmentedRecording(args.path)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(
+        f"{len(recording.entries)} sealed segments, "
+        f"{sum(entry['rows'] for entry in recording.entries)} events"
+    )
+    if recording.unsealed:
+        print(f"Unsealed: {', '.join(recording.unsealed)}")
+    problems = recording.verify()
+    for file_name, problem in problems:
+        print(f"  {file_name}: {problem}")
+
+    if not args.verify_only and recording.unsealed:
+        for file_name, dropped in recover(args.path):
+            print(f"Sealed {file_name}, dropped {dropped} bytes of a partial record")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
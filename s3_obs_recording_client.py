@@ -1,14 +1,39 @@
 import os
 import time
-import json
 import websocket
 import threading
 import obspython as obs
 
+from event_log import QueuedEventWriter, is_log_path, make_log_writer
+from event_decoders import make_decoder
+from live_downsampling import DownsamplingWriter
+from segmented_log import SegmentedEventWriter
+
 
 recording_client = None
 streaming_client = None
 
+# File extension of the recorded events: ".csv" for plain text, ".evlog" for the
+# compact binary event log (see event_log.py) or ".evlogz" for a compressed one
+# (see compressed_log.py)
+OUTPUT_EXTENSION = ".csv"
+
+# Write events from a background thread in batches instead of flushing every event
+# on the websocket thread
+BUFFERED_WRITES = True
+
+# Websocket message decoder: "auto", "json", "orjson" or "schema" (see event_decoders.py)
+DECODER = "auto"
+
+# Also write the events down sampled to this bin size in ms (like s4) next to the raw
+# recording, as <recording>_downsampled.csv. None to only write the raw events.
+DOWNSAMPLE_BIN_SIZE = None
+
+# Write the raw events as a directory of crash safe segments (see segmented_log.py),
+# <recording>_segments/, rolled over at this many MB or seconds. None for one file.
+SEGMENT_MAX_MB = None
+SEGMENT_MAX_SECONDS = None
+
 
 def script_description():
     return (
@@ -41,7 +66,7 @@ def get_output_path():
         output_dir = os.path.join(os.path.expanduser("~"), "Documents")
 
     # Create filename with timestamp
-    filename = f"recording_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+    filename = f"recording_{time.strftime('%Y%m%d_%H%M%S')}{OUTPUT_EXTENSION}"
     return os.path.join(output_dir, filename)
 
 
@@ -69,7 +94,7 @@ def on_event(event):
     elif event == obs.OBS_FRONTEND_EVENT_STREAMING_STARTING:
         print("📡 Streaming is starting...")
         if not streaming_client:
-            output_path = f"streaming_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+            output_path = f"streaming_{time.strftime('%Y%m%d_%H%M%S')}{OUTPUT_EXTENSION}"
             streaming_client = OBSClient(port=16899, output_path=output_path)
             streaming_client.start()
     elif event == obs.OBS_FRONTEND_EVENT_STREAMING_STARTED:
@@ -84,7 +109,9 @@ def on_event(event):
 
 
 class EventWriter:
-    def __init__(self, csv_path: str):
+    def __init__(self, csv_path: str, auto_flush: bool = True, decoder=None):
+        self.decoder = decoder or make_decoder(DECODER)
+        self.auto_flush = auto_flush
         self._csv_file = open(csv_path, "w", newline="")
         # Write header
         columns = [
@@ -108,41 +135,60 @@ class EventWriter:
 
     def write(self, event_json: str):
         try:
-            event = json.loads(event_json)
-            values = [
-                str(event.get("time", "")),
-                event.get("event_source", ""),
-                event.get("event_type", ""),
-                str(event.get("x", "")),
-                str(event.get("y", "")),
-                str(event.get("button", "")),
-                str(event.get("clicks", "")),
-                str(event.get("keycode", "")),
-                str(event.get("rawcode", "")),
-                str(event.get("char", "")),
-                str(event.get("mask", "")),
-                str(event.get("wheel_amount", "")),
-                str(event.get("wheel_direction", "")),
-                str(event.get("wheel_rotation", "")),
-            ]
-
-            line = ",".join(values) + "\n"
-            self._csv_file.write(line)
-            self._csv_file.flush()
-
-        except json.JSONDecodeError as e:
+            # Decoded in the header's column order, None for missing fields
+            self.write_record(self.decoder.decode(event_json))
+        except ValueError as e:
             print(f"Error parsing JSON: {e}")
         except Exception as e:
             print(f"Error writing event: {e}")
 
+    def write_record(self, record):
+        values = ["" if value is None else str(value) for value in record]
+        self._csv_file.write(",".join(values) + "\n")
+        if self.auto_flush:
+            self._csv_file.flush()
+
+    def flush(self):
+        if self._csv_file:
+            self._csv_file.flush()
+
     def close(self):
         if self._csv_file:
             self._csv_file.close()
             self._csv_file = None
 
 
+def make_event_writer(output_path: str, decoder):
+    if is_log_path(output_path):
+        return make_log_writer(output_path, decoder=decoder)
+    return EventWriter(output_path, decoder=decoder)
+
+
+def make_segmented_writer(output_path: str, decoder):
+    stem, ext = os.path.splitext(output_path)
+    return SegmentedEventWriter(
+        f"{stem}_segments",
+        lambda path: make_event_writer(path, decoder),
+        extension=ext,
+        max_bytes=SEGMENT_MAX_MB * 1024 * 1024 if SEGMENT_MAX_MB else None,
+        max_seconds=SEGMENT_MAX_SECONDS,
+        decoder=decoder,
+    )
+
+
+def downsampled_path(output_path: str) -> str:
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}_downsampled{ext}"
+
+
 class OBSClient:
-    def __init__(self, port: int, output_path: str):
+    def __init__(
+        self,
+        port: int,
+        output_path: str,
+        buffered: bool = BUFFERED_WRITES,
+        downsample_bin_size=DOWNSAMPLE_BIN_SIZE,
+    ):
         self.ws = websocket.WebSocketApp(
             f"ws://localhost:{port}/",
             on_open=self._on_open,
@@ -151,7 +197,22 @@ class OBSClient:
             on_close=self._on_close,
         )
         self.ws_thread = None
-        self.event_writer = EventWriter(output_path)
+        decoder = make_decoder(DECODER)
+        if SEGMENT_MAX_MB or SEGMENT_MAX_SECONDS:
+            self.event_writer = make_segmented_writer(output_path, decoder)
+        else:
+            self.event_writer = make_event_writer(output_path, decoder)
+        self.downsampling = None
+        if downsample_bin_size:
+            self.downsampling = DownsamplingWriter(
+                self.event_writer,
+                make_event_writer(downsampled_path(output_path), decoder),
+                bin_size=downsample_bin_size,
+                decoder=decoder,
+            )
+            self.event_writer = self.downsampling
+        if buffered:
+            self.event_writer = QueuedEventWriter(self.event_writer)
         self.running = False
 
     def start(self):
@@ -168,6 +229,10 @@ class OBSClient:
             self.ws_thread.join()
         if self.event_writer:
             self.event_writer.close()
+            if isinstance(self.event_writer, QueuedEventWriter):
+                print(f"Event writer stats: {self.event_writer.stats()}")
+            if self.downsampling:
+                print(f"Down sampling stats: {self.downsampling.downsampler.stats()}")
 
     def _on_open(self, ws):
         print("############# WebSocket Connection Opened ##############")
@@ -4,6 +4,15 @@ from tqdm import tqdm
 import sys
 import argparse
 
+from event_log import (
+    is_log_path,
+    iter_event_chunks,
+    make_log_writer,
+    read_events,
+    write_events,
+)
+from resampling import METHODS, rate_output_path, resample_events
+
 
 def bin_and_filter_events(df: pd.DataFrame, bin_size: int = 16) -> pd.DataFrame:
     """
@@ -85,37 +94,284 @@ def bin_and_filter_events(df: pd.DataFrame, bin_size: int = 16) -> pd.DataFrame:
     return filtered_df
 
 
+def bin_and_filter_events_vectorized(df: pd.DataFrame, bin_size: int = 16) -> pd.DataFrame:
+    """
+    Vectorized equivalent of `bin_and_filter_events`.
+
+    Produces the same rows without iterating bins or rows in Python:
+      - The last mouse_moved event of a bin is the one whose next mouse_moved event
+        falls into a later bin.
+      - A press/release is valid when it differs from the previous press/release of
+        the same key. Runs of repeated presses (or releases) collapse to their first
+        event, and a release of a key that was never pressed is dropped.
+    """
+    df = df.sort_values(by="time", kind="stable").reset_index(drop=True)
+    keep = _filter_mask(df, bin_size)
+    return df[keep].reset_index(drop=True)
+
+
+def _filter_mask(
+    df: pd.DataFrame, bin_size: int, pressed_keys: set | None = None
+) -> np.ndarray:
+    """
+    Boolean mask of rows to keep from a time sorted frame.
+
+    `pressed_keys` seeds the held keys at the start of the frame and is updated in place
+    with the keys still held at its end, so consecutive frames can be filtered in turn.
+    """
+    keep = np.zeros(len(df), dtype=bool)
+    if len(df) == 0:
+        return keep
+
+    time_bin = (df["time"] // bin_size).to_numpy()
+    event_type = df["event_type"].astype(str)
+
+    # Last mouse_moved per bin
+    move_idx = np.flatnonzero((event_type == "mouse_moved").to_numpy())
+    if len(move_idx):
+        move_bins = time_bin[move_idx]
+        is_last = np.ones(len(move_idx), dtype=bool)
+        is_last[:-1] = move_bins[1:] != move_bins[:-1]
+        keep[move_idx[is_last]] = True
+
+    # Press/release transitions
+    is_press = event_type.str.contains("pressed", regex=False).to_numpy()
+    is_release = ~is_press & event_type.str.contains("released", regex=False).to_numpy()
+    trans_idx = np.flatnonzero(is_press | is_release)
+    if len(trans_idx) == 0:
+        return keep
+
+    # Key or button ID, keyboard keycode takes precedence
+    key_ids = df["keycode"].where(df["keycode"].notna(), df["button"]).to_numpy()
+    codes, uniques = pd.factorize(key_ids[trans_idx])
+    pressed = is_press[trans_idx]
+
+    # Group transitions by key, keeping chronological order within each key
+    order = np.lexsort((trans_idx, codes))
+    codes_sorted = codes[order]
+    pressed_sorted = pressed[order]
+    group_start = np.ones(len(order), dtype=bool)
+    group_start[1:] = codes_sorted[1:] != codes_sorted[:-1]
+
+    # Every key starts released unless it is carried in as pressed
+    prev_pressed = np.empty(len(order), dtype=bool)
+    prev_pressed[1:] = pressed_sorted[:-1]
+    if pressed_keys:
+        # The extra last entry is code -1, a missing key ID, which is never held
+        held = np.array([k in pressed_keys for k in uniques] + [False], dtype=bool)
+        prev_pressed[group_start] = held[codes_sorted[group_start]]
+    else:
+        prev_pressed[group_start] = False
+
+    valid_sorted = pressed_sorted != prev_pressed
+    # A missing key ID never matches the pressed set, so its presses always pass
+    # and its releases never do
+    missing = codes_sorted == -1
+    valid_sorted[missing] = pressed_sorted[missing]
+
+    keep[trans_idx[order[valid_sorted]]] = True
+
+    if pressed_keys is not None:
+        # A key ends up in the state of its last press/release
+        group_end = np.ones(len(order), dtype=bool)
+        group_end[:-1] = group_start[1:]
+        for code, is_pressed in zip(codes_sorted[group_end], pressed_sorted[group_end]):
+            if code < 0:
+                continue
+            if is_pressed:
+                pressed_keys.add(uniques[code])
+            else:
+                pressed_keys.discard(uniques[code])
+    return keep
+
+
+def preprocess_events(df: pd.DataFrame) -> pd.DataFrame:
+    """Change mouse_dragged to mouse_moved, and remove mouse_clicked"""
+    df["event_type"] = df["event_type"].replace("mouse_dragged", "mouse_moved")
+    return df[df["event_type"] != "mouse_clicked"]
+
+
+def stream_bin_and_filter_events(
+    input_csv: str, output_csv: str, bin_size: int = 16, chunk_size: int = 1_000_000
+) -> tuple[int, int]:
+    """
+    Down sample a recording that does not fit in memory.
+
+    Reads `input_csv` (csv or event log) in chunks of `chunk_size` rows and writes
+    the filtered rows to `output_csv` as soon as their bin is complete. The rows of
+    the last, still open bin and the set of pressed keys are carried over to the next
+    chunk, so the output is identical to filtering the whole file at once. Peak memory
+    is bounded by the chunk size.
+
+    The recording is expected to be written in time order, which is how EventWriter
+    writes it. Events are only sorted within the current chunk.
+
+    Returns the number of rows read (after pre-processing) and written.
+    """
+    pressed_keys = set()
+    carry = None
+    rows_in = 0
+    rows_out = 0
+
+    if is_log_path(output_csv):
+        log_writer = make_log_writer(output_csv)
+        out = None
+    else:
+        log_writer = None
+        out = open(output_csv, "w", newline="")
+    header = True
+
+    def write(filtered):
+        nonlocal header
+        if log_writer:
+            log_writer.write_frame(filtered)
+        else:
+            filtered.to_csv(out, header=header, index=False)
+        header = False
+
+    try:
+        reader = iter_event_chunks(input_csv, chunk_size)
+        for chunk in tqdm(reader, desc="Processing chunks", unit="chunk"):
+            chunk = preprocess_events(chunk)
+            rows_in += len(chunk)
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            if len(chunk) == 0:
+                carry = chunk
+                continue
+            chunk = chunk.sort_values(by="time", kind="stable").reset_index(drop=True)
+
+            # Hold back the last bin, later chunks may still add events to it
+            time_bin = (chunk["time"] // bin_size).to_numpy()
+            closed = time_bin < time_bin[-1]
+            ready = chunk[closed].reset_index(drop=True)
+            carry = chunk[~closed]
+
+            filtered = ready[_filter_mask(ready, bin_size, pressed_keys)]
+            write(filtered)
+            rows_out += len(filtered)
+
+        if carry is not None:
+            carry = carry.reset_index(drop=True)
+            filtered = carry[_filter_mask(carry, bin_size, pressed_keys)]
+            write(filtered)
+            rows_out += len(filtered)
+    finally:
+        if log_writer:
+            log_writer.close()
+        else:
+            out.close()
+
+    return rows_in, rows_out
+
+
+ENGINES = {
+    "vectorized": bin_and_filter_events_vectorized,
+    "reference": bin_and_filter_events,
+}
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Down sample recorded actions to ~60 FPS"
     )
     parser.add_argument(
-        "input_csv", help="Path to the input CSV file with recorded actions"
+        "input_csv",
+        help="Path to the input CSV file (or .evlog / .evlogz event log) with recorded "
+        "actions",
+    )
+    parser.add_argument(
+        "output_csv",
+        help="Path to save the down sampled CSV file, written as an event log if it "
+        "ends in .evlog (.evlogz compressed)",
     )
-    parser.add_argument("output_csv", help="Path to save the down sampled CSV file")
     parser.add_argument(
         "--bin-size",
         type=int,
         default=16,
         help="Bin size in milliseconds (default: 16 for ~60 FPS)",
     )
+    parser.add_argument(
+        "--engine",
+        choices=list(ENGINES),
+        default="vectorized",
+        help="Filtering engine; 'reference' is the original row by row loop (default: vectorized)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Stream the input in chunks of this many rows instead of loading it whole "
+        "(always uses the vectorized engine)",
+    )
+    parser.add_argument(
+        "--rates",
+        type=float,
+        nargs="+",
+        default=None,
+        help="Resample to dense rows at these rates (Hz) in one pass instead, e.g. "
+        "--rates 10 30 60 120; writes <output>_<rate>hz.csv for each",
+    )
+    parser.add_argument(
+        "--interpolation",
+        choices=METHODS,
+        default="linear",
+        help="Mouse position between moves with --rates (default: linear)",
+    )
+    parser.add_argument(
+        "--max-gap",
+        type=float,
+        default=100.0,
+        help="With linear interpolation, moves further apart than this many ms are "
+        "treated as the mouse resting in between (default: 100)",
+    )
     args = parser.parse_args()
 
     try:
+        if args.rates:
+            print(f"Reading input file: {args.input_csv}")
+            df = preprocess_events(read_events(args.input_csv))
+            print(f"Resampling to {', '.join(f'{r:g}' for r in args.rates)} Hz")
+            frames = resample_events(
+                df, args.rates, method=args.interpolation, max_gap=args.max_gap
+            )
+            print(f"\nOriginal: {len(df)} rows")
+            for rate, frame in frames.items():
+                path = rate_output_path(args.output_csv, rate)
+                frame.to_csv(path, index=False)
+                print(f"{rate:g} Hz: {len(frame)} rows saved to: {path}")
+            return
+
+        if args.chunk_size:
+            print(f"Streaming input file: {args.input_csv}")
+            print(
+                f"Processing with bin size: {args.bin_size}ms, "
+                f"chunk size: {args.chunk_size} rows"
+            )
+            rows_in, rows_out = stream_bin_and_filter_events(
+                args.input_csv,
+                args.output_csv,
+                bin_size=args.bin_size,
+                chunk_size=args.chunk_size,
+            )
+            print(f"\nOriginal: {rows_in} rows")
+            print(f"Filtered: {rows_out} rows")
+            print(f"Output saved to: {args.output_csv}")
+            return
+
         # Read input CSV
         print(f"Reading input file: {args.input_csv}")
-        df = pd.read_csv(args.input_csv)
+        df = read_events(args.input_csv)
 
         # Pre-process: change mouse_dragged to mouse_moved, and remove mouse_clicked
-        df["event_type"] = df["event_type"].replace("mouse_dragged", "mouse_moved")
-        df = df[df["event_type"] != "mouse_clicked"]
+        df = preprocess_events(df)
 
         # Process the data
-        print(f"Processing with bin size: {args.bin_size}ms")
-        filtered = bin_and_filter_events(df, bin_size=args.bin_size)
+        print(f"Processing with bin size: {args.bin_size}ms ({args.engine} engine)")
+        filtered = ENGINES[args.engine](df, bin_size=args.bin_size)
 
         # Save results
-        filtered.to_csv(args.output_csv, index=False)
+        write_events(filtered, args.output_csv)
         print(f"\nOriginal: {len(df)} rows")
         print(f"Filtered: {len(filtered)} rows")
         print(f"Output saved to: {args.output_csv}")
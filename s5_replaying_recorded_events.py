@@ -1,10 +1,13 @@
+import os
 import sys
 import time
-import pandas as pd
+import argparse
+import numpy as np
 
 from pynput.mouse import Controller as MouseController
 from pynput.keyboard import Controller as KeyboardController
 from keycodes import MOUSE_BUTTON_MAP, KEY_CODE_MAP
+from event_log import read_events
 
 
 def convert_to_pynput_mouse_button(obs_button_code):
@@ -22,87 +25,395 @@ def convert_to_pynput_key(obs_key_code):
     return None
 
 
-def replay_events(csv_path):
-    df = pd.read_csv(csv_path)
-    df = df.sort_values(by="time", ascending=True).reset_index(drop=True)
+# Sleep until this close to a deadline, then busy wait the rest. OS sleeps can
+# overshoot by a millisecond or more, spinning is exact but burns a core.
+SPIN_THRESHOLD_NS = 2_000_000
 
+
+def wait_until(deadline_ns: int):
+    """Hybrid sleep-then-spin wait for an absolute perf_counter_ns deadline."""
+    remaining = deadline_ns - time.perf_counter_ns()
+    if remaining > SPIN_THRESHOLD_NS:
+        time.sleep((remaining - SPIN_THRESHOLD_NS) / 1e9)
+    while time.perf_counter_ns() < deadline_ns:
+        pass
+
+
+def lateness_report(lateness_ns) -> dict:
+    """Summarize how late each event was dispatched, in milliseconds."""
+    if len(lateness_ns) == 0:
+        return {}
+    late_ms = np.asarray(lateness_ns, dtype=np.float64) / 1e6
+    return {
+        "events": len(late_ms),
+        "p50_ms": float(np.percentile(late_ms, 50)),
+        "p99_ms": float(np.percentile(late_ms, 99)),
+        "max_ms": float(late_ms.max()),
+        "mean_ms": float(late_ms.mean()),
+        # How far behind the recording the last event ran
+        "drift_ms": float(late_ms[-1]),
+    }
+
+
+# Replay plan opcodes
+OP_MOVE = 0
+OP_MOUSE_PRESS = 1
+OP_MOUSE_RELEASE = 2
+OP_KEY_PRESS = 3
+OP_KEY_RELEASE = 4
+
+EVENT_OPCODES = {
+    "mouse_moved": OP_MOVE,
+    "mouse_pressed": OP_MOUSE_PRESS,
+    "mouse_released": OP_MOUSE_RELEASE,
+    "key_pressed": OP_KEY_PRESS,
+    "key_released": OP_KEY_RELEASE,
+}
+
+OPCODE_NAMES = {
+    OP_MOUSE_PRESS: "Mouse pressed",
+    OP_MOUSE_RELEASE: "Releasing mouse",
+    OP_KEY_PRESS: "Pressing key",
+    OP_KEY_RELEASE: "Releasing key",
+}
+
+PLAN_VERSION = 1
+PLAN_CACHE_SUFFIX = ".plan.npz"
+
+
+class ReplayPlan:
+    """
+    Flat arrays of pre-resolved actions, one entry per action to dispatch.
+
+    `opcode`, `code` (plugin keycode or mouse button), `x`, `y` and `time_ms`
+    (relative to the first action) are numpy arrays and are what gets cached.
+    `targets` holds the pynput key / button object of every action, resolved once
+    from `code` when the plan is built or loaded.
+    """
+
+    def __init__(self, opcode, code, x, y, time_ms, targets=None):
+        self.opcode = opcode
+        self.code = code
+        self.x = x
+        self.y = y
+        self.time_ms = time_ms
+        self.targets = self._resolve_targets() if targets is None else targets
+
+    def __len__(self):
+        return len(self.opcode)
+
+    def index_at(self, t_ms: float) -> int:
+        """Index of the first action at or after `t_ms`, by binary search on time."""
+        return int(np.searchsorted(self.time_ms, t_ms, side="left"))
+
+    def slice(self, start: int, end: int):
+        """Actions [start, end) as a plan sharing this plan's arrays."""
+        return ReplayPlan(
+            self.opcode[start:end],
+            self.code[start:end],
+            self.x[start:end],
+            self.y[start:end],
+            self.time_ms[start:end],
+            targets=self.targets[start:end],
+        )
+
+    def state_at(self, index: int):
+        """
+        Input state right before action `index`.
+
+        Returns the mouse position (None if the mouse has not moved yet) and the
+        mouse button / key actions still held, as (opcode, target) press actions in
+        the order they were pressed.
+        """
+        opcode = self.opcode[:index]
+        moves = np.flatnonzero(opcode == OP_MOVE)
+        position = (int(self.x[moves[-1]]), int(self.y[moves[-1]])) if len(moves) else None
+
+        idx = np.flatnonzero(opcode != OP_MOVE)
+        if len(idx) == 0:
+            return position, []
+        # Mouse buttons and keys have separate code spaces
+        is_key = opcode[idx] >= OP_KEY_PRESS
+        ids = self.code[idx].astype(np.int64) * 2 + is_key
+        # Last press/release of every button and key
+        _, first_reversed = np.unique(ids[::-1], return_index=True)
+        last = np.sort(idx[len(idx) - 1 - first_reversed])
+        held = [
+            (int(self.opcode[i]), self.targets[i])
+            for i in last
+            if self.opcode[i] in (OP_MOUSE_PRESS, OP_KEY_PRESS)
+        ]
+        return position, held
+
+    def _resolve_targets(self):
+        # One lookup per distinct (kind, code) instead of one per action
+        is_mouse = (self.opcode == OP_MOUSE_PRESS) | (self.opcode == OP_MOUSE_RELEASE)
+        is_key = (self.opcode == OP_KEY_PRESS) | (self.opcode == OP_KEY_RELEASE)
+        targets = [None] * len(self.opcode)
+        for mask, convert in (
+            (is_mouse, convert_to_pynput_mouse_button),
+            (is_key, convert_to_pynput_key),
+        ):
+            idx = np.flatnonzero(mask)
+            resolved = {c: convert(c) for c in np.unique(self.code[idx]).tolist()}
+            for i, c in zip(idx.tolist(), self.code[idx].tolist()):
+                targets[i] = resolved[c]
+        return targets
+
+    def save(self, path: str, source_path: str = None):
+        stat = os.stat(source_path) if source_path else None
+        np.savez(
+            path,
+            version=PLAN_VERSION,
+            source_mtime_ns=stat.st_mtime_ns if stat else -1,
+            source_size=stat.st_size if stat else -1,
+            opcode=self.opcode,
+            code=self.code,
+            x=self.x,
+            y=self.y,
+            time_ms=self.time_ms,
+        )
+
+    @classmethod
+    def load(cls, path: str, source_path: str = None):
+        """Load a cached plan, None if it is missing or stale for `source_path`."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if int(data["version"]) != PLAN_VERSION:
+                    return None
+                if source_path:
+                    stat = os.stat(source_path)
+                    if (
+                        int(data["source_mtime_ns"]) != stat.st_mtime_ns
+                        or int(data["source_size"]) != stat.st_size
+                    ):
+                        return None
+                return cls(
+                    data["opcode"], data["code"], data["x"], data["y"], data["time_ms"]
+                )
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring unreadable replay plan {path}: {e}")
+            return None
+
+
+def compile_plan(df) -> ReplayPlan:
+    """Turn recorded (or down sampled) events into a replay plan."""
+    df = df.sort_values(by="time", ascending=True, kind="stable")
+    opcode = df["event_type"].map(EVENT_OPCODES)
+    df = df[opcode.notna()]
+    opcode = opcode[opcode.notna()].to_numpy(dtype=np.int8)
+
+    is_key = (opcode == OP_KEY_PRESS) | (opcode == OP_KEY_RELEASE)
+    code = np.where(
+        is_key,
+        df["keycode"].fillna(-1).to_numpy(),
+        df["button"].fillna(-1).to_numpy(),
+    ).astype(np.int32)
+    x = df["x"].fillna(0).to_numpy().astype(np.int32)
+    y = df["y"].fillna(0).to_numpy().astype(np.int32)
+    time_ms = df["time"].to_numpy(dtype=np.float64)
+    if len(time_ms):
+        time_ms = time_ms - time_ms[0]
+
+    plan = ReplayPlan(opcode, code, x, y, time_ms)
+
+    # Presses and releases that map to nothing are dropped here, once
+    keep = np.array(
+        [
+            op == OP_MOVE or target is not None
+            for op, target in zip(opcode.tolist(), plan.targets)
+        ],
+        dtype=bool,
+    )
+    if not keep.all():
+        plan = ReplayPlan(opcode[keep], code[keep], x[keep], y[keep], time_ms[keep])
+    return plan
+
+
+def load_plan(path: str, use_cache: bool = True) -> ReplayPlan:
+    """
+    Compile the plan for a recording, reusing the cached plan next to it
+    (`<path>.plan.npz`) when it is newer than the recording.
+    """
+    cache_path = path + PLAN_CACHE_SUFFIX
+    if use_cache:
+        plan = ReplayPlan.load(cache_path, source_path=path)
+        if plan is not None:
+            print(f"Using cached replay plan: {cache_path}")
+            return plan
+
+    plan = compile_plan(read_events(path))
+    if use_cache:
+        try:
+            plan.save(cache_path, source_path=path)
+        except OSError as e:
+            print(f"Could not cache replay plan: {e}")
+    return plan
+
+
+def replay_plan(
+    plan: ReplayPlan, verbose=False, speed=1.0, start_s=None, end_s=None
+):
+    """
+    Replay a plan.
+
+    `speed` scales time (2.0 plays twice as fast), 0 dispatches as fast as possible.
+    `start_s` / `end_s` limit replay to a window, in seconds from the first action.
+    When starting mid-recording the mouse position and the held buttons and keys are
+    restored first, and anything still held at the end of the window is released.
+    """
     mouse = MouseController()
     keyboard = KeyboardController()
+    controllers = {
+        OP_MOUSE_PRESS: (mouse.press, mouse.release),
+        OP_KEY_PRESS: (keyboard.press, keyboard.release),
+    }
 
-    # move mouse to first event where event_type is mouse_moved
-    for i in range(len(df)):
-        row = df.loc[i]
-        if row["event_type"] == "mouse_moved":
-            mouse.position = (row["x"], row["y"])
-            break
+    start = plan.index_at(start_s * 1000) if start_s else 0
+    end = plan.index_at(end_s * 1000) if end_s is not None else len(plan)
+    position, held = plan.state_at(start)
+    window = plan.slice(start, max(start, end))
 
-    if len(df) == 0:
+    if len(window) == 0:
         print("No events to replay.")
-        return
+        return {}
+
+    if start > 0:
+        print(f"Seeking to {window.time_ms[0] / 1000:.3f}s ({len(held)} held)")
+    if position is not None:
+        mouse.position = position
+    for op, target in held:
+        controllers[op][0](target)
+
+    # Plain python lists, indexing numpy arrays per action is slower
+    opcodes = window.opcode.tolist()
+    targets = window.targets
+    xs = window.x.tolist()
+    ys = window.y.tolist()
+    if speed:
+        offsets_ns = (
+            (window.time_ms - window.time_ms[0]) * (1_000_000 / speed)
+        ).astype(np.int64).tolist()
+    else:
+        offsets_ns = [0] * len(opcodes)
 
-    # We'll sleep according to deltas between consecutive events
-    previous_time = df.loc[0, "time"]
+    # move mouse to first mouse move
+    moves = np.flatnonzero(window.opcode == OP_MOVE)
+    if position is None and len(moves):
+        mouse.position = (xs[moves[0]], ys[moves[0]])
 
-    for i in range(len(df)):
-        row = df.loc[i]
-        t_current = row["time"]
-        event_type = row["event_type"]
+    # Every action gets an absolute deadline relative to the first one, so time
+    # spent dispatching never accumulates into drift. Without a speed every
+    # deadline is the start, and lateness is the time spent dispatching.
+    lateness_ns = [0] * len(opcodes)
+    start_ns = time.perf_counter_ns()
 
-        if event_type == "mouse_moved":
-            mouse.position = (row["x"], row["y"])
+    for i, op in enumerate(opcodes):
+        deadline_ns = start_ns + offsets_ns[i]
+        if speed:
+            wait_until(deadline_ns)
+        lateness_ns[i] = time.perf_counter_ns() - deadline_ns
 
-        elif event_type == "mouse_pressed":
-            btn = convert_to_pynput_mouse_button(row["button"])
-            if btn:
-                print(f"Mouse pressed: {btn}")
-                mouse.press(btn)
-                time.sleep(0.01)
+        if op == OP_MOVE:
+            mouse.position = (xs[i], ys[i])
+        elif op == OP_MOUSE_PRESS:
+            mouse.press(targets[i])
+        elif op == OP_MOUSE_RELEASE:
+            mouse.release(targets[i])
+        elif op == OP_KEY_PRESS:
+            keyboard.press(targets[i])
+        elif op == OP_KEY_RELEASE:
+            keyboard.release(targets[i])
 
-        elif event_type == "mouse_released":
-            btn = convert_to_pynput_mouse_button(row["button"])
-            if btn:
-                print(f"Releasing mouse: {btn}")
-                mouse.release(btn)
+        if verbose and op != OP_MOVE:
+            print(f"{OPCODE_NAMES[op]}: {targets[i]}")
 
-        elif event_type == "key_pressed":
-            key_obj = convert_to_pynput_key(row["keycode"])
-            if key_obj:
-                print(f"Pressing key: {key_obj}")
-                keyboard.press(key_obj)
+    if end < len(plan):
+        _, still_held = plan.state_at(end)
+        for op, target in reversed(still_held):
+            controllers[op][1](target)
 
-        elif event_type == "key_released":
-            key_obj = convert_to_pynput_key(row["keycode"])
-            if key_obj:
-                print(f"Releasing key: {key_obj}")
-                keyboard.release(key_obj)
+    return lateness_report(lateness_ns)
 
-        # Sleep after performing the action
-        dt = (t_current - previous_time) / 1000.0  # If 'time' is in ms
-        if dt > 0:
-            time.sleep(dt)
 
-        previous_time = t_current
+def replay_events(
+    csv_path, verbose=False, use_cache=True, speed=1.0, start_s=None, end_s=None
+):
+    return replay_plan(
+        load_plan(csv_path, use_cache=use_cache),
+        verbose=verbose,
+        speed=speed,
+        start_s=start_s,
+        end_s=end_s,
+    )
+
+
+def print_lateness_report(report: dict):
+    if not report:
+        return
+    print(
+        f"Lateness over {report['events']} events (ms): "
+        f"p50={report['p50_ms']:.3f}, p99={report['p99_ms']:.3f}, "
+        f"max={report['max_ms']:.3f}, mean={report['mean_ms']:.3f}"
+    )
+    print(f"Total drift: {report['drift_ms']:.3f} ms")
 
 
 def main():
-    # If you want a simple CLI usage: `python replay.py path_to_filtered.csv`
-    if len(sys.argv) < 2:
-        print(f"Usage: python {sys.argv[0]} <path_to_csv>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Replay recorded actions")
+    parser.add_argument("csv_path", help="Path to the (down sampled) actions csv")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Time scale, e.g. 2 for twice as fast, 0 for as fast as possible (default: 1)",
+    )
+    parser.add_argument(
+        "--start", type=float, default=None, help="Start at this many seconds in"
+    )
+    parser.add_argument(
+        "--end", type=float, default=None, help="Stop at this many seconds in"
+    )
+    parser.add_argument(
+        "--countdown",
+        type=int,
+        default=5,
+        help="Seconds to wait before replaying (default: 5)",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Print every key and button event"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always recompile the replay plan instead of using the cached one",
+    )
+    args = parser.parse_args()
 
-    csv_path = sys.argv[1]
+    if args.speed < 0:
+        print("Error: --speed must not be negative")
+        sys.exit(1)
 
     # Countdown so you can prepare (e.g., focus the correct window)
-    print("Replaying events from:", csv_path)
-    countdown = 5
-    print(f"Starting in {countdown} seconds...")
-    for i in range(countdown, 0, -1):
+    print("Replaying events from:", args.csv_path)
+    print(f"Starting in {args.countdown} seconds...")
+    for i in range(args.countdown, 0, -1):
         print(i)
         time.sleep(1)
 
     print("Go!")
-    replay_events(csv_path)
+    report = replay_events(
+        args.csv_path,
+        verbose=args.verbose,
+        use_cache=not args.no_cache,
+        speed=args.speed,
+        start_s=args.start,
+        end_s=args.end,
+    )
     print("Replay complete.")
+    print_lateness_report(report)
 
 
 if __name__ == "__main__":
@@ -3,11 +3,30 @@ import argparse
 from threading import Thread
 
 import socket
-from websocket import WebSocketApp
-from websocket_server import WebsocketServer
+from websocket import ABNF, WebSocketApp
 
 from pynput import mouse, keyboard
 
+from input_protocol import (
+    FLAG_PRESSED,
+    INPUT_KEY,
+    INPUT_MOUSE_CLICK,
+    INPUT_MOUSE_MOVE,
+    INPUT_MOUSE_SCROLL,
+    BinaryWebsocketServer,
+    InputSender,
+    button_code,
+    decode_batch,
+    events_to_dataframe,
+    key_code,
+)
+from async_server import AsyncWebsocketServer
+from event_log import is_log_path, make_log_writer
+
+# Input event transports: batched binary records (see input_protocol.py) or the
+# original one text message per event
+PROTOCOLS = ["binary", "text"]
+
 
 class Node:
     def __init__(self, host, port):
@@ -28,39 +47,92 @@ class Node:
 
 
 class Server(Node):
-    def __init__(self, host="0.0.0.0", port=8765):
+    def __init__(
+        self, host="0.0.0.0", port=8765, record_path=None, server_kind="thread"
+    ):
         super().__init__(host, port)
-        self.server = WebsocketServer(self.host, self.port)
+        # "async" handles every client on one event loop instead of a thread each
+        if server_kind == "async":
+            self.server = AsyncWebsocketServer(self.host, self.port)
+        else:
+            self.server = BinaryWebsocketServer(self.host, self.port)
+        # Decoded input events are appended here, csv or event log
+        self.record_path = record_path
+        self.recorder = None
+        if record_path and is_log_path(record_path):
+            self.recorder = make_log_writer(record_path)
+        self._csv_header = True
+        self.events_received = 0
+        self.batches_received = 0
         self._setup_handlers()
 
     def _setup_handlers(self):
         self.server.set_fn_new_client(self._new_client)
         self.server.set_fn_client_left(self._client_left)
         self.server.set_fn_message_received(self._message_received)
+        self.server.set_fn_binary_received(self._binary_received)
 
     def _new_client(self, client, server):
         print(f"New client connected: {client['address']}")
 
     def _client_left(self, client, server):
         print(f"Client disconnected: {client['address']}")
+        print(
+            f"Received {self.events_received} input events in "
+            f"{self.batches_received} batches"
+        )
 
     def _message_received(self, client, server, message):
         print(f"\nReceived: {message}")
         sys.stdout.write("> ")
         sys.stdout.flush()
 
+    def _binary_received(self, client, server, message):
+        try:
+            events = decode_batch(message)
+        except ValueError as e:
+            print("Failed to decode input batch:", e)
+            return
+        self.batches_received += 1
+        self.events_received += len(events)
+        self.on_events(events)
+
+    def on_events(self, events):
+        """Handle a batch of INPUT_DTYPE events, records them if a path was given."""
+        if not self.record_path:
+            return
+        df = events_to_dataframe(events)
+        if self.recorder:
+            self.recorder.write_frame(df)
+        else:
+            df.to_csv(
+                self.record_path,
+                mode="w" if self._csv_header else "a",
+                header=self._csv_header,
+                index=False,
+            )
+            self._csv_header = False
+
     def start(self):
         print(f"Server started on {self.host}:{self.port}")
         try:
             self.server.run_forever()
         except KeyboardInterrupt:
             self.server.shutdown()
+        finally:
+            if self.recorder:
+                self.recorder.close()
 
 
 class Client(Node):
-    def __init__(self, server_ip, port=8765):
+    def __init__(self, server_ip, port=8765, protocol="binary", batch_ms=2.0):
         super().__init__(server_ip, port)
         self.ws = None
+        self.protocol = protocol
+        # Only format text messages when they are sent
+        self.text = protocol == "text"
+        self.batch_ms = batch_ms
+        self.sender = None
         self.mouse_listener = mouse.Listener(
             on_move=self._on_mouse_move,
             on_click=self._on_mouse_click,
@@ -83,7 +155,24 @@ class Client(Node):
 
         self.mouse_listener.start()
         self.keyboard_listener.start()
-        self.ws.run_forever()
+        # The socket runs on its own thread so Ctrl+C lands here while it is still
+        # open, and the queued input events can be sent before it closes
+        ws_thread = Thread(target=self.ws.run_forever, daemon=True)
+        ws_thread.start()
+        try:
+            while ws_thread.is_alive():
+                ws_thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            ws_thread.join(timeout=2)
+
+    def stop(self):
+        """Stop listening, send the queued input events, then close the socket."""
+        self.mouse_listener.stop()
+        self.keyboard_listener.stop()
+        if self.sender:
+            self.sender.close()
+        self.ws.close()
 
     
     def _on_message(self, ws, message):
@@ -95,36 +184,83 @@ class Client(Node):
     def _on_close(self, ws, close_status_code, close_msg):
         self.mouse_listener.stop()
         self.keyboard_listener.stop()
+        if self.sender:
+            # stop() already sent the queue; if the server closed the connection,
+            # what is left cannot be sent anymore
+            self.sender.close(drain=False)
+            print(self.sender.summary())
         print("Connection closed")
 
     def _on_open(self, ws):
         print("Connected to server")
+        # Listener callbacks only queue events, this sender thread does the sends
+        binary = self.protocol == "binary"
+        opcode = ABNF.OPCODE_BINARY if binary else ABNF.OPCODE_TEXT
+        self.sender = InputSender(
+            lambda data: ws.send(data, opcode=opcode),
+            binary=binary,
+            window_ms=self.batch_ms,
+        )
         Thread(target=self._send_messages, daemon=True).start()
 
     def _send_messages(self):
         while True:
             message = input("> ")
+            if message == "stats" and self.sender:
+                print(self.sender.summary())
+                continue
             self.ws.send(message)
 
     def _on_mouse_move(self, x, y):
-        if self.ws:
-            self.ws.send(f"mouse_move {x}, {y}")
+        if self.sender:
+            self.sender.add(
+                INPUT_MOUSE_MOVE,
+                int(x),
+                int(y),
+                text=self.text and f"mouse_move {x}, {y}",
+            )
 
     def _on_mouse_click(self, x, y, button, pressed):
-        if self.ws:
-            self.ws.send(f"mouse_click {x}, {y}, {button}, {pressed}")
+        if self.sender:
+            self.sender.add(
+                INPUT_MOUSE_CLICK,
+                int(x),
+                int(y),
+                code=button_code(button),
+                flags=FLAG_PRESSED if pressed else 0,
+                text=self.text and f"mouse_click {x}, {y}, {button}, {pressed}",
+            )
 
     def _on_mouse_scroll(self, x, y, dx, dy):
-        if self.ws:
-            self.ws.send(f"mouse_scroll {x}, {y}, {dx}, {dy}")
+        if self.sender:
+            self.sender.add(
+                INPUT_MOUSE_SCROLL,
+                int(x),
+                int(y),
+                dx=int(dx),
+                dy=int(dy),
+                text=self.text and f"mouse_scroll {x}, {y}, {dx}, {dy}",
+            )
 
     def _on_keyboard_press(self, key):
-        if self.ws:
-            self.ws.send(f"keyboard_press {key}")
+        if self.sender:
+            code, flags = key_code(key)
+            self.sender.add(
+                INPUT_KEY,
+                code=code,
+                flags=flags | FLAG_PRESSED,
+                text=self.text and f"keyboard_press {key}",
+            )
 
     def _on_keyboard_release(self, key):
-        if self.ws:
-            self.ws.send(f"keyboard_release {key}")
+        if self.sender:
+            code, flags = key_code(key)
+            self.sender.add(
+                INPUT_KEY,
+                code=code,
+                flags=flags,
+                text=self.text and f"keyboard_release {key}",
+            )
 
 
 def main():
@@ -134,6 +270,11 @@ def main():
 
     Client:
         python s6_io_test_nodes.py --mode client --ip SERVER_IP
+
+    Type `stats` in the client to print send latency and backlog.
+
+    Record the received input events, ready for s4 down sampling:
+        python s6_io_test_nodes.py --mode server --record events.csv
     """
     parser = argparse.ArgumentParser(description="WebSocket Node")
     parser.add_argument(
@@ -143,6 +284,30 @@ def main():
     parser.add_argument(
         "--port", type=int, default=8765, help="Port number (default: 8765)"
     )
+    parser.add_argument(
+        "--protocol",
+        choices=PROTOCOLS,
+        default="binary",
+        help="Client: send input events as batched binary records or one text "
+        "message each (default: binary)",
+    )
+    parser.add_argument(
+        "--batch-ms",
+        type=float,
+        default=2.0,
+        help="Client: batch input events over this many ms, 1 to 4 (default: 2)",
+    )
+    parser.add_argument(
+        "--server-kind",
+        choices=["thread", "async"],
+        default="thread",
+        help="Server: a thread per client, or one asyncio loop for all clients "
+        "(needs `pip install websockets`, default: thread)",
+    )
+    parser.add_argument(
+        "--record",
+        help="Server: append received input events to this csv or .evlog file",
+    )
 
     args = parser.parse_args()
 
@@ -153,11 +318,23 @@ def main():
     print(f"Local IP: {local_ip}")
 
     if args.mode == "server":
-        node = Server(host="0.0.0.0", port=args.port)
+        node = Server(
+            host="0.0.0.0",
+            port=args.port,
+            record_path=args.record,
+            server_kind=args.server_kind,
+        )
     else:
         if not args.ip:
             args.ip = input("Enter server IP address: ")
-        node = Client(server_ip=args.ip, port=args.port)
+        if not 1 <= args.batch_ms <= 4:
+            parser.error("--batch-ms must be between 1 and 4")
+        node = Client(
+            server_ip=args.ip,
+            port=args.port,
+            protocol=args.protocol,
+            batch_ms=args.batch_ms,
+        )
 
     node.start()
 
@@ -1,16 +1,40 @@
-import sys
 import argparse
 from threading import Thread
 import socket
 from websocket import WebSocketApp
 from websocket_server import WebsocketServer
 
-from pynput import mouse, keyboard
-from PIL import ImageGrab, Image
-import io
+import json
 import time
 import base64
 from tqdm import tqdm
+from PIL import Image
+
+from async_server import AsyncWebsocketServer
+from frame_broadcast import FrameBroadcaster, format_broadcast_stats
+from frame_codecs import ENCODERS, FrameDecoder, JpegEncoder, make_encoder
+from frame_control import AdaptiveController
+from frame_pipeline import FramePipeline, format_stats
+from frame_receiver import FrameReceiver, format_receiver_stats
+from frame_sources import make_frame_source
+from frame_protocol import (
+    CODEC_JPEG,
+    is_frame_message,
+    pack_frame_header,
+    send_binary,
+    unpack_frame,
+)
+
+# Frame transports: binary frame messages (see frame_protocol.py) or the original
+# base64 encoded text messages
+TRANSPORTS = ["binary", "base64"]
+
+RESOLUTIONS = [
+    (1280, 720),   # 720p
+    (1920, 1080),  # 1080p
+    (2560, 1440),  # 1440p
+    (3840, 2160),  # 2160p
+]
 
 
 class Node:
@@ -31,16 +55,157 @@ class Node:
         return ip
 
 
+def stream_sequential(source, width, height, frame_count, send, encoder=None):
+    """
+    Capture, encode and send `frame_count` frames one after another.
+
+    `send(frame_id, capture_ns, size, data, codec)` returns the bytes it put on the
+    wire. `encoder` defaults to a full JPEG per frame (see frame_codecs.py).
+    """
+    encoder = encoder or JpegEncoder()
+    source.prepare(width, height)
+    start_time = time.time()
+    total_bytes = 0
+    frame_stats = []
+    with tqdm(total=frame_count, desc="Capturing frames") as pbar:
+        for i in range(frame_count):
+            frame_start = time.time()
+            capture_ns = time.time_ns()
+            img = source.grab(width, height)
+            codec, data = encoder.encode(img)
+            sent = send(i, capture_ns, (width, height), data, codec)
+            frame_time = time.time() - frame_start
+            frame_stats.append({"bytes": sent, "time_ms": frame_time * 1000})
+            total_bytes += sent
+            pbar.update(1)
+
+    duration = time.time() - start_time
+    times = [s["time_ms"] for s in frame_stats]
+    sizes = [s["bytes"] for s in frame_stats]
+    return {
+        "sent": frame_count,
+        "bytes": total_bytes,
+        "duration_s": duration,
+        "fps": frame_count / duration,
+        "mb_per_s": total_bytes / 1024 / 1024 / duration,
+        "time_ms": {"min": min(times), "max": max(times), "mean": sum(times) / len(times)},
+        "size_bytes": {"min": min(sizes), "max": max(sizes), "mean": sum(sizes) / len(sizes)},
+    }
+
+
+def print_sequential_stats(stats, label):
+    times = stats["time_ms"]
+    sizes = stats["size_bytes"]
+    print(
+        f"\nFrame timing (ms): min={times['min']:.1f}, max={times['max']:.1f}, mean={times['mean']:.1f}"
+    )
+    print(
+        f"Frame sizes (bytes): min={sizes['min']}, max={sizes['max']}, mean={sizes['mean']:.1f}"
+    )
+    print(
+        f"Performance ({label}): {stats['fps']:.1f} avg fps, {stats['mb_per_s']:.1f} avg MB/s"
+    )
+
+
+def run_headless_benchmark(
+    source,
+    resolutions,
+    frame_count,
+    encoders,
+    encoder_kind,
+    codec="jpeg",
+    results_path=None,
+):
+    """
+    Sweep `resolutions` through the sequential and pipelined streamers without a
+    client, encoded frames are discarded. With `results_path` every run is appended
+    as a json line so throughput can be tracked over time. `codec` applies to the
+    sequential streamer, the pipelined one always sends full JPEGs.
+    """
+    discard = lambda frame_id, capture_ns, size, data, codec=CODEC_JPEG: len(data)
+    for width, height in resolutions:
+        print(f"\nSequential {width}x{height} ({source.name}, {codec})")
+        sequential = stream_sequential(
+            source, width, height, frame_count, discard, make_encoder(codec)
+        )
+        print_sequential_stats(sequential, "sequential")
+
+        print(f"\nPipelined {width}x{height} ({encoders} {encoder_kind} encoders)")
+        source.prepare(width, height)
+        pipeline = FramePipeline(
+            capture=lambda: source.grab(width, height),
+            send=discard,
+            encoders=encoders,
+            encoder_kind=encoder_kind,
+        )
+        pipelined = pipeline.run(frame_count)
+        print(format_stats(pipelined))
+
+        if results_path:
+            with open(results_path, "a") as f:
+                for mode, stats in (("sequential", sequential), ("pipelined", pipelined)):
+                    record = {
+                        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "host": socket.gethostname(),
+                        "source": source.name,
+                        "mode": mode,
+                        "codec": codec if mode == "sequential" else "jpeg",
+                        "width": width,
+                        "height": height,
+                        "frames": frame_count,
+                        "encoders": encoders if mode == "pipelined" else 1,
+                        "encoder_kind": encoder_kind if mode == "pipelined" else None,
+                        **stats,
+                    }
+                    f.write(json.dumps(record) + "\n")
+    if results_path:
+        print(f"\nResults appended to: {results_path}")
+
+
 class Server(Node):
-    def __init__(self, host="0.0.0.0", port=8765):
+    def __init__(
+        self,
+        host="0.0.0.0",
+        port=8765,
+        encoders=4,
+        encoder_kind="thread",
+        source=None,
+        frame_count=1000,
+        codec="jpeg",
+        latency_budget_ms=100.0,
+        control_log=None,
+        server_kind="thread",
+        broadcast_size=(1280, 720),
+        broadcast_fps=30,
+    ):
         super().__init__(host, port)
-        self.server = WebsocketServer(self.host, self.port)
-        self.resolutions = [
-            (1280, 720),   # 720p
-            (1920, 1080),  # 1080p
-            (2560, 1440),  # 1440p
-            (3840, 2160),  # 2160p
-        ]
+        source = source or make_frame_source("screen")
+        # "async" serves many clients on one event loop and broadcasts a shared
+        # stream to the subscribers; the benchmarks need the threaded server
+        self.broadcaster = None
+        if server_kind == "async":
+            self.server = AsyncWebsocketServer(self.host, self.port)
+            width, height = broadcast_size
+            self.broadcaster = FrameBroadcaster(
+                self.server,
+                source,
+                width,
+                height,
+                fps=broadcast_fps,
+                codec=codec,
+            )
+        else:
+            self.server = WebsocketServer(self.host, self.port)
+        self.encoders = encoders
+        self.encoder_kind = encoder_kind
+        self.source = source
+        self.frame_count = frame_count
+        self.codec = codec
+        self.latency_budget_ms = latency_budget_ms
+        self.control_log = control_log
+        # Adaptive streams by client id, they receive that client's acks
+        self._controllers = {}
+        self.resolutions = list(RESOLUTIONS)
         self._setup_handlers()
 
     def _setup_handlers(self):
@@ -53,43 +218,174 @@ class Server(Node):
 
     def _client_left(self, client, server):
         print(f"Client disconnected: {client['address']}")
+        if self.broadcaster:
+            self.broadcaster.unsubscribe(client)
 
     def _message_received(self, client, server, message):
-        if message == "start":
-            for width, height in self.resolutions:
-                print(f"\nTesting {width}x{height}")
-                region = (0, 0, width, height)
-                frame_count = 1000
-                start_time = time.time()
-                total_bytes = 0
-                frame_stats = []
-                with tqdm(total=frame_count, desc="Capturing frames") as pbar:
-                    for i in range(frame_count):
-                        frame_start = time.time()
-                        img = ImageGrab.grab(bbox=region)
-                        buf = io.BytesIO()
-                        img.save(buf, format="JPEG", quality=50)
-                        frame_data = base64.b64encode(buf.getvalue()).decode("utf-8")
-                        self.server.send_message(client, frame_data)
-                        frame_time = time.time() - frame_start
-                        frame_stats.append(
-                            {"bytes": len(frame_data), "time_ms": frame_time * 1000}
-                        )
-                        total_bytes += len(frame_data)
-                        pbar.update(1)
-
-                duration = time.time() - start_time
-                times = [s["time_ms"] for s in frame_stats]
-                sizes = [s["bytes"] for s in frame_stats]
+        if self.broadcaster:
+            self._broadcast_command(client, server, message)
+            return
+        # "start" streams binary frames, "start base64" the original text
+        # messages, "start compare" runs both for every resolution.
+        # "pipeline [transport]" runs the pipelined streamer instead.
+        # "adaptive [WxH] [seconds]" streams with the adaptive controller.
+        command, _, transport = message.partition(" ")
+        if command == "ack":
+            controller = self._controllers.get(client["id"])
+            if controller:
+                frame_id, _, receive_ns = transport.partition(" ")
+                controller.on_ack(int(frame_id), int(receive_ns or 0))
+        elif command == "adaptive":
+            args = transport.split()
+            width, height = (1920, 1080)
+            if args and "x" in args[0]:
+                width, height = (int(v) for v in args.pop(0).split("x"))
+            duration = float(args[0]) if args else 30.0
+            # Stream from another thread, this one has to keep reading the acks
+            Thread(
+                target=self._run_adaptive,
+                args=(client, width, height, duration),
+                daemon=True,
+            ).start()
+        elif command in ("start", "pipeline"):
+            transport = transport or "binary"
+            transports = TRANSPORTS if transport == "compare" else [transport]
+            if any(t not in TRANSPORTS for t in transports):
+                server.send_message(client, f"Unknown transport '{transport}'")
+                return
+            if command == "start" and self.codec != "jpeg" and "base64" in transports:
+                # Text messages carry no frame header to tell the codec apart
+                server.send_message(client, f"{self.codec} codec needs binary transport")
+                return
+            if command == "start":
+                self._run_benchmark(client, transports)
+            else:
+                self._run_pipelined(client, transports)
+
+    def _broadcast_command(self, client, server, message):
+        # Async server: "subscribe" / "unsubscribe" to the shared stream, "stats"
+        if message == "subscribe":
+            self.broadcaster.subscribe(client)
+            print(f"Client {client['id']} subscribed")
+        elif message == "unsubscribe":
+            self.broadcaster.unsubscribe(client)
+        elif message == "stats":
+            server.send_message(
+                client, format_broadcast_stats(self.broadcaster.stats())
+            )
+        elif message.startswith("ack "):
+            pass
+        else:
+            server.send_message(
+                client, "Async server only supports subscribe, unsubscribe, stats"
+            )
+
+    def _send_encoded(
+        self, client, transport, frame_id, capture_ns, size, data, codec=CODEC_JPEG
+    ):
+        """Send one encoded frame, returns the bytes put on the wire."""
+        if transport == "binary":
+            header = pack_frame_header(frame_id, capture_ns, size[0], size[1], codec)
+            return send_binary(client, header, data)
+        frame_data = base64.b64encode(data).decode("utf-8")
+        self.server.send_message(client, frame_data)
+        return len(frame_data)
+
+    def _run_pipelined(self, client, transports, frame_count=None):
+        frame_count = frame_count or self.frame_count
+        for width, height in self.resolutions:
+            for transport in transports:
                 print(
-                    f"\nFrame timing (ms): min={min(times):.1f}, max={max(times):.1f}, mean={sum(times)/len(times):.1f}"
+                    f"\nPipelined {width}x{height} ({transport}, "
+                    f"{self.encoders} {self.encoder_kind} encoders)"
                 )
-                print(
-                    f"Frame sizes (bytes): min={min(sizes)}, max={max(sizes)}, mean={sum(sizes)/len(sizes):.1f}"
+                self.source.prepare(width, height)
+                pipeline = FramePipeline(
+                    capture=lambda: self.source.grab(width, height),
+                    send=lambda *frame: self._send_encoded(client, transport, *frame),
+                    encoders=self.encoders,
+                    encoder_kind=self.encoder_kind,
                 )
-                print(
-                    f"Performance: {frame_count/duration:.1f} avg fps, {total_bytes/1024/1024/duration:.1f} avg MB/s"
+                print(format_stats(pipeline.run(frame_count)))
+
+    def _run_adaptive(self, client, width, height, duration):
+        controller = AdaptiveController(latency_budget_ms=self.latency_budget_ms)
+        self._controllers[client["id"]] = controller
+        self.server.send_message(client, "ack on")
+        print(
+            f"\nAdaptive {width}x{height} for {duration:.0f}s "
+            f"(latency budget {self.latency_budget_ms:.0f} ms)"
+        )
+
+        self.source.prepare(width, height)
+        frame_id = 0
+        skipped = 0
+        total_bytes = 0
+        start = time.perf_counter()
+        next_frame_ns = time.perf_counter_ns()
+        try:
+            while time.perf_counter() - start < duration:
+                now_ns = time.perf_counter_ns()
+                if now_ns < next_frame_ns:
+                    time.sleep((next_frame_ns - now_ns) / 1e9)
+                    continue
+                # Pace to the target fps, without bursting to catch up
+                next_frame_ns = max(next_frame_ns, now_ns) + int(1e9 / controller.fps)
+
+                if controller.update():
+                    step = controller.history[-1]
+                    print(
+                        f"[{step['t_s']:6.1f}s] latency={step['latency_ms'] or 0:.1f}ms "
+                        f"{step['throughput_mb_s']:.1f}MB/s -> q={step['quality']} "
+                        f"scale={step['scale']} fps={step['fps']} ({step['decision']})"
+                    )
+                if not controller.can_send():
+                    skipped += 1
+                    continue
+
+                capture_ns = time.time_ns()
+                img = self.source.grab(width, height)
+                if controller.scale < 1.0:
+                    img = img.resize(
+                        (int(width * controller.scale), int(height * controller.scale)),
+                        Image.BILINEAR,
+                    )
+                codec, data = JpegEncoder(controller.quality).encode(img)
+                header = pack_frame_header(
+                    frame_id, capture_ns, img.width, img.height, codec
+                )
+                sent = send_binary(client, header, data)
+                controller.on_sent(frame_id, sent)
+                total_bytes += sent
+                frame_id += 1
+        finally:
+            self.server.send_message(client, "ack off")
+            self._controllers.pop(client["id"], None)
+
+        elapsed = time.perf_counter() - start
+        print(
+            f"Adaptive: {frame_id / elapsed:.1f} avg fps, "
+            f"{total_bytes / 1024 / 1024 / elapsed:.1f} avg MB/s, "
+            f"{skipped} frames skipped on backpressure"
+        )
+        if self.control_log:
+            controller.write_history(self.control_log)
+            print(f"Controller decisions saved to: {self.control_log}")
+
+    def _run_benchmark(self, client, transports, frame_count=None):
+        frame_count = frame_count or self.frame_count
+        for width, height in self.resolutions:
+            for transport in transports:
+                print(f"\nTesting {width}x{height} ({transport}, {self.codec})")
+                stats = stream_sequential(
+                    self.source,
+                    width,
+                    height,
+                    frame_count,
+                    lambda *frame: self._send_encoded(client, transport, *frame),
+                    make_encoder(self.codec),
                 )
+                print_sequential_stats(stats, transport)
 
     def start(self):
         print(f"Server started on {self.host}:{self.port}")
@@ -100,9 +396,23 @@ class Server(Node):
 
 
 class Client(Node):
-    def __init__(self, server_ip, port=8765):
+    # Seconds between receive pipeline reports
+    REPORT_INTERVAL = 5.0
+
+    def __init__(self, server_ip, port=8765, decode=False, decode_workers=0, history=0):
         super().__init__(server_ip, port)
         self.ws = None
+        # Decode on a worker pool into a latest frame slot, off the socket thread
+        self.receiver = (
+            FrameReceiver(workers=decode_workers, history=history)
+            if decode_workers > 0
+            else None
+        )
+        # Otherwise rebuild full and tile frames inline into one reusable buffer
+        self.decoder = FrameDecoder() if decode and not self.receiver else None
+        self._last_report = time.perf_counter()
+        # Acknowledge frames while the server runs an adaptive stream
+        self.ack = False
         self.frames_received = 0
         self.total_bytes = 0
         self.start_time = None
@@ -119,7 +429,25 @@ class Client(Node):
         self.ws.run_forever()
 
     def _on_message(self, ws, message):
-        if len(message) > 100:  # Likely base64 image data
+        if is_frame_message(message):
+            header, payload = unpack_frame(message)
+            if self.ack:
+                ws.send(f"ack {header.frame_id} {time.time_ns()}")
+            if self.receiver:
+                self.receiver.submit(header, payload)
+            elif self.decoder:
+                try:
+                    self.decoder.decode(
+                        header.codec, header.width, header.height, payload
+                    )
+                except Exception as e:
+                    print("[CLIENT] Failed to decode frame:", e)
+            self.frames_received += 1
+            self.total_bytes += len(payload)
+            if self.start_time is None:
+                self.start_time = time.time()
+            self._maybe_report()
+        elif len(message) > 100 and " " not in message:  # Likely base64 image data
             try:
                 img_data = base64.b64decode(message)
                 self.frames_received += 1
@@ -128,14 +456,26 @@ class Client(Node):
                     self.start_time = time.time()
             except Exception as e:
                 print("[CLIENT] Failed to decode image:", e)
+        elif message in ("ack on", "ack off"):
+            self.ack = message == "ack on"
         else:
             print(f"\n[CLIENT] Received text: {message}")
 
+    def _maybe_report(self):
+        now = time.perf_counter()
+        if self.receiver and now - self._last_report >= self.REPORT_INTERVAL:
+            self._last_report = now
+            stats = self.receiver.stats(reset=True)
+            print("\n[CLIENT] Receive pipeline:\n" + format_receiver_stats(stats))
+
     def _on_error(self, ws, error):
         print("[CLIENT] WebSocket error:", error)
 
     def _on_close(self, ws, close_status_code, close_msg):
         print("[CLIENT] Connection closed")
+        if self.receiver:
+            self.receiver.close()
+            print(format_receiver_stats(self.receiver.stats()))
 
     def _on_open(self, ws):
         print("[CLIENT] Connected to server")
@@ -153,31 +493,160 @@ def main():
     Usage:
         Server: python s7_stream_nodes.py --mode server
         Client: python s7_stream_nodes.py --mode client --ip <SERVER_IP>
+        Headless benchmark, no client needed:
+            python s7_stream_nodes.py --mode bench --source synthetic:text --results bench.jsonl
+
+    Then type a command in the client:
+        start [binary|base64|compare]     sequential capture/encode/send benchmark
+        pipeline [binary|base64|compare]  pipelined capture/encode/send benchmark
+        adaptive [WxH] [seconds]          stream with adaptive quality / scale / fps
+
+    Serve one shared stream to many clients (needs `pip install websockets`):
+        python s7_stream_nodes.py --mode server --server-kind async --fps 30
+    and type `subscribe`, `unsubscribe` or `stats` in each client.
     """
     import argparse
 
     parser = argparse.ArgumentParser(description="WebSocket Node")
     parser.add_argument(
-        "--mode", choices=["server", "client"], help="Run as server or client"
+        "--mode",
+        choices=["server", "client", "bench"],
+        help="Run as server or client, or run the streaming benchmark locally",
     )
     parser.add_argument("--ip", help="Server IP address (for client mode)")
     parser.add_argument(
         "--port", type=int, default=8765, help="Port number (default: 8765)"
     )
+    parser.add_argument(
+        "--encoders",
+        type=int,
+        default=4,
+        help="Encoder workers for the pipelined streamer (default: 4)",
+    )
+    parser.add_argument(
+        "--encoder-kind",
+        choices=["thread", "process"],
+        default="thread",
+        help="Run pipelined encoders as threads or processes (default: thread)",
+    )
+    parser.add_argument(
+        "--source",
+        default="screen",
+        help="Frame source: screen, synthetic:noise, synthetic:gradient, "
+        "synthetic:text or video:<path> (default: screen)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed for synthetic frames (default: 0)"
+    )
+    parser.add_argument(
+        "--frames",
+        type=int,
+        default=1000,
+        help="Frames per resolution in benchmarks (default: 1000)",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=list(ENCODERS),
+        default="jpeg",
+        help="Frame encoding of the sequential streamer: full JPEGs, or only the "
+        "changed tiles with periodic keyframes (default: jpeg)",
+    )
+    parser.add_argument(
+        "--decode",
+        action="store_true",
+        help="Client: decode received frames into a frame buffer",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        default=0,
+        help="Client: decode frames on this many worker threads, off the socket "
+        "thread, and report capture to decoded latency (default: 0, off)",
+    )
+    parser.add_argument(
+        "--history",
+        type=int,
+        default=0,
+        help="Client: keep this many decoded frames before the latest one "
+        "(default: 0)",
+    )
+    parser.add_argument(
+        "--results", help="Append benchmark results as json lines to this file"
+    )
+    parser.add_argument(
+        "--latency-budget",
+        type=float,
+        default=100.0,
+        help="Round trip latency the adaptive stream aims to stay under, in ms "
+        "(default: 100)",
+    )
+    parser.add_argument(
+        "--server-kind",
+        choices=["thread", "async"],
+        default="thread",
+        help="Server: a thread per client running the benchmarks, or one asyncio "
+        "loop broadcasting a shared stream to subscribed clients (default: thread)",
+    )
+    parser.add_argument(
+        "--broadcast-size",
+        default="1280x720",
+        help="Async server: resolution of the shared stream (default: 1280x720)",
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        default=30,
+        help="Async server: frame rate of the shared stream (default: 30)",
+    )
+    parser.add_argument(
+        "--control-log",
+        help="Save the adaptive controller's decisions as a csv time series",
+    )
     args = parser.parse_args()
 
     if not args.mode:
-        args.mode = input("Choose mode (server/client): ").lower()
+        args.mode = input("Choose mode (server/client/bench): ").lower()
+
+    if args.mode == "bench":
+        run_headless_benchmark(
+            make_frame_source(args.source, seed=args.seed),
+            RESOLUTIONS,
+            args.frames,
+            args.encoders,
+            args.encoder_kind,
+            codec=args.codec,
+            results_path=args.results,
+        )
+        return
 
     local_ip = Node.get_local_ip()
     print(f"Local IP: {local_ip}")
 
     if args.mode == "server":
-        node = Server(host="0.0.0.0", port=args.port)
+        node = Server(
+            host="0.0.0.0",
+            port=args.port,
+            encoders=args.encoders,
+            encoder_kind=args.encoder_kind,
+            source=make_frame_source(args.source, seed=args.seed),
+            frame_count=args.frames,
+            codec=args.codec,
+            latency_budget_ms=args.latency_budget,
+            control_log=args.control_log,
+            server_kind=args.server_kind,
+            broadcast_size=tuple(int(v) for v in args.broadcast_size.split("x")),
+            broadcast_fps=args.fps,
+        )
     else:
         if not args.ip:
             args.ip = input("Enter server IP address: ")
-        node = Client(server_ip=args.ip, port=args.port)
+        node = Client(
+            server_ip=args.ip,
+            port=args.port,
+            decode=args.decode,
+            decode_workers=args.decode_workers,
+            history=args.history,
+        )
 
     node.start()
 
@@ -0,0 +1,194 @@
+import time
+import argparse
+import threading
+
+from pynput import mouse, keyboard
+
+from frame_pipeline import FramePipeline, format_stats
+from frame_protocol import CODEC_JPEG
+from frame_sources import make_frame_source
+from input_protocol import (
+    BATCH_HEADER,
+    FLAG_PRESSED,
+    INPUT_KEY,
+    INPUT_MOUSE_CLICK,
+    INPUT_MOUSE_MOVE,
+    INPUT_MOUSE_SCROLL,
+    InputSender,
+    button_code,
+    key_code,
+)
+from session_dataset import SessionWriter
+
+# Frames and events are both stamped with this clock
+CLOCK = time.monotonic_ns
+
+
+class SessionRecorder:
+    """
+    Records frames and input events into one session directory (see
+    session_dataset.py). Frames go through the s7 capture / encode pipeline, input
+    events through the same non-blocking InputSender as the s6 client, with the
+    session file in place of the socket.
+    """
+
+    def __init__(self, path, source, width, height, fps=30, encoders=2, quality=70):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.encoders = encoders
+        self.quality = quality
+        self.writer = SessionWriter(
+            path,
+            meta={
+                "start_ns": CLOCK(),
+                "start_wall_ns": time.time_ns(),
+                "width": width,
+                "height": height,
+                "fps": fps,
+                "codec": "jpeg",
+                "quality": quality,
+                "source": source.name,
+            },
+        )
+        self.sender = InputSender(
+            lambda batch: self.writer.write_events(batch[BATCH_HEADER.size :]),
+            clock=CLOCK,
+        )
+        self.mouse_listener = mouse.Listener(
+            on_move=self._on_mouse_move,
+            on_click=self._on_mouse_click,
+            on_scroll=self._on_mouse_scroll,
+        )
+        self.keyboard_listener = keyboard.Listener(
+            on_press=self._on_keyboard_press,
+            on_release=self._on_keyboard_release,
+        )
+
+    def _write_frame(self, frame_id, capture_ns, size, data):
+        return self.writer.write_frame(
+            frame_id, capture_ns, CODEC_JPEG, size[0], size[1], data
+        )
+
+    def record(self, duration):
+        self.source.prepare(self.width, self.height)
+        pipeline = FramePipeline(
+            capture=lambda: self.source.grab(self.width, self.height),
+            send=self._write_frame,
+            encoders=self.encoders,
+            quality=self.quality,
+            clock=CLOCK,
+            fps=self.fps,
+        )
+        result = {}
+
+        def run():
+            try:
+                result["stats"] = pipeline.run(int(duration * self.fps))
+            except Exception as e:
+                result["error"] = e
+
+        # Frames are captured on their own thread so Ctrl+C can stop the pipeline
+        # and wait for it before the session is closed
+        capture_thread = threading.Thread(target=run, daemon=True)
+        self.mouse_listener.start()
+        self.keyboard_listener.start()
+        try:
+            capture_thread.start()
+            while capture_thread.is_alive():
+                capture_thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            print("Stopped")
+            pipeline.stop()
+            capture_thread.join()
+        finally:
+            self.mouse_listener.stop()
+            self.keyboard_listener.stop()
+            self.sender.close()
+            self.writer.close()
+        if "error" in result:
+            print(f"Frame capture failed: {result['error']}")
+        elif "stats" in result:
+            print(format_stats(result["stats"]))
+        print(
+            f"Recorded {self.writer.frame_count} frames and "
+            f"{self.writer.event_count} input events to {self.writer.path}"
+        )
+        print(self.sender.summary())
+
+    def _on_mouse_move(self, x, y):
+        self.sender.add(INPUT_MOUSE_MOVE, int(x), int(y))
+
+    def _on_mouse_click(self, x, y, button, pressed):
+        self.sender.add(
+            INPUT_MOUSE_CLICK,
+            int(x),
+            int(y),
+            code=button_code(button),
+            flags=FLAG_PRESSED if pressed else 0,
+        )
+
+    def _on_mouse_scroll(self, x, y, dx, dy):
+        self.sender.add(INPUT_MOUSE_SCROLL, int(x), int(y), dx=int(dx), dy=int(dy))
+
+    def _on_keyboard_press(self, key):
+        code, flags = key_code(key)
+        self.sender.add(INPUT_KEY, code=code, flags=flags | FLAG_PRESSED)
+
+    def _on_keyboard_release(self, key):
+        code, flags = key_code(key)
+        self.sender.add(INPUT_KEY, code=code, flags=flags)
+
+
+def main():
+    """
+    Record the screen and your mouse / keyboard into one session directory:
+        python s8_record_session.py recording --fps 30 --duration 60
+
+    Stop early with Ctrl+C. Read it back with session_dataset.Session.
+    """
+    parser = argparse.ArgumentParser(
+        description="Record frames and input events on one clock"
+    )
+    parser.add_argument("output", help="Session directory to write")
+    parser.add_argument(
+        "--source",
+        default="screen",
+        help="Frame source, see frame_sources.py (default: screen)",
+    )
+    parser.add_argument(
+        "--size", default="1280x720", help="Captured frame size (default: 1280x720)"
+    )
+    parser.add_argument(
+        "--fps", type=int, default=30, help="Frames per second (default: 30)"
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=60.0,
+        help="Seconds to record (default: 60)",
+    )
+    parser.add_argument(
+        "--quality", type=int, default=70, help="JPEG quality (default: 70)"
+    )
+    parser.add_argument(
+        "--encoders", type=int, default=2, help="Encoder threads (default: 2)"
+    )
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    recorder = SessionRecorder(
+        args.output,
+        make_frame_source(args.source),
+        width,
+        height,
+        fps=args.fps,
+        encoders=args.encoders,
+        quality=args.quality,
+    )
+    recorder.record(args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+from tqdm import tqdm
+
+from event_log import read_events
+from session_dataset import META_FILE, Session
+from training_samples import ShardWriter, events_to_steps
+
+
+def load_recording(path: str):
+    """Returns (events DataFrame, frame capture times in ns or None)."""
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE)):
+        session = Session(path)
+        return session.events_dataframe(), np.asarray(session.frame_times)
+    return read_events(path), None
+
+
+def export_samples(
+    inputs, output_dir: str, bin_size: int = 16, shard_steps: int = 1_000_000
+) -> int:
+    """Export every recording in `inputs` into shards, returns the number of steps."""
+    writer = ShardWriter(output_dir, bin_size=bin_size, shard_steps=shard_steps)
+    total = 0
+    try:
+        for path in tqdm(inputs, desc="Exporting sessions"):
+            df, frame_times = load_recording(path)
+            steps = events_to_steps(df, bin_size, frame_times)
+            writer.add_session(path, steps, events=len(df))
+            total += len(steps)
+    finally:
+        writer.close()
+    return total
+
+
+def main():
+    """
+    Turn recordings into dense per-bin training steps:
+        python s9_export_training_samples.py <samples_dir> rec1.csv rec2.evlog session_dir ...
+
+    Inputs can be recorded csv / event log files (raw or down sampled by s4) or s8
+    session directories. Read the result with training_samples.SampleShards.
+    """
+    parser = argparse.ArgumentParser(
+        description="Export recordings as memory-mappable training steps"
+    )
+    parser.add_argument("output", help="Directory for the shards and index.json")
+    parser.add_argument("inputs", nargs="+", help="Recordings or s8 session directories")
+    parser.add_argument(
+        "--bin-size",
+        type=int,
+        default=16,
+        help="Step length in milliseconds (default: 16, roughly 60 FPS)",
+    )
+    parser.add_argument(
+        "--shard-steps",
+        type=int,
+        default=1_000_000,
+        help="Start a new shard after about this many steps (default: 1000000)",
+    )
+    args = parser.parse_args()
+
+    missing = [p for p in args.inputs if not os.path.exists(p)]
+    if missing:
+        print(f"Input not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    total = export_samples(args.inputs, args.output, args.bin_size, args.shard_steps)
+    print(f"Exported {total} steps from {len(args.inputs)} recordings to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
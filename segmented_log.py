@@ -0,0 +1,468 @@
+"""
+Segmented, crash safe recordings.
+
+Instead of one growing file, SegmentedEventWriter writes a directory of segments:
+
+    segment_00000.csv    a complete recording on its own, csv or (compressed) event log
+    segment_00001.csv
+    ...
+    index.jsonl          one line per sealed segment
+
+A segment is rolled over once it reaches `max_bytes` or has been open for
+`max_seconds`. Rolling over seals it: the file is flushed and fsynced, then its
+entry (file name, rows, byte size, first / last event time and the crc32 of the
+file) is appended to index.jsonl. Every index line carries a crc32 of its own, so
+a line torn by a crash is detected and ignored. Between rollovers the open
+segment is fsynced every `sync_interval` seconds. A compressed (.evlogz) segment
+writes a block when it is full and at every sync, so a crash loses at most the
+events since the last sync either way.
+
+Segments stay plain csv / event log files so s4 and s5 can read any of them; the
+entry in the index is the segment's checksummed footer. After a crash the last
+segment is unsealed and may end in a partial record (or block, for .evlogz);
+`recover` truncates it to its last valid record and seals it (and re-seals
+segments whose index line was lost).
+
+SegmentedRecording reads a segment directory, verifies checksums and hands out
+segments one at a time, from any segment on, or to a process pool:
+
+    recording = SegmentedRecording("recording_20250101_120000_segments")
+    for i, df in recording.iter_segments(start=3):
+        ...
+    rows = recording.map(len, workers=4)
+
+event_log.read_events / iter_event_chunks accept a segment directory too.
+
+Only the standard library is needed to write and recover, this runs inside OBS'
+python.
+"""
+
+import glob
+import json
+import os
+import struct
+import time
+import zlib
+
+from event_log import (
+    COLUMNS,
+    COMPRESSED_LOG_EXTENSION,
+    EVENT_LOG_EXTENSION,
+    HEADER_SIZE,
+    RECORD_SIZE,
+    is_compressed_log,
+    is_event_log,
+)
+
+INDEX_FILE = "index.jsonl"
+SEGMENT_PREFIX = "segment_"
+_TIME = COLUMNS.index("time")
+# Time is the first field of an event log record
+_RECORD_TIME = struct.Struct("<d")
+
+
+def segment_name(number: int, extension: str) -> str:
+    return f"{SEGMENT_PREFIX}{number:05d}{extension}"
+
+
+def file_crc32(path: str, block_size: int = 1 << 20) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def _is_log(path: str) -> bool:
+    return path.endswith(EVENT_LOG_EXTENSION) or is_event_log(path)
+
+
+def _is_compressed(path: str) -> bool:
+    return path.endswith(COMPRESSED_LOG_EXTENSION) or is_compressed_log(path)
+
+
+def _fsync_file(path: str):
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path: str):
+    # Makes new directory entries durable, not available on Windows
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def read_index(path: str):
+    """Valid entries of a segment directory's index, in segment order."""
+    entries = []
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return entries
+    with open(index_path, "rb") as f:
+        for line in f:
+            try:
+                wrapper = json.loads(line)
+                entry = wrapper["entry"]
+                raw = json.dumps(entry, sort_keys=True).encode()
+                if zlib.crc32(raw) != wrapper["crc"]:
+                    raise ValueError("crc mismatch")
+            except (ValueError, KeyError, TypeError):
+                # A torn or corrupt line, the segments after it get re-sealed
+                break
+            entries.append(entry)
+    return entries
+
+
+def _index_line(entry: dict) -> str:
+    raw = json.dumps(entry, sort_keys=True)
+    return json.dumps({"entry": entry, "crc": zlib.crc32(raw.encode())}) + "\n"
+
+
+def append_index(path: str, entry: dict):
+    with open(os.path.join(path, INDEX_FILE), "a") as f:
+        f.write(_index_line(entry))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _valid_length(path: str) -> int:
+    """Bytes of `path` up to and including its last complete record."""
+    size = os.path.getsize(path)
+    if _is_compressed(path):
+        if size < HEADER_SIZE:
+            return 0
+        from compressed_log import scan_compressed_log
+
+        return scan_compressed_log(path)[0]
+    if _is_log(path):
+        if size < HEADER_SIZE:
+            return 0
+        return HEADER_SIZE + (size - HEADER_SIZE) // RECORD_SIZE * RECORD_SIZE
+    # csv, the last complete line ends with a newline
+    with open(path, "rb") as f:
+        position = size
+        while position > 0:
+            step = min(1 << 16, position)
+            f.seek(position - step)
+            block = f.read(step)
+            end = block.rfind(b"\n")
+            if end >= 0:
+                return position - step + end + 1
+            position -= step
+    return 0
+
+
+def _scan_segment(path: str):
+    """(rows, first time, last time) of a complete segment file."""
+    if _is_compressed(path):
+        if os.path.getsize(path) < HEADER_SIZE:
+            return 0, None, None
+        from compressed_log import scan_compressed_log
+
+        return scan_compressed_log(path)[1:]
+    if _is_log(path):
+        rows = max(0, os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+        if rows == 0:
+            return 0, None, None
+        with open(path, "rb") as f:
+            f.seek(HEADER_SIZE)
+            first = _RECORD_TIME.unpack(f.read(_RECORD_TIME.size))[0]
+            f.seek(HEADER_SIZE + (rows - 1) * RECORD_SIZE)
+            last = _RECORD_TIME.unpack(f.read(_RECORD_TIME.size))[0]
+        return rows, first, last
+    rows, first, last = 0, None, None
+    with open(path, "rb") as f:
+        next(f, None)  # header
+        for line in f:
+            value = line.split(b",", 1)[0]
+            rows += 1
+            try:
+                t = float(value)
+            except ValueError:
+                continue
+            if first is None:
+                first = t
+            last = t
+    return rows, first, last
+
+
+def seal_segment(path, file_name, number, rows=None, first=None, last=None):
+    """Checksum a complete segment file and append its index entry."""
+    segment_path = os.path.join(path, file_name)
+    if rows is None:
+        rows, first, last = _scan_segment(segment_path)
+    entry = {
+        "segment": number,
+        "file": file_name,
+        "rows": rows,
+        "bytes": os.path.getsize(segment_path),
+        "t_first": first,
+        "t_last": last,
+        "crc32": file_crc32(segment_path),
+    }
+    append_index(path, entry)
+    return entry
+
+
+def segment_files(path: str):
+    return sorted(glob.glob(os.path.join(path, SEGMENT_PREFIX + "*")))
+
+
+def recover(path: str):
+    """
+    Make a segment directory consistent after a crash: drop index lines after a
+    torn one, truncate unsealed segments to their last valid record and seal them.
+    Returns the list of (file name, bytes dropped) for the segments it sealed.
+    """
+    entries = read_index(path)
+    index_path = os.path.join(path, INDEX_FILE)
+    if os.path.exists(index_path):
+        with open(index_path, "rb") as f:
+            lines = sum(1 for _ in f)
+        if lines > len(entries):
+            # Keep only the valid lines, written aside and swapped in atomically
+            with open(index_path + ".tmp", "w") as f:
+                f.writelines(_index_line(entry) for entry in entries)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(index_path + ".tmp", index_path)
+
+    sealed = {entry["file"] for entry in entries}
+    recovered = []
+    for segment_path in segment_files(path):
+        file_name = os.path.basename(segment_path)
+        if file_name in sealed:
+            continue
+        size = os.path.getsize(segment_path)
+        valid = _valid_length(segment_path)
+        if valid < size:
+            with open(segment_path, "r+b") as f:
+                f.truncate(valid)
+                os.fsync(f.fileno())
+        number = int(file_name[len(SEGMENT_PREFIX) :].split(".")[0])
+        seal_segment(path, file_name, number)
+        recovered.append((file_name, size - valid))
+    return recovered
+
+
+class SegmentedEventWriter:
+    """
+    Drop-in replacement for EventWriter / EventLogWriter that writes a segment
+    directory, see the module docstring. `make_writer(path)` opens the writer of
+    one segment, e.g. an EventWriter; the segments' extension picks the format.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        make_writer,
+        extension: str = ".csv",
+        max_bytes: int = 64 * 1024 * 1024,
+        max_seconds: float = 600.0,
+        sync_interval: float = 1.0,
+        decoder=None,
+        check_every: int = 256,
+    ):
+        if decoder is None:
+            from event_decoders import make_decoder
+
+            decoder = make_decoder()
+        self.decoder = decoder
+        self.path = path
+        self.make_writer = make_writer
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.sync_interval = sync_interval
+        self.check_every = check_every
+        self.auto_flush = True
+
+        os.makedirs(path, exist_ok=True)
+        # Resuming a directory, first seal whatever a crash left behind
+        recover(path)
+        existing = [entry["segment"] for entry in read_index(path)]
+        self.number = max(existing) + 1 if existing else 0
+        self.segments = len(existing)
+        self.rows = 0
+        self._writer = None
+        self._open_segment()
+
+    def _open_segment(self):
+        self._file_name = segment_name(self.number, self.extension)
+        self._writer = self.make_writer(os.path.join(self.path, self._file_name))
+        self._writer.auto_flush = False
+        _fsync_dir(self.path)
+        self._opened = time.monotonic()
+        self._last_sync = self._opened
+        self._segment_rows = 0
+        self._first = None
+        self._last = None
+        self._since_check = 0
+
+    def _seal(self):
+        self._writer.flush()
+        self._sync()
+        self._writer.close()
+        seal_segment(
+            self.path,
+            self._file_name,
+            self.number,
+            self._segment_rows,
+            self._first,
+            self._last,
+        )
+        self.segments += 1
+        self.number += 1
+        self._writer = None
+
+    def _sync(self):
+        _fsync_file(os.path.join(self.path, self._file_name))
+        self._last_sync = time.monotonic()
+
+    def _check(self):
+        self._since_check = 0
+        now = time.monotonic()
+        if now - self._last_sync >= self.sync_interval:
+            # Also cuts a compressed log's block being filled, so the sync persists
+            # every event written so far
+            self._writer.flush()
+            self._sync()
+        else:
+            # Between syncs a compressed log's blocks are only cut when full
+            getattr(self._writer, "flush_file", self._writer.flush)()
+        size = os.path.getsize(os.path.join(self.path, self._file_name))
+        expired = self.max_seconds and now - self._opened >= self.max_seconds
+        if (self.max_bytes and size >= self.max_bytes) or expired:
+            # The next segment is opened by the next event, so closing right
+            # after a rollover leaves no empty segment
+            self._seal()
+
+    def write_record(self, record):
+        if self._writer is None:
+            self._open_segment()
+        self._writer.write_record(record)
+        t = record[_TIME]
+        if self._first is None:
+            self._first = t
+        self._last = t
+        self._segment_rows += 1
+        self.rows += 1
+        self._since_check += 1
+        if self.auto_flush or self._since_check >= self.check_every:
+            self._check()
+
+    def write(self, event_json: str):
+        try:
+            self.write_record(self.decoder.decode(event_json))
+        except ValueError as e:
+            print(f"Error parsing JSON: {e}")
+        except Exception as e:
+            print(f"Error writing event: {e}")
+
+    def flush(self):
+        if self._writer:
+            self._check()
+
+    def close(self):
+        if self._writer:
+            self._seal()
+
+
+class SegmentedRecording:
+    """Read side of a segment directory, see the module docstring."""
+
+    def __init__(self, path: str):
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No segment directory at '{path}'")
+        self.path = path
+        self.entries = read_index(path)
+        sealed = {entry["file"] for entry in self.entries}
+        # Segments a crash left unsealed, read up to their last valid record
+        self.unsealed = [
+            os.path.basename(p)
+            for p in segment_files(path)
+            if os.path.basename(p) not in sealed
+        ]
+
+    @property
+    def files(self):
+        return [entry["file"] for entry in self.entries] + self.unsealed
+
+    def __len__(self):
+        return len(self.files)
+
+    def segment_path(self, i: int) -> str:
+        return os.path.join(self.path, self.files[i])
+
+    def verify(self):
+        """List of (file name, problem) for sealed segments that do not match."""
+        problems = []
+        for entry in self.entries:
+            path = os.path.join(self.path, entry["file"])
+            if not os.path.exists(path):
+                problems.append((entry["file"], "missing"))
+            elif os.path.getsize(path) != entry["bytes"]:
+                problems.append((entry["file"], "size changed"))
+            elif file_crc32(path) != entry["crc32"]:
+                problems.append((entry["file"], "crc32 mismatch"))
+        return problems
+
+    def read_segment(self, i: int):
+        return read_segment_file(self.segment_path(i))
+
+    def iter_segments(self, start: int = 0):
+        """Yield (segment number, DataFrame) from segment `start` on."""
+        for i in range(start, len(self)):
+            yield i, self.read_segment(i)
+
+    def map(self, fn, workers=None, start: int = 0):
+        """
+        fn(DataFrame) for every segment from `start` on, on a process pool.
+        `fn` must be picklable (a module level function). Results in segment order.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        paths = [self.segment_path(i) for i in range(start, len(self))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_apply, [fn] * len(paths), paths))
+
+    def read_all(self):
+        import pandas as pd
+
+        frames = [df for _, df in self.iter_segments()]
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+
+def read_segment_file(path: str):
+    """One segment as a DataFrame, ignoring a partial trailing record."""
+    import io
+
+    import pandas as pd
+
+    from event_log import read_events
+
+    valid = _valid_length(path)
+    if _is_log(path) or _is_compressed(path):
+        if valid == 0:
+            return pd.DataFrame(columns=COLUMNS)
+        # The event log reader already drops a partial trailing record
+        return read_events(path)
+    with open(path, "rb") as f:
+        data = f.read(valid)
+    if not data:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.read_csv(io.BytesIO(data))
+
+
+def _apply(fn, path):
+    return fn(read_segment_file(path))
+
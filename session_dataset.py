@@ -0,0 +1,191 @@
+"""
+Recorded sessions of frames and input events on one monotonic clock.
+
+A session is a directory written by s8_record_session.py:
+
+    meta.json     clock, start times, frame size, fps, codec
+    frames.bin    encoded frames (JPEG), back to back
+    frames.idx    one FRAME_DTYPE record per frame: capture time, offset and size
+                  of its bytes in frames.bin
+    events.bin    one INPUT_DTYPE record per input event (see input_protocol.py)
+
+Frame capture times and event times both come from time.monotonic_ns, so they
+can be compared directly; `start_wall_ns` / `start_ns` in meta.json convert them
+to wall clock time. Frames are full JPEGs so any frame decodes on its own.
+
+Session memory-maps the index and the events. Joining a frame to its actions is
+a binary search over the sorted times:
+
+    session = Session("recording")
+    for i in range(session.frame_count):
+        image = session.read_frame(i)
+        actions = session.actions_for_frame(i)  # events until the next frame
+"""
+
+import io
+import json
+import os
+
+import numpy as np
+
+from input_protocol import INPUT_DTYPE, events_to_dataframe
+
+SESSION_VERSION = 1
+CLOCK = "monotonic_ns"
+
+FRAME_DTYPE = np.dtype(
+    [
+        ("frame_id", "<u4"),
+        ("codec", "u1"),
+        ("reserved", "u1"),
+        ("width", "<u2"),
+        ("height", "<u2"),
+        ("reserved2", "<u2"),
+        ("size", "<u4"),
+        ("t_ns", "<i8"),
+        ("offset", "<u8"),
+    ]
+)
+
+META_FILE = "meta.json"
+FRAMES_FILE = "frames.bin"
+FRAME_INDEX_FILE = "frames.idx"
+EVENTS_FILE = "events.bin"
+
+
+class SessionWriter:
+    """
+    Appends frames and input events to a session directory.
+
+    `write_frame` and `write_events` may be called from different threads, they
+    write to different files.
+    """
+
+    def __init__(self, path, meta=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.meta = {"version": SESSION_VERSION, "clock": CLOCK}
+        self.meta.update(meta or {})
+        self._frames = open(os.path.join(path, FRAMES_FILE), "wb")
+        self._index = open(os.path.join(path, FRAME_INDEX_FILE), "wb")
+        self._events = open(os.path.join(path, EVENTS_FILE), "wb")
+        self._offset = 0
+        self._record = np.zeros(1, dtype=FRAME_DTYPE)
+        self.frame_count = 0
+        self.event_count = 0
+        self.write_meta()
+
+    def write_meta(self):
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+    def write_frame(self, frame_id, t_ns, codec, width, height, data):
+        size = len(data)
+        self._frames.write(data)
+        record = self._record[0]
+        record["frame_id"] = frame_id
+        record["codec"] = codec
+        record["width"] = width
+        record["height"] = height
+        record["size"] = size
+        record["t_ns"] = t_ns
+        record["offset"] = self._offset
+        self._index.write(self._record.tobytes())
+        self._offset += size
+        self.frame_count += 1
+        return size
+
+    def write_events(self, records: bytes):
+        """Append packed INPUT_RECORDs, e.g. a batch from input_protocol.InputSender."""
+        self._events.write(records)
+        self.event_count += len(records) // INPUT_DTYPE.itemsize
+
+    def flush(self):
+        for f in (self._frames, self._index, self._events):
+            f.flush()
+
+    def close(self):
+        self.meta["frame_count"] = self.frame_count
+        self.meta["event_count"] = self.event_count
+        self.write_meta()
+        for f in (self._frames, self._index, self._events):
+            f.close()
+
+
+def _map(path, dtype):
+    # np.memmap refuses empty files
+    if os.path.getsize(path) < dtype.itemsize:
+        return np.zeros(0, dtype=dtype)
+    count = os.path.getsize(path) // dtype.itemsize
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+class Session:
+    """Read side of a session directory, see the module docstring."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != SESSION_VERSION:
+            raise ValueError(
+                f"Unsupported session version {self.meta.get('version')}"
+            )
+        self.frames = _map(os.path.join(path, FRAME_INDEX_FILE), FRAME_DTYPE)
+        self.events = _map(os.path.join(path, EVENTS_FILE), INPUT_DTYPE)
+        # Mouse and keyboard listeners run on separate threads, their events can
+        # land a few microseconds out of order
+        if len(self.events) and np.any(np.diff(self.events["time_ns"]) < 0):
+            order = np.argsort(self.events["time_ns"], kind="stable")
+            self.events = self.events[order]
+        self.frame_times = np.asarray(self.frames["t_ns"])
+        self.event_times = np.asarray(self.events["time_ns"])
+        self._data = None
+
+    @property
+    def frame_count(self):
+        return len(self.frames)
+
+    def frame_bytes(self, i):
+        if self._data is None:
+            self._data = _map(os.path.join(self.path, FRAMES_FILE), np.dtype("u1"))
+        record = self.frames[i]
+        start = int(record["offset"])
+        return self._data[start : start + int(record["size"])]
+
+    def read_frame(self, i):
+        """Decode frame `i` into a (height, width, 3) uint8 array."""
+        from PIL import Image
+
+        img = Image.open(io.BytesIO(self.frame_bytes(i).tobytes()))
+        return np.asarray(img.convert("RGB"))
+
+    def frame_at(self, t_ns):
+        """Index of the last frame captured at or before `t_ns`, -1 if none."""
+        return int(np.searchsorted(self.frame_times, t_ns, side="right")) - 1
+
+    def events_between(self, start_ns, end_ns):
+        """Events with start_ns <= time_ns < end_ns."""
+        lo, hi = np.searchsorted(self.event_times, [start_ns, end_ns])
+        return self.events[lo:hi]
+
+    def actions_for_frame(self, i):
+        """
+        Events from frame `i`'s capture until the next frame's, what was done
+        while frame `i` was the latest observation.
+        """
+        start = self.frame_times[i]
+        end = np.iinfo(np.int64).max
+        if i + 1 < len(self.frames):
+            end = self.frame_times[i + 1]
+        return self.events_between(start, end)
+
+    def events_dataframe(self):
+        """
+        Events as a DataFrame with the recorded csv columns, `time` in ms on the
+        session clock, ready for s4's down sampling.
+        """
+        return events_to_dataframe(self.events)
+
+    def to_wall_ns(self, t_ns):
+        return t_ns - self.meta["start_ns"] + self.meta["start_wall_ns"]
@@ -0,0 +1,52 @@
+"""Synthetic recordings shared by the tests."""
+
+import numpy as np
+import pandas as pd
+
+from event_log import COLUMNS
+
+EVENT_TYPES = [
+    "mouse_moved",
+    "mouse_dragged",
+    "mouse_clicked",
+    "mouse_pressed",
+    "mouse_released",
+    "key_pressed",
+    "key_released",
+    "key_typed",
+    "mouse_wheel",
+]
+
+
+def synthetic_recording(n_events=3000, seed=0):
+    """
+    Random events on a coarse clock so many share a time and a bin. Keys and
+    buttons come from a small set so presses repeat and keys stay held across
+    bins, and some presses / releases have no key ID at all.
+    """
+    rng = np.random.default_rng(seed)
+    time = np.sort(rng.integers(0, n_events * 2, n_events)).astype(float)
+    event_type = rng.choice(EVENT_TYPES, n_events)
+    is_key = np.char.startswith(event_type.astype(str), "key")
+    is_button = np.isin(event_type, ["mouse_pressed", "mouse_released"])
+    missing = rng.random(n_events) < 0.05
+
+    df = pd.DataFrame({column: np.nan for column in COLUMNS}, index=range(n_events))
+    df["time"] = time
+    df["event_source"] = "local"
+    df["event_type"] = event_type
+    df["x"] = rng.integers(0, 1920, n_events).astype(float)
+    df["y"] = rng.integers(0, 1080, n_events).astype(float)
+    df["keycode"] = np.where(is_key & ~missing, rng.integers(1, 6, n_events), np.nan)
+    df["button"] = np.where(is_button & ~missing, rng.integers(1, 4, n_events), np.nan)
+    df["mask"] = 0.0
+    return df[COLUMNS]
+
+
+def row_multiset(df):
+    df = df[COLUMNS].reset_index(drop=True)
+    for column in df.columns:
+        if column not in ("event_source", "event_type", "char"):
+            df[column] = pd.to_numeric(df[column]).astype(float)
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False)
+    return sorted(map(tuple, rows), key=repr)
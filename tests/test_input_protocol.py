@@ -0,0 +1,51 @@
+from input_protocol import (
+    FLAG_PRESSED,
+    FLAG_UNMAPPED,
+    INPUT_KEY,
+    INPUT_RECORD,
+    decode_batch,
+    events_to_dataframe,
+    pack_batch,
+)
+from s4_data_post_processing import (
+    bin_and_filter_events,
+    bin_and_filter_events_vectorized,
+    preprocess_events,
+)
+
+
+def unmapped_key_batch(keys):
+    """A decoded batch of (time ms, vk, pressed) key events outside KEY_NAMES."""
+    records = b"".join(
+        INPUT_RECORD.pack(
+            t * 1_000_000,
+            0,
+            0,
+            vk,
+            0,
+            0,
+            INPUT_KEY,
+            FLAG_UNMAPPED | (FLAG_PRESSED if pressed else 0),
+        )
+        for t, vk, pressed in keys
+    )
+    return decode_batch(pack_batch(records, len(keys)))
+
+
+def test_unmapped_keys_survive_s4():
+    # Two different unmapped keys held together, e.g. media keys
+    events = unmapped_key_batch(
+        [(0, 0xB3, True), (20, 0xAF, True), (40, 0xB3, False), (60, 0xAF, False)]
+    )
+    df = events_to_dataframe(events)
+    assert df["keycode"].nunique() == 2
+    assert list(df["rawcode"]) == [0xB3, 0xAF, 0xB3, 0xAF]
+
+    for engine in (bin_and_filter_events, bin_and_filter_events_vectorized):
+        filtered = engine(preprocess_events(df.copy()), 16)
+        assert list(filtered["event_type"]) == [
+            "key_pressed",
+            "key_pressed",
+            "key_released",
+            "key_released",
+        ]
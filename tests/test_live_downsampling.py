@@ -0,0 +1,82 @@
+import json
+
+import pandas as pd
+import pytest
+
+from event_decoders import DECODERS, available_decoders, make_decoder
+from event_log import COLUMNS
+from live_downsampling import DownsamplingWriter
+from recordings import row_multiset, synthetic_recording
+from s4_data_post_processing import bin_and_filter_events_vectorized, preprocess_events
+
+
+class RecordWriter:
+    """Stands in for EventWriter / EventLogWriter, keeps the records it is given."""
+
+    def __init__(self):
+        self.records = []
+        self.auto_flush = True
+
+    def write_record(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ReusingDecoder:
+    """A decoder that returns the same list every call, overwritten each time."""
+
+    def __init__(self):
+        self.decoder = make_decoder("json")
+        self.record = [None] * len(COLUMNS)
+
+    def decode(self, message):
+        self.record[:] = self.decoder.decode(message)
+        return self.record
+
+
+def to_messages(df):
+    messages = []
+    for row in df.itertuples(index=False):
+        event = {}
+        for column, value in zip(COLUMNS, row):
+            if isinstance(value, float):
+                if value != value:
+                    continue
+                if value.is_integer():
+                    value = int(value)
+            event[column] = value
+        messages.append(json.dumps(event))
+    return messages
+
+
+def downsample_live(messages, decoder, bin_size):
+    raw, downsampled = RecordWriter(), RecordWriter()
+    writer = DownsamplingWriter(raw, downsampled, bin_size, decoder=decoder)
+    for message in messages:
+        writer.write(message)
+    writer.close()
+    return pd.DataFrame(downsampled.records, columns=COLUMNS)
+
+
+@pytest.mark.parametrize("name", list(DECODERS))
+@pytest.mark.parametrize("bin_size", [1, 16])
+def test_decoders_match_s4(name, bin_size):
+    if name not in available_decoders():
+        pytest.skip(f"{name} is not installed")
+    df = synthetic_recording(2000, seed=2)
+    live = downsample_live(to_messages(df), make_decoder(name), bin_size)
+    expected = bin_and_filter_events_vectorized(preprocess_events(df.copy()), bin_size)
+    assert len(live) == len(expected)
+    assert row_multiset(live) == row_multiset(expected)
+
+
+def test_records_reused_by_the_decoder_are_copied():
+    df = synthetic_recording(2000, seed=3)
+    live = downsample_live(to_messages(df), ReusingDecoder(), 16)
+    expected = bin_and_filter_events_vectorized(preprocess_events(df.copy()), 16)
+    assert row_multiset(live) == row_multiset(expected)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_log import COLUMNS
+from recordings import row_multiset, synthetic_recording
+from s4_data_post_processing import (
+    bin_and_filter_events,
+    bin_and_filter_events_vectorized,
+    preprocess_events,
+    stream_bin_and_filter_events,
+)
+
+
+@pytest.mark.parametrize("bin_size", [1, 16, 50])
+def test_engines_keep_the_same_rows(bin_size):
+    df = preprocess_events(synthetic_recording())
+    reference = bin_and_filter_events(df.copy(), bin_size)
+    vectorized = bin_and_filter_events_vectorized(df.copy(), bin_size)
+    assert len(reference) > 0
+    assert row_multiset(vectorized) == row_multiset(reference)
+
+
+def test_keys_held_across_bins_and_missing_key_ids():
+    rows = [
+        # key 1 held from bin 0 to bin 2, repeated presses in between are dropped
+        (0, "key_pressed", 1, None),
+        (20, "key_pressed", 1, None),
+        (40, "key_released", 1, None),
+        (41, "key_released", 1, None),
+        # presses without a key ID always pass, their releases never do
+        (50, "mouse_pressed", None, None),
+        (50, "mouse_pressed", None, None),
+        (51, "mouse_released", None, None),
+        # same time ties, a press and release of different buttons
+        (60, "mouse_pressed", None, 1),
+        (60, "mouse_pressed", None, 2),
+        (60, "mouse_released", None, 1),
+        (60, "mouse_moved", None, None),
+        (61, "mouse_moved", None, None),
+    ]
+    df = pd.DataFrame({column: np.nan for column in COLUMNS}, index=range(len(rows)))
+    df["time"] = [float(r[0]) for r in rows]
+    df["event_source"] = "local"
+    df["event_type"] = [r[1] for r in rows]
+    df["keycode"] = [np.nan if r[2] is None else float(r[2]) for r in rows]
+    df["button"] = [np.nan if r[3] is None else float(r[3]) for r in rows]
+    df["x"] = np.arange(len(rows), dtype=float)
+
+    reference = bin_and_filter_events(df.copy(), 16)
+    vectorized = bin_and_filter_events_vectorized(df.copy(), 16)
+    assert row_multiset(vectorized) == row_multiset(reference)
+    assert list(vectorized["time"]) == [0, 40, 50, 50, 60, 60, 60, 61]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100])
+def test_stream_matches_whole_file(tmp_path, chunk_size):
+    df = synthetic_recording(1000, seed=1)
+    input_csv = tmp_path / "recorded_actions.csv"
+    output_csv = tmp_path / "downsampled.csv"
+    df.to_csv(input_csv, index=False)
+
+    rows_in, rows_out = stream_bin_and_filter_events(
+        str(input_csv), str(output_csv), 16, chunk_size
+    )
+    streamed = pd.read_csv(output_csv)
+    expected = bin_and_filter_events_vectorized(preprocess_events(df.copy()), 16)
+    reference = bin_and_filter_events(preprocess_events(df.copy()), 16)
+    assert rows_out == len(streamed) == len(expected)
+    assert row_multiset(streamed) == row_multiset(expected)
+    assert row_multiset(streamed) == row_multiset(reference)
@@ -0,0 +1,292 @@
+"""
+Dense, fixed-stride training steps in memory-mappable shards.
+
+A recording (csv / event log, raw or down sampled by s4, or an s8 session) is cut
+into `bin_size` ms steps. Every step is one STEP_DTYPE record:
+
+    time_ms    i8   start of the bin
+    frame      i4   s8 sessions: last frame captured at or before time_ms, else -1
+    mouse_x/y  i4   pointer position at the end of the bin (carried forward)
+    scroll     i2   summed wheel_rotation in the bin (s4 drops wheel events, export
+                    the raw recording to keep them)
+    buttons    u1   bit b-1 set while mouse button b is held
+    keys       16B  little endian bitmask, bit i for KEY_ORDER[i] held
+
+A key or button counts as held in a bin if it is down at the end of the bin or
+was pressed during it, so a tap shorter than a bin is not lost.
+
+Steps are appended to shard files (raw records, no header) and index.json lists
+the shards and where each session's steps are, so loaders can np.memmap the
+shards and slice any session or step without copying:
+
+    samples = SampleShards("samples")
+    steps = samples.session(3)          # memmap view
+    held = samples.held_keys(steps[0])  # uiohook keycodes
+"""
+
+import json
+import os
+
+import numpy as np
+
+from uiohook_keys import KEY_NAMES
+
+SAMPLES_VERSION = 1
+INDEX_FILE = "index.json"
+
+# Bit i of `keys` is KEY_ORDER[i]
+KEY_ORDER = sorted(KEY_NAMES)
+KEY_BYTES = 16
+assert len(KEY_ORDER) <= KEY_BYTES * 8
+BUTTON_COUNT = 5
+
+STEP_DTYPE = np.dtype(
+    [
+        ("time_ms", "<i8"),
+        ("frame", "<i4"),
+        ("mouse_x", "<i4"),
+        ("mouse_y", "<i4"),
+        ("scroll", "<i2"),
+        ("buttons", "u1"),
+        ("reserved", "u1"),
+        ("keys", "u1", (KEY_BYTES,)),
+    ]
+)
+
+_KEY_COLUMN = {code: i for i, code in enumerate(KEY_ORDER)}
+
+
+def _forward_fill(values, has):
+    """Carry the last row where `has` is set forward, along axis 0."""
+    shape = (-1,) + (1,) * (has.ndim - 1)
+    idx = np.where(has, np.arange(len(has)).reshape(shape), 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    if has.ndim == 1:
+        return values[idx]
+    return np.take_along_axis(values, idx, axis=0)
+
+
+def _last_per_cell(cells):
+    """Mask of the last entry of every distinct cell, `cells` in time order."""
+    order = np.argsort(cells, kind="stable")
+    last = np.ones(len(cells), dtype=bool)
+    last[:-1] = cells[order][1:] != cells[order][:-1]
+    mask = np.zeros(len(cells), dtype=bool)
+    mask[order[last]] = True
+    return mask
+
+
+def _held(bins, columns, pressed, n_bins, n_columns):
+    """(n_bins, n_columns) bools: down at the end of the bin or pressed during it."""
+    cells = bins * n_columns + columns
+    last = _last_per_cell(cells)
+    state = np.zeros(n_bins * n_columns, dtype=bool)
+    has = np.zeros(n_bins * n_columns, dtype=bool)
+    state[cells[last]] = pressed[last]
+    has[cells[last]] = True
+    held = _forward_fill(
+        state.reshape(n_bins, n_columns), has.reshape(n_bins, n_columns)
+    )
+    held.reshape(-1)[cells[pressed]] = True
+    return held
+
+
+def events_to_steps(df, bin_size=16, frame_times_ns=None):
+    """
+    Turn an event DataFrame with the recorded csv columns into STEP_DTYPE records.
+
+    `frame_times_ns` are the capture times of an s8 session on the same clock as
+    `df["time"]` (ms), to fill in the `frame` field.
+    """
+    df = df.sort_values(by="time", kind="stable")
+    time = df["time"].to_numpy(dtype=np.int64)
+    event_type = df["event_type"].astype(str).to_numpy(dtype=str)
+    event_type = np.where(event_type == "mouse_dragged", "mouse_moved", event_type)
+
+    # The steps cover the events and, for sessions, the frames
+    bounds = [time[[0, -1]]] if len(time) else []
+    if frame_times_ns is not None and len(frame_times_ns):
+        bounds.append(np.asarray(frame_times_ns)[[0, -1]] // 1_000_000)
+    if not bounds:
+        return np.zeros(0, dtype=STEP_DTYPE)
+    first_bin = min(b[0] for b in bounds) // bin_size
+    n_bins = int(max(b[1] for b in bounds) // bin_size - first_bin + 1)
+    steps = np.zeros(n_bins, dtype=STEP_DTYPE)
+    bins = time // bin_size - first_bin
+    steps["time_ms"] = (first_bin + np.arange(n_bins)) * bin_size
+
+    # Mouse position: last move per bin, carried forward, the first move also
+    # carried back to the start
+    x = df["x"].to_numpy(dtype=np.float64)
+    y = df["y"].to_numpy(dtype=np.float64)
+    moves = np.flatnonzero((event_type == "mouse_moved") & ~np.isnan(x))
+    if len(moves):
+        moves = moves[_last_per_cell(bins[moves])]
+        mouse = np.zeros((n_bins, 2), dtype=np.int32)
+        has = np.zeros(n_bins, dtype=bool)
+        mouse[bins[moves]] = np.stack([x[moves], y[moves]], axis=1)
+        has[bins[moves]] = True
+        first = bins[moves[0]]
+        mouse[:first] = mouse[first]
+        has[:first] = True
+        mouse = _forward_fill(mouse, has)
+        steps["mouse_x"] = mouse[:, 0]
+        steps["mouse_y"] = mouse[:, 1]
+
+    wheel = np.flatnonzero(event_type == "mouse_wheel")
+    if len(wheel):
+        rotation = df["wheel_rotation"].to_numpy(dtype=np.float64)[wheel]
+        scroll = np.bincount(
+            bins[wheel], weights=np.nan_to_num(rotation), minlength=n_bins
+        )
+        steps["scroll"] = np.clip(scroll, -32768, 32767)
+
+    is_press = np.char.endswith(event_type, "_pressed")
+    is_transition = is_press | np.char.endswith(event_type, "_released")
+
+    # Keys, only the ones in KEY_NAMES
+    keycode = df["keycode"].to_numpy(dtype=np.float64)
+    key_rows = np.flatnonzero(
+        is_transition & np.char.startswith(event_type, "key_") & ~np.isnan(keycode)
+    )
+    columns = np.array(
+        [_KEY_COLUMN.get(int(c), -1) for c in keycode[key_rows]], dtype=np.int64
+    )
+    key_rows, columns = key_rows[columns >= 0], columns[columns >= 0]
+    keys = _held(bins[key_rows], columns, is_press[key_rows], n_bins, KEY_BYTES * 8)
+    steps["keys"] = np.packbits(keys, axis=1, bitorder="little")
+
+    # Mouse buttons 1..5
+    button = df["button"].to_numpy(dtype=np.float64)
+    button_rows = np.flatnonzero(
+        is_transition
+        & np.char.startswith(event_type, "mouse_")
+        & (button >= 1)
+        & (button <= BUTTON_COUNT)
+    )
+    buttons = _held(
+        bins[button_rows],
+        button[button_rows].astype(np.int64) - 1,
+        is_press[button_rows],
+        n_bins,
+        8,
+    )
+    steps["buttons"] = np.packbits(buttons, axis=1, bitorder="little")[:, 0]
+
+    steps["frame"] = -1
+    if frame_times_ns is not None:
+        starts_ns = steps["time_ms"] * 1_000_000
+        steps["frame"] = (
+            np.searchsorted(frame_times_ns, starts_ns, side="right") - 1
+        )
+    return steps
+
+
+class ShardWriter:
+    """Appends sessions of steps to shard files of about `shard_steps` steps."""
+
+    def __init__(self, path, bin_size=16, shard_steps=1_000_000):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.bin_size = bin_size
+        self.shard_steps = shard_steps
+        self.shards = []
+        self.sessions = []
+        self._file = None
+
+    def _new_shard(self):
+        if self._file:
+            self._file.close()
+        name = f"shard_{len(self.shards):05d}.bin"
+        self._file = open(os.path.join(self.path, name), "wb")
+        self.shards.append({"file": name, "steps": 0})
+
+    def add_session(self, source, steps, **meta):
+        # A session never spans shards, so it is always one contiguous slice
+        if not self.shards or (
+            self.shards[-1]["steps"]
+            and self.shards[-1]["steps"] + len(steps) > self.shard_steps
+        ):
+            self._new_shard()
+        shard = self.shards[-1]
+        self._file.write(steps.tobytes())
+        entry = {
+            "source": source,
+            "shard": len(self.shards) - 1,
+            "offset": shard["steps"],
+            "steps": len(steps),
+            "start_ms": int(steps["time_ms"][0]) if len(steps) else None,
+        }
+        entry.update(meta)
+        self.sessions.append(entry)
+        shard["steps"] += len(steps)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+        index = {
+            "version": SAMPLES_VERSION,
+            "bin_size": self.bin_size,
+            "step_dtype": STEP_DTYPE.descr,
+            "key_order": KEY_ORDER,
+            "shards": self.shards,
+            "sessions": self.sessions,
+        }
+        with open(os.path.join(self.path, INDEX_FILE), "w") as f:
+            json.dump(index, f)
+
+
+class SampleShards:
+    """Zero-copy access to exported steps, see the module docstring."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        if self.index["version"] != SAMPLES_VERSION:
+            raise ValueError(f"Unsupported samples version {self.index['version']}")
+        self.bin_size = self.index["bin_size"]
+        self.key_order = self.index["key_order"]
+        self.sessions = self.index["sessions"]
+        self._maps = [None] * len(self.index["shards"])
+        # Global step number of every session's first step
+        self._session_starts = np.cumsum([0] + [s["steps"] for s in self.sessions])
+
+    def __len__(self):
+        return int(self._session_starts[-1])
+
+    def shard(self, i):
+        if self._maps[i] is None:
+            shard = self.index["shards"][i]
+            if shard["steps"] == 0:
+                self._maps[i] = np.zeros(0, dtype=STEP_DTYPE)
+            else:
+                self._maps[i] = np.memmap(
+                    os.path.join(self.path, shard["file"]),
+                    dtype=STEP_DTYPE,
+                    mode="r",
+                    shape=(shard["steps"],),
+                )
+        return self._maps[i]
+
+    def session(self, i):
+        entry = self.sessions[i]
+        start = entry["offset"]
+        return self.shard(entry["shard"])[start : start + entry["steps"]]
+
+    def locate(self, step):
+        """(session, step within the session) of a global step number."""
+        session = int(np.searchsorted(self._session_starts, step, side="right")) - 1
+        return session, step - int(self._session_starts[session])
+
+    def __getitem__(self, step):
+        session, offset = self.locate(step)
+        return self.session(session)[offset]
+
+    def held_keys(self, step):
+        bits = np.unpackbits(step["keys"], bitorder="little")
+        return [self.key_order[i] for i in np.flatnonzero(bits[: len(self.key_order)])]
+
+    @staticmethod
+    def held_buttons(step):
+        return [b + 1 for b in range(BUTTON_COUNT) if step["buttons"] >> b & 1]
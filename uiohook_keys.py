@@ -0,0 +1,128 @@
+"""
+uiohook key codes and mouse buttons, as recorded by the input-overlay plugin.
+
+Values are the typed character, or for longer names the name of the pynput
+`keyboard.Key` / `mouse.Button`. Only the standard library is needed, keycodes.py
+maps these to pynput objects for replay.
+"""
+
+KEY_NAMES = {
+    # Special keys
+    0x002A: "shift_l",      # Left shift
+    0x0036: "shift_r",      # Right shift
+    0x001D: "ctrl_l",       # Left control
+    0x0E1D: "ctrl_r",       # Right control
+    0x0038: "alt_l",        # Left alt
+    0x0E38: "alt_r",        # Right alt
+    0x0E5B: "cmd",          # Left meta/Windows key
+    0x0E5C: "cmd_r",        # Right meta/Windows key
+    0x0E5D: "menu",         # Context/Menu key
+
+    # Letters
+    0x001E: 'a',
+    0x0030: 'b',
+    0x002E: 'c',
+    0x0020: 'd',
+    0x0012: 'e',
+    0x0021: 'f',
+    0x0022: 'g',
+    0x0023: 'h',
+    0x0017: 'i',
+    0x0024: 'j',
+    0x0025: 'k',
+    0x0026: 'l',
+    0x0032: 'm',
+    0x0031: 'n',
+    0x0018: 'o',
+    0x0019: 'p',
+    0x0010: 'q',
+    0x0013: 'r',
+    0x001F: 's',
+    0x0014: 't',
+    0x0016: 'u',
+    0x002F: 'v',
+    0x0011: 'w',
+    0x002D: 'x',
+    0x0015: 'y',
+    0x002C: 'z',
+
+    # Numbers
+    0x0002: '1',
+    0x0003: '2',
+    0x0004: '3',
+    0x0005: '4',
+    0x0006: '5',
+    0x0007: '6',
+    0x0008: '7',
+    0x0009: '8',
+    0x000A: '9',
+    0x000B: '0',
+
+    # Function keys
+    0x003B: "f1",
+    0x003C: "f2",
+    0x003D: "f3",
+    0x003E: "f4",
+    0x003F: "f5",
+    0x0040: "f6",
+    0x0041: "f7",
+    0x0042: "f8",
+    0x0043: "f9",
+    0x0044: "f10",
+    0x0057: "f11",
+    0x0058: "f12",
+    0x005B: "f13",
+    0x005C: "f14",
+    0x005D: "f15",
+    0x0063: "f16",
+    0x0064: "f17",
+    0x0065: "f18",
+    0x0066: "f19",
+    0x0067: "f20",
+    0x0068: "f21",
+    0x0069: "f22",
+    0x006A: "f23",
+    0x006B: "f24",
+
+    # Special characters and control keys
+    0x0001: "esc",
+    0x000C: '-',
+    0x000D: '=',
+    0x000E: "backspace",
+    0x000F: "tab",
+    0x003A: "caps_lock",
+    0x001A: ']',
+    0x001B: '[',
+    0x002B: '\\',
+    0x0027: ';',
+    0x0028: "'",
+    0x001C: "enter",
+    0x0033: ',',
+    0x0034: '.',
+    0x0035: '/',
+    0x0039: "space",
+
+    # Navigation and system keys
+    0x0E37: "print_screen",
+    0x0046: "scroll_lock",
+    0x0E45: "pause",
+    0x0E52: "insert",
+    0x0E53: "delete",
+    0x0E47: "home",
+    0x0E4F: "end",
+    0x0E49: "page_up",
+    0x0E51: "page_down",
+    0xE048: "up",
+    0xE04B: "left",
+    0xE04D: "right",
+    0xE050: "down",
+}
+
+
+BUTTON_NAMES = {
+    1: "left",       # Left click
+    2: "right",      # Right click
+    3: "middle",     # Middle click
+    4: "x1",        # Mouse button 4
+    5: "x2"         # Mouse button 5
+}
\ No newline at end of file